@@ -6,6 +6,11 @@ from app.models import run as _run    # noqa: F401
 from app.models import suggestion as _suggestion  # noqa: F401
 from app.models import user_team as _user_team  # noqa: F401
 from app.models import sop_allowed_team as _sop_allowed_team  # noqa: F401
+from app.models import sop_step as _sop_step  # noqa: F401
+from app.models import sop_image as _sop_image  # noqa: F401
+from app.models import analytics as _analytics  # noqa: F401
+from app.models import sop_version as _sop_version  # noqa: F401
+from app.models import acl_state as _acl_state  # noqa: F401
 
 from sqlalchemy import engine_from_config
 from sqlalchemy import pool
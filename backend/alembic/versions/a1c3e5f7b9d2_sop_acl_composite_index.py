@@ -0,0 +1,28 @@
+"""sop acl composite index
+
+Revision ID: a1c3e5f7b9d2
+Revises: 6b4dd8afec17
+Create Date: 2026-10-18 09:12:04.118203
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a1c3e5f7b9d2'
+down_revision: Union[str, Sequence[str], None] = '6b4dd8afec17'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_sop_allowed_teams_team_sop', 'sop_allowed_teams', ['team_id', 'sop_id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_sop_allowed_teams_team_sop', table_name='sop_allowed_teams')
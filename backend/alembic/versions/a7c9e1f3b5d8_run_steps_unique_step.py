@@ -0,0 +1,50 @@
+"""run steps unique step
+
+Revision ID: a7c9e1f3b5d8
+Revises: f1b3d5a7c9e2
+Create Date: 2026-10-18 16:58:41.206733
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a7c9e1f3b5d8'
+down_revision: Union[str, Sequence[str], None] = 'f1b3d5a7c9e2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Collapse duplicate check-ins left by the old select-then-insert race,
+    # keeping the latest check time on the surviving (lowest id) row
+    op.execute(
+        """
+        UPDATE run_steps AS keep
+        SET checked_at = dup.checked_at
+        FROM (
+            SELECT run_id, step_no, MIN(id) AS id, MAX(checked_at) AS checked_at
+            FROM run_steps
+            GROUP BY run_id, step_no
+            HAVING COUNT(*) > 1
+        ) AS dup
+        WHERE keep.id = dup.id
+        """
+    )
+    op.execute(
+        """
+        DELETE FROM run_steps AS r
+        USING run_steps AS keep
+        WHERE r.run_id = keep.run_id AND r.step_no = keep.step_no AND r.id > keep.id
+        """
+    )
+    op.create_unique_constraint('uq_run_step', 'run_steps', ['run_id', 'step_no'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_constraint('uq_run_step', 'run_steps', type_='unique')
@@ -0,0 +1,91 @@
+"""analytics rollups
+
+Revision ID: b3d5f7a9c1e4
+Revises: a7c9e1f3b5d8
+Create Date: 2026-10-18 17:44:19.580214
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b3d5f7a9c1e4'
+down_revision: Union[str, Sequence[str], None] = 'a7c9e1f3b5d8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('runs', sa.Column('updated_at', sa.DateTime(), nullable=True))
+    op.execute("UPDATE runs SET updated_at = COALESCE(completed_at, started_at, timezone('utc', now()))")
+    op.alter_column('runs', 'updated_at', nullable=False)
+    op.create_index('ix_runs_updated_at', 'runs', ['updated_at'], unique=False)
+    # Existing suggestions have no creation time; they count as created at migration time
+    op.add_column('suggestions', sa.Column('created_at', sa.DateTime(), server_default=sa.text("timezone('utc', now())"), nullable=False))
+    op.alter_column('suggestions', 'created_at', server_default=None)
+    op.create_index('ix_suggestions_created_at', 'suggestions', ['created_at'], unique=False)
+
+    op.create_table('analytics_run_daily',
+    sa.Column('sop_id', sa.Integer(), nullable=False),
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('started', sa.Integer(), nullable=False),
+    sa.Column('completed', sa.Integer(), nullable=False),
+    sa.Column('passed', sa.Integer(), nullable=False),
+    sa.Column('failed', sa.Integer(), nullable=False),
+    sa.Column('duration_sum_s', sa.Float(), nullable=False),
+    sa.ForeignKeyConstraint(['sop_id'], ['sops.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('sop_id', 'day')
+    )
+    op.create_index(op.f('ix_analytics_run_daily_day'), 'analytics_run_daily', ['day'], unique=False)
+    op.create_table('analytics_run_durations',
+    sa.Column('sop_id', sa.Integer(), nullable=False),
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('bucket', sa.Integer(), nullable=False),
+    sa.Column('runs', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['sop_id'], ['sops.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('sop_id', 'day', 'bucket')
+    )
+    op.create_index(op.f('ix_analytics_run_durations_day'), 'analytics_run_durations', ['day'], unique=False)
+    op.create_table('analytics_step_daily',
+    sa.Column('sop_id', sa.Integer(), nullable=False),
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('step_no', sa.Integer(), nullable=False),
+    sa.Column('runs', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['sop_id'], ['sops.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('sop_id', 'day', 'step_no')
+    )
+    op.create_index(op.f('ix_analytics_step_daily_day'), 'analytics_step_daily', ['day'], unique=False)
+    op.create_table('analytics_suggestion_daily',
+    sa.Column('sop_id', sa.Integer(), nullable=False),
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('created', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['sop_id'], ['sops.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('sop_id', 'day')
+    )
+    op.create_index(op.f('ix_analytics_suggestion_daily_day'), 'analytics_suggestion_daily', ['day'], unique=False)
+    op.create_table('analytics_watermarks',
+    sa.Column('name', sa.String(length=64), nullable=False),
+    sa.Column('value', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('name')
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('analytics_watermarks')
+    op.drop_index(op.f('ix_analytics_suggestion_daily_day'), table_name='analytics_suggestion_daily')
+    op.drop_table('analytics_suggestion_daily')
+    op.drop_index(op.f('ix_analytics_step_daily_day'), table_name='analytics_step_daily')
+    op.drop_table('analytics_step_daily')
+    op.drop_index(op.f('ix_analytics_run_durations_day'), table_name='analytics_run_durations')
+    op.drop_table('analytics_run_durations')
+    op.drop_index(op.f('ix_analytics_run_daily_day'), table_name='analytics_run_daily')
+    op.drop_table('analytics_run_daily')
+    op.drop_index('ix_suggestions_created_at', table_name='suggestions')
+    op.drop_column('suggestions', 'created_at')
+    op.drop_index('ix_runs_updated_at', table_name='runs')
+    op.drop_column('runs', 'updated_at')
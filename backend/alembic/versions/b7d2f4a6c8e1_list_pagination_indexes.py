@@ -0,0 +1,40 @@
+"""list pagination indexes
+
+Revision ID: b7d2f4a6c8e1
+Revises: a1c3e5f7b9d2
+Create Date: 2026-10-18 10:03:41.552917
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b7d2f4a6c8e1'
+down_revision: Union[str, Sequence[str], None] = 'a1c3e5f7b9d2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_runs_sop_id_id', 'runs', ['sop_id', 'id'], unique=False)
+    op.create_index('ix_runs_user_id_id', 'runs', ['user_id', 'id'], unique=False)
+    op.create_index('ix_runs_started_at', 'runs', ['started_at'], unique=False)
+    op.create_index('ix_suggestions_status_id', 'suggestions', ['status', 'id'], unique=False)
+    op.create_index('ix_suggestions_sop_id_id', 'suggestions', ['sop_id', 'id'], unique=False)
+    op.create_index('ix_sops_department_id', 'sops', ['department', 'id'], unique=False)
+    op.create_index('ix_sops_status_id', 'sops', ['status', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_sops_status_id', table_name='sops')
+    op.drop_index('ix_sops_department_id', table_name='sops')
+    op.drop_index('ix_suggestions_sop_id_id', table_name='suggestions')
+    op.drop_index('ix_suggestions_status_id', table_name='suggestions')
+    op.drop_index('ix_runs_started_at', table_name='runs')
+    op.drop_index('ix_runs_user_id_id', table_name='runs')
+    op.drop_index('ix_runs_sop_id_id', table_name='runs')
@@ -0,0 +1,38 @@
+"""sop steps table
+
+Revision ID: c3e8a1d5f2b4
+Revises: b7d2f4a6c8e1
+Create Date: 2026-10-18 11:20:15.904731
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c3e8a1d5f2b4'
+down_revision: Union[str, Sequence[str], None] = 'b7d2f4a6c8e1'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('sop_steps',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('sop_id', sa.Integer(), nullable=False),
+    sa.Column('step_no', sa.Integer(), nullable=False),
+    sa.Column('title', sa.String(length=255), nullable=False),
+    sa.Column('text', sa.Text(), nullable=False),
+    sa.Column('html', sa.Text(), nullable=True),
+    sa.ForeignKeyConstraint(['sop_id'], ['sops.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('sop_id', 'step_no', name='uq_sop_step')
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('sop_steps')
@@ -0,0 +1,64 @@
+"""sop versions
+
+Revision ID: c5e7a9b1d3f6
+Revises: b3d5f7a9c1e4
+Create Date: 2026-10-18 19:12:05.318842
+
+"""
+import json
+import zlib
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c5e7a9b1d3f6'
+down_revision: Union[str, Sequence[str], None] = 'b3d5f7a9c1e4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('sop_versions',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('sop_id', sa.Integer(), nullable=False),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.Column('kind', sa.String(length=16), nullable=False),
+    sa.Column('data', sa.LargeBinary(), nullable=False),
+    sa.Column('size', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['sop_id'], ['sops.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('sop_id', 'version', name='uq_sop_version')
+    )
+
+    # History starts at each SOP's current version; earlier versions were
+    # overwritten in place. Same encoding as app.versions snapshots.
+    conn = op.get_bind()
+    sop_versions = sa.table(
+        'sop_versions',
+        sa.column('sop_id', sa.Integer), sa.column('version', sa.Integer), sa.column('kind', sa.String),
+        sa.column('data', sa.LargeBinary), sa.column('size', sa.Integer), sa.column('created_at', sa.DateTime),
+    )
+    rows = conn.execute(sa.text(
+        "SELECT id, version, title, department, status, content_md, content_json FROM sops"
+    )).mappings().all()
+    for row in rows:
+        doc = {f: row[f] for f in ('title', 'department', 'status', 'content_md', 'content_json')}
+        size = sum(len(v.encode()) for v in (
+            doc['title'], doc['department'], doc['status'], doc['content_md'],
+            None if doc['content_json'] is None else json.dumps(doc['content_json'], sort_keys=True, ensure_ascii=False),
+        ) if v)
+        conn.execute(sa.insert(sop_versions).values(
+            sop_id=row['id'], version=row['version'] or 1, kind='snapshot',
+            data=zlib.compress(json.dumps(doc, ensure_ascii=False, separators=(',', ':')).encode()),
+            size=size, created_at=sa.func.timezone('utc', sa.func.now()),
+        ))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('sop_versions')
@@ -0,0 +1,31 @@
+"""run sop version
+
+Revision ID: d7f9b1c3e5a8
+Revises: c5e7a9b1d3f6
+Create Date: 2026-10-18 20:03:47.912406
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd7f9b1c3e5a8'
+down_revision: Union[str, Sequence[str], None] = 'c5e7a9b1d3f6'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Left NULL for existing runs: which version they followed was never recorded
+    op.add_column('runs', sa.Column('sop_version', sa.Integer(), nullable=True))
+    op.add_column('runs', sa.Column('total_steps', sa.Integer(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('runs', 'total_steps')
+    op.drop_column('runs', 'sop_version')
@@ -0,0 +1,38 @@
+"""sop images table
+
+Revision ID: d9f1b3c5e7a2
+Revises: c3e8a1d5f2b4
+Create Date: 2026-10-18 13:42:27.360158
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd9f1b3c5e7a2'
+down_revision: Union[str, Sequence[str], None] = 'c3e8a1d5f2b4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('sop_images',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('sop_id', sa.Integer(), nullable=False),
+    sa.Column('sha256', sa.String(length=64), nullable=False),
+    sa.Column('ext', sa.String(length=16), nullable=False),
+    sa.ForeignKeyConstraint(['sop_id'], ['sops.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('sop_id', 'sha256', name='uq_sop_image')
+    )
+    op.create_index(op.f('ix_sop_images_sha256'), 'sop_images', ['sha256'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_sop_images_sha256'), table_name='sop_images')
+    op.drop_table('sop_images')
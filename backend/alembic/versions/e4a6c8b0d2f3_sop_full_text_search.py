@@ -0,0 +1,37 @@
+"""sop full text search
+
+Revision ID: e4a6c8b0d2f3
+Revises: d9f1b3c5e7a2
+Create Date: 2026-10-18 15:05:52.731946
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision: str = 'e4a6c8b0d2f3'
+down_revision: Union[str, Sequence[str], None] = 'd9f1b3c5e7a2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+SEARCH_TSV_SQL = (
+    "setweight(to_tsvector('english', coalesce(title, '')), 'A') || "
+    "setweight(to_tsvector('english', coalesce(department, '')), 'B') || "
+    "setweight(to_tsvector('english', coalesce(content_md, '')), 'C')"
+)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('sops', sa.Column('search_tsv', postgresql.TSVECTOR(), sa.Computed(SEARCH_TSV_SQL, persisted=True), nullable=True))
+    op.create_index('ix_sops_search_tsv', 'sops', ['search_tsv'], unique=False, postgresql_using='gin')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_sops_search_tsv', table_name='sops', postgresql_using='gin')
+    op.drop_column('sops', 'search_tsv')
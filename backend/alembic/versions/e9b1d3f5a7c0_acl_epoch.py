@@ -0,0 +1,34 @@
+"""acl epoch
+
+Revision ID: e9b1d3f5a7c0
+Revises: d7f9b1c3e5a8
+Create Date: 2026-10-18 22:41:09.307518
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e9b1d3f5a7c0'
+down_revision: Union[str, Sequence[str], None] = 'd7f9b1c3e5a8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'acl_state',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('epoch', sa.BigInteger(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.execute("INSERT INTO acl_state (id, epoch) VALUES (1, 1)")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('acl_state')
@@ -0,0 +1,34 @@
+"""suggestion triage state
+
+Revision ID: f1b3d5a7c9e2
+Revises: e4a6c8b0d2f3
+Create Date: 2026-10-18 16:12:08.413527
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f1b3d5a7c9e2'
+down_revision: Union[str, Sequence[str], None] = 'e4a6c8b0d2f3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('suggestions', sa.Column('attempts', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('suggestions', sa.Column('last_error', sa.String(length=1000), nullable=True))
+    op.add_column('suggestions', sa.Column('claimed_at', sa.DateTime(), nullable=True))
+    op.add_column('suggestions', sa.Column('available_at', sa.DateTime(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('suggestions', 'available_at')
+    op.drop_column('suggestions', 'claimed_at')
+    op.drop_column('suggestions', 'last_error')
+    op.drop_column('suggestions', 'attempts')
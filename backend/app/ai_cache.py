@@ -0,0 +1,136 @@
+"""On-disk cache of model responses for the AI endpoints.
+
+Entries are keyed on a SHA-256 of (endpoint, prompt template version, model,
+normalized inputs), so bumping a template version or switching models never
+serves stale output. SQLite keeps the store shared between uvicorn workers;
+entries expire after ``ai_cache_ttl_seconds`` and the least recently used are
+evicted once the stored text exceeds ``ai_cache_max_bytes``.
+"""
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+
+from app.core.settings import settings
+
+
+def normalize(value):
+    """Canonical form of an input: NFC, LF line endings, no trailing blanks."""
+    if not isinstance(value, str):
+        return value
+    text = unicodedata.normalize("NFC", value).replace("\r\n", "\n").replace("\r", "\n")
+    text = re.sub(r"[ \t]+\n", "\n", text)
+    text = re.sub(r"\n{3,}", "\n\n", text)
+    return text.strip()
+
+
+def cache_key(kind: str, prompt_version: int, model: str, inputs: dict) -> str:
+    doc = {
+        "kind": kind,
+        "prompt_version": prompt_version,
+        "model": model,
+        "inputs": {k: normalize(v) for k, v in inputs.items()},
+    }
+    return hashlib.sha256(json.dumps(doc, sort_keys=True, ensure_ascii=False).encode()).hexdigest()
+
+
+class ResponseCache:
+    def __init__(self, path: str, ttl: float, max_bytes: int):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._ready = False
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.bypasses = 0
+        self.evictions = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        if not self._ready:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=5)
+        if not self._ready:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                " key TEXT PRIMARY KEY, kind TEXT NOT NULL, value TEXT NOT NULL,"
+                " size INTEGER NOT NULL, created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_responses_accessed ON responses (accessed_at)")
+            conn.commit()
+            self._ready = True
+        return conn
+
+    def get(self, key: str) -> dict | None:
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute("SELECT value, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row and row[1] >= now - self.ttl:
+                conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+            else:
+                if row:
+                    conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                row = None
+        conn.close()
+        with self._lock:
+            if row:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return json.loads(row[0]) if row else None
+
+    def set(self, key: str, kind: str, value: dict) -> None:
+        now = time.time()
+        data = json.dumps(value, ensure_ascii=False)
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, kind, value, size, created_at, accessed_at)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (key, kind, data, len(data.encode()), now, now),
+            )
+            conn.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl,))
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+            evicted = 0
+            if total > self.max_bytes:
+                # Walk from least recently used until the store fits again
+                for old_key, size in conn.execute(
+                    "SELECT key, size FROM responses ORDER BY accessed_at"
+                ).fetchall():
+                    if total <= self.max_bytes:
+                        break
+                    conn.execute("DELETE FROM responses WHERE key = ?", (old_key,))
+                    total -= size
+                    evicted += 1
+        conn.close()
+        if evicted:
+            with self._lock:
+                self.evictions += evicted
+
+    def record_bypass(self) -> None:
+        with self._lock:
+            self.bypasses += 1
+
+    def stats(self) -> dict:
+        with self._connect() as conn:
+            entries, size = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        conn.close()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "bypasses": self.bypasses,
+            "evictions": self.evictions,
+            "hit_ratio": self.hits / lookups if lookups else None,
+            "entries": entries,
+            "bytes": size,
+            "max_bytes": self.max_bytes,
+            "ttl_seconds": self.ttl,
+        }
+
+
+response_cache = ResponseCache(settings.ai_cache_path, settings.ai_cache_ttl_seconds, settings.ai_cache_max_bytes)
@@ -0,0 +1,172 @@
+"""Incrementally maintained analytics rollups.
+
+Runs and suggestions are folded into per-(sop_id, day) rollup tables (see
+``app.models.analytics``). A refresh recomputes only the keys touched since the
+last watermark: runs whose ``updated_at`` moved and suggestions created since.
+Each key is rebuilt from the base tables, so refreshing is idempotent and the
+watermark overlap can safely re-read recent rows. Dashboards then aggregate a
+few rows per SOP and day instead of scanning every run.
+"""
+import asyncio
+import logging
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import ARRAY, Date, Float, Integer, and_, cast, column, delete, extract, func, insert, literal, select, values
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from app.core.settings import settings
+from app.db import SessionLocal
+from app.models.analytics import (
+    RollupWatermark,
+    RunDailyRollup,
+    RunDurationRollup,
+    StepDailyRollup,
+    SuggestionDailyRollup,
+)
+from app.models.run import Run, RunStep
+from app.models.suggestion import Suggestion
+
+
+log = logging.getLogger("app.analytics")
+
+# Upper bounds (seconds) of the duration histogram; the last bucket is open-ended
+DURATION_BOUNDS = [
+    15, 30, 60, 120, 180, 300, 450, 600, 900, 1200, 1800, 2700, 3600,
+    5400, 7200, 10800, 14400, 21600, 28800, 43200, 86400, 172800,
+]
+LOCK_ID = 0x50A7_0001
+KEY_CHUNK = 500
+# Re-read rows this far behind the watermark to cover transactions that
+# committed after a refresh with an earlier timestamp
+OVERLAP = timedelta(minutes=5)
+
+
+def _keys_table(keys: list[tuple[int, date]]):
+    return values(column("sop_id", Integer), column("day", Date), name="k").data(keys)
+
+
+def _day(ts_col):
+    return cast(ts_col, Date)
+
+
+def _rebuild_run_keys(db: Session, keys: list[tuple[int, date]]) -> None:
+    k = _keys_table(keys)
+    in_keys = and_(Run.sop_id == k.c.sop_id, Run.started_at >= k.c.day, Run.started_at < k.c.day + 1)
+    for model in (RunDailyRollup, RunDurationRollup, StepDailyRollup):
+        db.execute(delete(model).where(
+            model.sop_id == k.c.sop_id, model.day == k.c.day
+        ))
+    duration = extract("epoch", Run.completed_at - Run.started_at)
+    db.execute(insert(RunDailyRollup).from_select(
+        ["sop_id", "day", "started", "completed", "passed", "failed", "duration_sum_s"],
+        select(
+            Run.sop_id,
+            _day(Run.started_at),
+            func.count(),
+            func.count(Run.completed_at),
+            func.count().filter(Run.passed.is_(True)),
+            func.count().filter(Run.passed.is_(False)),
+            func.coalesce(func.sum(duration), 0.0),
+        ).join(k, in_keys).group_by(Run.sop_id, _day(Run.started_at)),
+    ))
+    bucket = func.width_bucket(duration, cast(literal(DURATION_BOUNDS), ARRAY(Float)))
+    db.execute(insert(RunDurationRollup).from_select(
+        ["sop_id", "day", "bucket", "runs"],
+        select(Run.sop_id, _day(Run.started_at), bucket, func.count())
+        .join(k, in_keys)
+        .where(Run.completed_at.is_not(None))
+        .group_by(Run.sop_id, _day(Run.started_at), bucket),
+    ))
+    db.execute(insert(StepDailyRollup).from_select(
+        ["sop_id", "day", "step_no", "runs"],
+        select(Run.sop_id, _day(Run.started_at), RunStep.step_no, func.count(func.distinct(Run.id)))
+        .join(k, in_keys)
+        .join(RunStep, RunStep.run_id == Run.id)
+        .group_by(Run.sop_id, _day(Run.started_at), RunStep.step_no),
+    ))
+
+
+def _rebuild_suggestion_keys(db: Session, keys: list[tuple[int, date]]) -> None:
+    k = _keys_table(keys)
+    db.execute(delete(SuggestionDailyRollup).where(
+        SuggestionDailyRollup.sop_id == k.c.sop_id, SuggestionDailyRollup.day == k.c.day
+    ))
+    db.execute(insert(SuggestionDailyRollup).from_select(
+        ["sop_id", "day", "created"],
+        select(Suggestion.sop_id, _day(Suggestion.created_at), func.count())
+        .join(k, and_(
+            Suggestion.sop_id == k.c.sop_id,
+            Suggestion.created_at >= k.c.day,
+            Suggestion.created_at < k.c.day + 1,
+        ))
+        .group_by(Suggestion.sop_id, _day(Suggestion.created_at)),
+    ))
+
+
+def refresh_rollups(db: Session, full: bool = False) -> dict:
+    """Bring the rollups up to date; returns how many keys were rebuilt.
+
+    Serialized across processes with a transaction-level advisory lock; a caller
+    that finds a refresh in progress returns ``{"skipped": True}``.
+    """
+    if not db.execute(select(func.pg_try_advisory_xact_lock(LOCK_ID))).scalar():
+        db.rollback()
+        return {"skipped": True}
+    started = datetime.utcnow()
+    mark = db.get(RollupWatermark, "rollups")
+    since = None if full or mark is None else mark.value - OVERLAP
+    run_q = select(Run.sop_id, _day(Run.started_at)).distinct()
+    sug_q = select(Suggestion.sop_id, _day(Suggestion.created_at)).distinct()
+    if since is None:
+        for model in (RunDailyRollup, RunDurationRollup, StepDailyRollup, SuggestionDailyRollup):
+            db.execute(delete(model))
+    else:
+        run_q = run_q.where(Run.updated_at > since)
+        sug_q = sug_q.where(Suggestion.created_at > since)
+    run_keys = [tuple(r) for r in db.execute(run_q).all()]
+    sug_keys = [tuple(r) for r in db.execute(sug_q).all()]
+    for i in range(0, len(run_keys), KEY_CHUNK):
+        _rebuild_run_keys(db, run_keys[i:i + KEY_CHUNK])
+    for i in range(0, len(sug_keys), KEY_CHUNK):
+        _rebuild_suggestion_keys(db, sug_keys[i:i + KEY_CHUNK])
+    if mark is None:
+        db.add(RollupWatermark(name="rollups", value=started))
+    else:
+        mark.value = started
+    db.commit()
+    return {"skipped": False, "full": since is None, "run_keys": len(run_keys), "suggestion_keys": len(sug_keys)}
+
+
+def median_from_histogram(counts: dict[int, int]) -> float | None:
+    """Approximate median (seconds) by interpolating inside the median bucket."""
+    total = sum(counts.values())
+    if not total:
+        return None
+    half = total / 2
+    seen = 0
+    for bucket in sorted(counts):
+        n = counts[bucket]
+        if seen + n >= half:
+            # width_bucket: 0 is below the first bound, len(bounds) is above the last
+            lo = DURATION_BOUNDS[bucket - 1] if bucket > 0 else 0
+            hi = DURATION_BOUNDS[bucket] if bucket < len(DURATION_BOUNDS) else lo
+            return round(lo + (hi - lo) * (half - seen) / n, 1)
+        seen += n
+    return None
+
+
+def _refresh_once() -> None:
+    with SessionLocal() as db:
+        refresh_rollups(db)
+
+
+async def refresh_forever() -> None:
+    """Lifespan task: refresh every ``analytics_refresh_seconds``."""
+    while True:
+        try:
+            await run_in_threadpool(_refresh_once)
+        except Exception:
+            # Keep the loop alive; the next tick retries from the same watermark
+            log.exception("analytics refresh failed")
+        await asyncio.sleep(settings.analytics_refresh_seconds)
@@ -6,10 +6,68 @@ from typing import List
 class Settings(BaseSettings):
     env: str = "development"
     database_url: str
+    # Optional separate URL for the async engine (e.g. postgresql+asyncpg://...)
+    async_database_url: str | None = None
+    # Per engine and per worker; each uvicorn worker opens up to 2 x (size + overflow)
+    # connections. A size of 0 disables client-side pooling (e.g. behind PgBouncer)
+    db_pool_size: int = 5
+    db_max_overflow: int = 10
+    db_pool_timeout_seconds: float = 30.0
+    db_pool_recycle_seconds: float = 1800.0
+    db_pool_pre_ping: bool = True
+    # PgBouncer transaction pooling: no server-side prepared statements
+    db_pgbouncer: bool = False
     allowed_origins: List[str] = ["http://localhost:3000"]
     jwt_secret: str = "dev_secret_change_me"
     jwt_algorithm: str = "HS256"
+    access_token_minutes: int = 15
+    refresh_token_minutes: int = 14 * 24 * 60
+    # Embed team ids and the ACL epoch in access tokens so guarded reads skip
+    # membership queries while the epoch is current
+    jwt_acl_claims: bool = True
+    # How long a worker trusts its cached ACL epoch before re-reading it
+    acl_epoch_check_seconds: float = 5.0
     gemini_api_key: str | None = None
+    rbac_cache_ttl_seconds: float = 30.0
+    rbac_cache_max_entries: int = 10000
+    page_default_limit: int = 100
+    page_max_limit: int = 500
+    import_workers: int = 2
+    import_max_bytes: int = 25 * 1024 * 1024
+    upload_orphan_max_age_seconds: float = 3600.0
+    upload_sweep_interval_seconds: float = 600.0
+    media_sweep_interval_seconds: float = 6 * 3600.0
+    image_variant_widths: List[int] = [480, 960, 1600]
+    image_quality: int = 75
+    semantic_index_dir: str = "data/semantic"
+    semantic_model: str | None = None
+    semantic_dim: int = 384
+    llm_base_url: str = "https://generativelanguage.googleapis.com/v1beta"
+    llm_model: str = "gemini-1.5-flash"
+    llm_timeout_seconds: float = 90.0
+    llm_connect_timeout_seconds: float = 10.0
+    llm_max_connections: int = 20
+    llm_max_keepalive_connections: int = 10
+    llm_keepalive_expiry_seconds: float = 30.0
+    llm_max_retries: int = 3
+    llm_backoff_base_seconds: float = 0.5
+    llm_backoff_max_seconds: float = 8.0
+    ai_cache_path: str = "data/ai_cache.sqlite3"
+    ai_cache_ttl_seconds: float = 7 * 24 * 3600.0
+    ai_cache_max_bytes: int = 64 * 1024 * 1024
+    ai_clean_section_chars: int = 3000
+    ai_clean_concurrency: int = 4
+    triage_batch_size: int = 50
+    triage_group_size: int = 20
+    triage_concurrency: int = 4
+    triage_max_attempts: int = 5
+    triage_lease_seconds: float = 300.0
+    triage_poll_seconds: float = 5.0
+    triage_retry_base_seconds: float = 30.0
+    triage_retry_max_seconds: float = 3600.0
+    analytics_refresh_seconds: float = 60.0
+    sop_version_snapshot_every: int = 20
+    sop_version_cache_entries: int = 64
 
     model_config = {
         "env_file": ".env",
@@ -20,10 +78,61 @@ class Settings(BaseSettings):
         "populate_by_name": True,
         "fields": {
             "database_url": {"env": ["DATABASE_URL"]},
+            "async_database_url": {"env": ["ASYNC_DATABASE_URL"]},
+            "db_pool_size": {"env": ["DB_POOL_SIZE"]},
+            "db_max_overflow": {"env": ["DB_MAX_OVERFLOW"]},
+            "db_pool_timeout_seconds": {"env": ["DB_POOL_TIMEOUT_SECONDS"]},
+            "db_pool_recycle_seconds": {"env": ["DB_POOL_RECYCLE_SECONDS"]},
+            "db_pool_pre_ping": {"env": ["DB_POOL_PRE_PING"]},
+            "db_pgbouncer": {"env": ["DB_PGBOUNCER"]},
             "allowed_origins": {"env": ["ALLOWED_ORIGINS"]},
             "jwt_secret": {"env": ["JWT_SECRET"]},
             "jwt_algorithm": {"env": ["JWT_ALGORITHM"]},
+            "access_token_minutes": {"env": ["ACCESS_TOKEN_MINUTES"]},
+            "refresh_token_minutes": {"env": ["REFRESH_TOKEN_MINUTES"]},
+            "jwt_acl_claims": {"env": ["JWT_ACL_CLAIMS"]},
+            "acl_epoch_check_seconds": {"env": ["ACL_EPOCH_CHECK_SECONDS"]},
             "gemini_api_key": {"env": ["GEMINI_API_KEY"]},
+            "rbac_cache_ttl_seconds": {"env": ["RBAC_CACHE_TTL_SECONDS"]},
+            "rbac_cache_max_entries": {"env": ["RBAC_CACHE_MAX_ENTRIES"]},
+            "page_default_limit": {"env": ["PAGE_DEFAULT_LIMIT"]},
+            "page_max_limit": {"env": ["PAGE_MAX_LIMIT"]},
+            "import_workers": {"env": ["IMPORT_WORKERS"]},
+            "import_max_bytes": {"env": ["IMPORT_MAX_BYTES"]},
+            "upload_orphan_max_age_seconds": {"env": ["UPLOAD_ORPHAN_MAX_AGE_SECONDS"]},
+            "upload_sweep_interval_seconds": {"env": ["UPLOAD_SWEEP_INTERVAL_SECONDS"]},
+            "media_sweep_interval_seconds": {"env": ["MEDIA_SWEEP_INTERVAL_SECONDS"]},
+            "image_variant_widths": {"env": ["IMAGE_VARIANT_WIDTHS"]},
+            "image_quality": {"env": ["IMAGE_QUALITY"]},
+            "semantic_index_dir": {"env": ["SEMANTIC_INDEX_DIR"]},
+            "semantic_model": {"env": ["SEMANTIC_MODEL"]},
+            "semantic_dim": {"env": ["SEMANTIC_DIM"]},
+            "llm_base_url": {"env": ["LLM_BASE_URL"]},
+            "llm_model": {"env": ["LLM_MODEL"]},
+            "llm_timeout_seconds": {"env": ["LLM_TIMEOUT_SECONDS"]},
+            "llm_connect_timeout_seconds": {"env": ["LLM_CONNECT_TIMEOUT_SECONDS"]},
+            "llm_max_connections": {"env": ["LLM_MAX_CONNECTIONS"]},
+            "llm_max_keepalive_connections": {"env": ["LLM_MAX_KEEPALIVE_CONNECTIONS"]},
+            "llm_keepalive_expiry_seconds": {"env": ["LLM_KEEPALIVE_EXPIRY_SECONDS"]},
+            "llm_max_retries": {"env": ["LLM_MAX_RETRIES"]},
+            "llm_backoff_base_seconds": {"env": ["LLM_BACKOFF_BASE_SECONDS"]},
+            "llm_backoff_max_seconds": {"env": ["LLM_BACKOFF_MAX_SECONDS"]},
+            "ai_cache_path": {"env": ["AI_CACHE_PATH"]},
+            "ai_cache_ttl_seconds": {"env": ["AI_CACHE_TTL_SECONDS"]},
+            "ai_cache_max_bytes": {"env": ["AI_CACHE_MAX_BYTES"]},
+            "ai_clean_section_chars": {"env": ["AI_CLEAN_SECTION_CHARS"]},
+            "ai_clean_concurrency": {"env": ["AI_CLEAN_CONCURRENCY"]},
+            "triage_batch_size": {"env": ["TRIAGE_BATCH_SIZE"]},
+            "triage_group_size": {"env": ["TRIAGE_GROUP_SIZE"]},
+            "triage_concurrency": {"env": ["TRIAGE_CONCURRENCY"]},
+            "triage_max_attempts": {"env": ["TRIAGE_MAX_ATTEMPTS"]},
+            "triage_lease_seconds": {"env": ["TRIAGE_LEASE_SECONDS"]},
+            "triage_poll_seconds": {"env": ["TRIAGE_POLL_SECONDS"]},
+            "triage_retry_base_seconds": {"env": ["TRIAGE_RETRY_BASE_SECONDS"]},
+            "triage_retry_max_seconds": {"env": ["TRIAGE_RETRY_MAX_SECONDS"]},
+            "analytics_refresh_seconds": {"env": ["ANALYTICS_REFRESH_SECONDS"]},
+            "sop_version_snapshot_every": {"env": ["SOP_VERSION_SNAPSHOT_EVERY"]},
+            "sop_version_cache_entries": {"env": ["SOP_VERSION_CACHE_ENTRIES"]},
         },
     }
 
@@ -1,12 +1,142 @@
-from sqlalchemy import create_engine
+import threading
+import time
+from collections import deque
+
+from sqlalchemy import create_engine, exc
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, NullPool, QueuePool
 
 from app.core.settings import settings
 
 
-engine = create_engine(settings.database_url, pool_pre_ping=True, future=True)
+class PoolStats:
+    """Checkout counters for one pool; latency percentiles cover the last samples only."""
+
+    def __init__(self, samples: int = 1024):
+        self._lock = threading.Lock()
+        self._latencies: deque[float] = deque(maxlen=samples)
+        self.waiting = 0
+        self.checkouts = 0
+        self.timeouts = 0
+        self.max_wait = 0.0
+
+    def begin(self):
+        with self._lock:
+            self.waiting += 1
+
+    def end(self, elapsed: float, timed_out: bool):
+        with self._lock:
+            self.waiting -= 1
+            if timed_out:
+                self.timeouts += 1
+                return
+            self.checkouts += 1
+            self.max_wait = max(self.max_wait, elapsed)
+            self._latencies.append(elapsed)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            lat = sorted(self._latencies)
+            out = {"waiting": self.waiting, "checkouts": self.checkouts, "timeouts": self.timeouts}
+        def ms(q: float) -> float | None:
+            return round(lat[min(len(lat) - 1, int(q * len(lat)))] * 1000, 3) if lat else None
+        out["checkout_ms"] = {"p50": ms(0.5), "p99": ms(0.99), "max": round(self.max_wait * 1000, 3)}
+        return out
+
+
+class _MeteredPool:
+    """Times every checkout, including the wait for a free connection."""
+
+    def __init__(self, *args, **kw):
+        super().__init__(*args, **kw)
+        self.stats = PoolStats()
+
+    def _do_get(self):
+        self.stats.begin()
+        start = time.perf_counter()
+        timed_out = False
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            timed_out = True
+            raise
+        finally:
+            self.stats.end(time.perf_counter() - start, timed_out)
+
+
+class MeteredQueuePool(_MeteredPool, QueuePool):
+    pass
+
+
+class MeteredAsyncQueuePool(_MeteredPool, AsyncAdaptedQueuePool):
+    pass
+
+
+def engine_options(url: str, poolclass: type) -> dict:
+    """Pool and driver options from settings for an engine on ``url``."""
+    opts: dict = {"pool_pre_ping": settings.db_pool_pre_ping}
+    if settings.db_pool_size > 0:
+        opts.update(
+            poolclass=poolclass,
+            pool_size=settings.db_pool_size,
+            max_overflow=settings.db_max_overflow,
+            pool_timeout=settings.db_pool_timeout_seconds,
+            pool_recycle=settings.db_pool_recycle_seconds,
+        )
+    else:
+        opts["poolclass"] = NullPool
+    if settings.db_pgbouncer:
+        # Prepared statements live on the server connection, which PgBouncer
+        # hands to another client after each transaction
+        driver = make_url(url).get_driver_name()
+        if driver == "psycopg":
+            opts["connect_args"] = {"prepare_threshold": None}
+        elif driver == "asyncpg":
+            opts["connect_args"] = {"statement_cache_size": 0, "prepared_statement_cache_size": 0}
+    return opts
+
+
+def async_database_url() -> str:
+    """URL for the async engine: ``async_database_url`` if set, else ``database_url``.
+
+    psycopg 3 serves sync and async from the same ``postgresql+psycopg`` URL;
+    bare and psycopg2 URLs are switched to it. Set ASYNC_DATABASE_URL to use
+    another async driver such as ``postgresql+asyncpg``.
+    """
+    url = make_url(settings.async_database_url or settings.database_url)
+    if url.drivername in ("postgresql", "postgresql+psycopg2"):
+        url = url.set(drivername="postgresql+psycopg")
+    return url.render_as_string(hide_password=False)
+
+
+engine = create_engine(settings.database_url, future=True, **engine_options(settings.database_url, MeteredQueuePool))
 SessionLocal = sessionmaker(bind=engine, autocommit=False, autoflush=False, future=True)
 
+async_engine = create_async_engine(async_database_url(), **engine_options(async_database_url(), MeteredAsyncQueuePool))
+# Objects stay loaded after commit; expiring them would force lazy loads, which
+# an AsyncSession cannot do implicitly
+AsyncSessionLocal = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
+
+
+def pool_status() -> dict:
+    """Live saturation of both engines' pools in this worker."""
+    out = {}
+    for name, pool in (("sync", engine.pool), ("async", async_engine.sync_engine.pool)):
+        status = {"pool": type(pool).__name__}
+        if isinstance(pool, QueuePool):
+            status.update(
+                size=pool.size(),
+                max_overflow=settings.db_max_overflow,
+                overflow=max(pool.overflow(), 0),
+                checked_out=pool.checkedout(),
+                idle=pool.checkedin(),
+                **pool.stats.snapshot(),
+            )
+        out[name] = status
+    return out
+
 
 def get_db():
     db = SessionLocal()
@@ -16,3 +146,7 @@ def get_db():
         db.close()
 
 
+async def get_async_db():
+    """Session for ``async def`` handlers; sync helpers run through ``await db.run_sync(fn, ...)``."""
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -1,23 +1,30 @@
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.core.security import verify_jwt
+from app.db import get_async_db
+from app.rbac import AuthContext, auth_context_for
 
 
 auth_scheme = HTTPBearer(auto_error=False)
 
 
-def get_current_user(creds: HTTPAuthorizationCredentials | None = Depends(auth_scheme)):
+# Guards are ``async def`` so they run on the event loop instead of taking a threadpool slot
+
+
+async def get_current_user(creds: HTTPAuthorizationCredentials | None = Depends(auth_scheme)):
     if creds is None:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Not authenticated")
     data = verify_jwt(creds.credentials)
-    if not data:
+    # Refresh tokens are only accepted by /auth/refresh
+    if not data or data.get("typ") == "refresh":
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
     return data
 
 
 def require_roles(*allowed_roles: str):
-    def checker(user = Depends(get_current_user)):
+    async def checker(user = Depends(get_current_user)):
         role = user.get("role")
         if role not in allowed_roles:
             raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Forbidden")
@@ -25,3 +32,9 @@ def require_roles(*allowed_roles: str):
     return checker
 
 
+
+
+async def get_auth_context(user = Depends(get_current_user), db: AsyncSession = Depends(get_async_db)) -> AuthContext:
+    # FastAPI resolves a dependency once per request, so handlers and guards share this context
+    # Current token claims need no queries; the session only connects on a fallback
+    return await db.run_sync(auth_context_for, user)
@@ -0,0 +1,40 @@
+import hashlib
+from typing import Iterable
+
+from fastapi import Request, Response
+
+
+# Clients must revalidate every time, but may reuse their copy on 304
+REVALIDATE = "private, no-cache"
+# Content addressed by (sop, version) never changes; private since it is access-controlled
+IMMUTABLE_PRIVATE = "private, max-age=31536000, immutable"
+
+
+def sop_etag(id: int, version: int, scope: str = "sop") -> str:
+    return f'"{scope}-{id}-v{version}"'
+
+
+def list_etag(prefix: str, parts: Iterable) -> str:
+    """Strong ETag over an ordered list of (id, version)-style tuples."""
+    digest = hashlib.sha1(repr(list(parts)).encode()).hexdigest()
+    return f'"{prefix}-{digest}"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    # If-None-Match uses weak comparison, so ignore any W/ prefix
+    candidates = {c.strip().removeprefix("W/") for c in header.split(",")}
+    return etag in candidates
+
+
+def not_modified(etag: str, cache_control: str = REVALIDATE) -> Response:
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": cache_control})
+
+
+def set_etag(response: Response, etag: str, cache_control: str = REVALIDATE) -> None:
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = cache_control
@@ -0,0 +1,253 @@
+"""Background DOCX import jobs.
+
+``import_docx`` only validates and enqueues; mammoth conversion runs in a process
+pool so it never blocks the event loop, and the SOP row is written from a worker
+thread once conversion finishes. Job state lives in this process, so with several
+uvicorn workers a status poll must reach the worker that accepted the upload.
+"""
+import asyncio
+import multiprocessing
+import os
+import re
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime
+
+from fastapi import HTTPException, Request, UploadFile
+from fastapi.routing import APIRoute
+from sqlalchemy import select
+from starlette.concurrency import run_in_threadpool
+
+from app.core.cache import TTLCache
+from app.core.settings import settings
+from app.db import SessionLocal
+from app.models.sop import Sop
+from app.media import IMAGES_DIR, store_image, image_attributes, wrap_pictures, sync_sop_images
+from app.segmentation import replace_sop_steps
+from app.semantic import index_sop
+from app.versions import record_version
+
+
+UPLOADS_DIR = "media/uploads"
+CHUNK_SIZE = 1024 * 1024
+# Room for the form fields and multipart boundaries around the file itself
+MULTIPART_OVERHEAD = 64 * 1024
+
+
+class UploadLimitRoute(APIRoute):
+    """Route that refuses bodies over ``import_max_bytes`` before the form is parsed.
+
+    FastAPI reads and spools the whole multipart body before the handler runs, so
+    the limit is applied to ``Content-Length`` up front and, for chunked uploads,
+    to the bytes received so far.
+    """
+
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+
+        async def limited(request: Request):
+            limit = settings.import_max_bytes + MULTIPART_OVERHEAD
+            too_large = HTTPException(status_code=413, detail=f"Upload exceeds {settings.import_max_bytes} bytes")
+            length = request.headers.get("content-length")
+            if length is not None:
+                if not length.isdigit() or int(length) > limit:
+                    raise too_large
+                return await handler(request)
+            received = 0
+
+            async def receive():
+                nonlocal received
+                message = await request.receive()
+                received += len(message.get("body", b""))
+                if received > limit:
+                    raise too_large
+                return message
+
+            return await handler(Request(request.scope, receive))
+
+        return limited
+
+
+async def save_upload(file: UploadFile, max_bytes: int) -> str:
+    """Stream an upload to ``UPLOADS_DIR`` in fixed-size chunks, enforcing ``max_bytes``.
+
+    The route should use ``UploadLimitRoute`` so oversized bodies are refused
+    before they are received; this check covers the file part exactly.
+    """
+    os.makedirs(UPLOADS_DIR, exist_ok=True)
+    path = os.path.join(UPLOADS_DIR, f"{uuid.uuid4()}.docx")
+    size = 0
+    try:
+        with open(path, "wb") as f:
+            while chunk := await file.read(CHUNK_SIZE):
+                size += len(chunk)
+                if size > max_bytes:
+                    raise HTTPException(status_code=413, detail=f"Upload exceeds {max_bytes} bytes")
+                await run_in_threadpool(f.write, chunk)
+    except BaseException:
+        _remove(path)
+        raise
+    return path
+
+
+def _remove(path: str) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def sweep_uploads(max_age: float, keep: set[str]) -> int:
+    """Delete uploads older than ``max_age`` seconds that no live job references."""
+    removed = 0
+    cutoff = time.time() - max_age
+    try:
+        entries = list(os.scandir(UPLOADS_DIR))
+    except FileNotFoundError:
+        return 0
+    for entry in entries:
+        if entry.is_file() and entry.path not in keep and entry.stat().st_mtime < cutoff:
+            _remove(entry.path)
+            removed += 1
+    return removed
+
+
+def convert_docx(path: str, images_dir: str) -> tuple[str, str]:
+    """Convert a DOCX to (html, plaintext), writing embedded images to ``images_dir``.
+
+    Runs in a worker process, so it must stay a picklable top-level function.
+    """
+    import mammoth
+
+    os.makedirs(images_dir, exist_ok=True)
+
+    def image_handler(image):
+        # image.open() returns a context manager (closing wrapper). Use it properly.
+        with image.open() as img_fp:
+            data = img_fp.read()
+        src = store_image(data, image.content_type.split('/')[-1], images_dir)
+        return image_attributes(data, src, images_dir)
+
+    with open(path, "rb") as docx_file:
+        result = mammoth.convert_to_html(docx_file, convert_image=mammoth.images.inline(image_handler))
+    html = wrap_pictures(result.value)
+    # Fallback plain text (strip tags)
+    text = re.sub("<[^>]+>", "\n", html)
+    text = re.sub("\n+", "\n", text).strip()
+    return html, text
+
+
+@dataclass
+class ImportJob:
+    id: str
+    sop_id: str
+    title: str
+    department: str
+    status: str = "queued"
+    error: str | None = None
+    sop: dict | None = None
+    created_at: datetime = field(default_factory=datetime.utcnow)
+    finished_at: datetime | None = None
+
+
+class ImportQueue:
+    def __init__(self):
+        self._pool: ProcessPoolExecutor | None = None
+        self._jobs = TTLCache(maxsize=1000, ttl=24 * 3600)
+        self._tasks: set[asyncio.Task] = set()
+        self._paths: set[str] = set()
+        self._sweeper: asyncio.Task | None = None
+
+    def start(self) -> None:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(
+                max_workers=settings.import_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        if self._sweeper is None:
+            self._sweeper = asyncio.get_running_loop().create_task(self._sweep_forever())
+
+    async def _sweep_forever(self) -> None:
+        while True:
+            await run_in_threadpool(sweep_uploads, settings.upload_orphan_max_age_seconds, set(self._paths))
+            await asyncio.sleep(settings.upload_sweep_interval_seconds)
+
+    async def shutdown(self) -> None:
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            self._sweeper = None
+        for task in list(self._tasks):
+            task.cancel()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def get(self, job_id: str) -> ImportJob | None:
+        return self._jobs.get(job_id)
+
+    def submit(self, path: str, sop_id: str, title: str, department: str) -> ImportJob:
+        self.start()
+        job = ImportJob(id=uuid.uuid4().hex, sop_id=sop_id, title=title, department=department)
+        self._jobs.set(job.id, job)
+        self._paths.add(path)
+        task = asyncio.create_task(self._run(job, path))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return job
+
+    async def _run(self, job: ImportJob, path: str) -> None:
+        loop = asyncio.get_running_loop()
+        try:
+            job.status = "running"
+            try:
+                html, text = await loop.run_in_executor(self._pool, convert_docx, path, IMAGES_DIR)
+            except Exception as e:
+                raise ValueError(f"Import failed: {e}") from e
+            job.sop = await run_in_threadpool(_create_sop, job, html, text)
+            job.status = "succeeded"
+        except Exception as e:
+            job.status = "failed"
+            job.error = str(e)
+        finally:
+            job.finished_at = datetime.utcnow()
+            # The DOCX is only needed for conversion; the SOP keeps the HTML
+            await run_in_threadpool(_remove, path)
+            self._paths.discard(path)
+
+
+def _create_sop(job: ImportJob, html: str, text: str) -> dict:
+    with SessionLocal() as db:
+        exists = db.execute(select(Sop.id).where(Sop.sop_id == job.sop_id)).scalar_one_or_none()
+        if exists:
+            raise ValueError("sop_id already exists")
+        sop = Sop(
+            sop_id=job.sop_id,
+            title=job.title,
+            department=job.department,
+            content_md=text,
+            content_json={"html": html},
+            status="draft",
+            version=1,
+        )
+        db.add(sop)
+        db.flush()
+        replace_sop_steps(db, sop)
+        sync_sop_images(db, sop.id, html)
+        record_version(db, sop)
+        db.commit()
+        index_sop(sop.id, text, {"html": html})
+        return {
+            "id": sop.id,
+            "sop_id": sop.sop_id,
+            "title": sop.title,
+            "department": sop.department,
+            "status": sop.status,
+            "version": sop.version,
+        }
+
+
+import_queue = ImportQueue()
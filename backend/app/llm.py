@@ -0,0 +1,206 @@
+"""Application-scoped client for the Gemini ``generateContent`` API.
+
+One pooled ``httpx.AsyncClient`` (HTTP/2 when ``h2`` is installed) is opened in
+the app lifespan and reused by every AI endpoint, so requests share warm
+connections instead of paying a TCP+TLS handshake each time. Throttling (429)
+and server errors are retried with capped, fully jittered exponential backoff.
+"""
+import asyncio
+import json
+import random
+import threading
+from collections import deque
+from typing import AsyncIterator
+
+import httpx
+from fastapi import HTTPException
+
+from app.core.settings import settings
+
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def backoff_delay(attempt: int, retry_after: str | None = None) -> float:
+    """Seconds to wait before retry ``attempt`` (0-based), honouring Retry-After."""
+    if retry_after:
+        try:
+            return min(float(retry_after), settings.llm_backoff_max_seconds)
+        except ValueError:
+            pass
+    return random.uniform(0, min(settings.llm_backoff_max_seconds, settings.llm_backoff_base_seconds * 2 ** attempt))
+
+
+def extract_text(data: dict) -> str:
+    try:
+        return data["candidates"][0]["content"]["parts"][0]["text"]
+    except Exception:
+        raise HTTPException(status_code=502, detail={"upstream": data})
+
+
+def _chunk_text(data: dict) -> str:
+    # Streamed chunks may carry only metadata (finish reason, usage) and no parts
+    parts = ((data.get("candidates") or [{}])[0].get("content") or {}).get("parts") or []
+    return "".join(p.get("text", "") for p in parts)
+
+
+class StreamMetrics:
+    """Per-process counters and recent time-to-first-token samples for streams."""
+
+    def __init__(self, samples: int = 1000):
+        self._lock = threading.Lock()
+        self._ttft_ms: deque[float] = deque(maxlen=samples)
+        self.started = 0
+        self.completed = 0
+        self.cancelled = 0
+        self.failed = 0
+
+    def record(self, outcome: str, ttft_ms: float | None = None) -> None:
+        with self._lock:
+            setattr(self, outcome, getattr(self, outcome) + 1)
+            if ttft_ms is not None:
+                self._ttft_ms.append(ttft_ms)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            samples = sorted(self._ttft_ms)
+            counts = {"started": self.started, "completed": self.completed, "cancelled": self.cancelled, "failed": self.failed}
+
+        def pct(q: float) -> float | None:
+            return round(samples[min(len(samples) - 1, int(q * len(samples)))], 1) if samples else None
+
+        return {**counts, "ttft_ms": {"samples": len(samples), "p50": pct(0.5), "p95": pct(0.95), "max": pct(1.0)}}
+
+
+class LlmClient:
+    def __init__(self):
+        self._client: httpx.AsyncClient | None = None
+
+    def start(self) -> None:
+        if self._client is not None:
+            return
+        self._client = httpx.AsyncClient(
+            base_url=settings.llm_base_url,
+            http2=_http2_available(),
+            limits=httpx.Limits(
+                max_connections=settings.llm_max_connections,
+                max_keepalive_connections=settings.llm_max_keepalive_connections,
+                keepalive_expiry=settings.llm_keepalive_expiry_seconds,
+            ),
+            timeout=httpx.Timeout(settings.llm_timeout_seconds, connect=settings.llm_connect_timeout_seconds),
+            headers={"Content-Type": "application/json"},
+        )
+
+    async def shutdown(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        # Outside the lifespan (scripts, tests without startup) open lazily
+        self.start()
+        return self._client
+
+    def check_configured(self) -> None:
+        if not settings.gemini_api_key:
+            raise HTTPException(status_code=400, detail="GEMINI_API_KEY not configured")
+
+    def _headers(self) -> dict:
+        self.check_configured()
+        return {"x-goog-api-key": settings.gemini_api_key}
+
+    async def post(self, path: str, payload: dict, timeout: float | None = None) -> dict:
+        """POST ``payload`` to ``path`` under the base URL, retrying transient failures."""
+        headers = self._headers()
+        kwargs = {"timeout": timeout} if timeout is not None else {}
+        for attempt in range(settings.llm_max_retries + 1):
+            last = attempt == settings.llm_max_retries
+            try:
+                r = await self.client.post(path, json=payload, headers=headers, **kwargs)
+            except httpx.TimeoutException:
+                if last:
+                    raise HTTPException(status_code=504, detail={"upstream": "timeout"})
+                await asyncio.sleep(backoff_delay(attempt))
+                continue
+            except httpx.TransportError as e:
+                if last:
+                    raise HTTPException(status_code=502, detail={"upstream": str(e) or type(e).__name__})
+                await asyncio.sleep(backoff_delay(attempt))
+                continue
+            if r.status_code in RETRY_STATUSES and not last:
+                await asyncio.sleep(backoff_delay(attempt, r.headers.get("Retry-After")))
+                continue
+            if r.status_code != 200:
+                raise HTTPException(status_code=502, detail={"upstream": r.text})
+            return r.json()
+        raise AssertionError("unreachable")
+
+    async def generate(
+        self,
+        prompt: str,
+        timeout: float | None = None,
+        model: str | None = None,
+        generation_config: dict | None = None,
+    ) -> str:
+        """Run a text-only ``generateContent`` call and return the first candidate's text."""
+        payload = {"contents": [{"parts": [{"text": prompt}]}]}
+        if generation_config:
+            payload["generationConfig"] = generation_config
+        data = await self.post(f"/models/{model or settings.llm_model}:generateContent", payload, timeout)
+        return extract_text(data)
+
+    async def stream(self, prompt: str, model: str | None = None) -> AsyncIterator[str]:
+        """Yield text deltas from ``streamGenerateContent`` as they arrive.
+
+        Failures before the first byte of a 200 response are retried like
+        ``post``; once text has been yielded an error is raised as-is. A
+        truncated or malformed event raises a 502 ``HTTPException``. Closing the
+        iterator (e.g. on client disconnect) closes the upstream stream too, so
+        the model stops generating.
+        """
+        headers = self._headers()
+        payload = {"contents": [{"parts": [{"text": prompt}]}]}
+        path = f"/models/{model or settings.llm_model}:streamGenerateContent"
+        yielded = False
+        for attempt in range(settings.llm_max_retries + 1):
+            last = attempt == settings.llm_max_retries
+            delay = None
+            try:
+                async with self.client.stream("POST", path, params={"alt": "sse"}, json=payload, headers=headers) as r:
+                    if r.status_code in RETRY_STATUSES and not last:
+                        delay = backoff_delay(attempt, r.headers.get("Retry-After"))
+                    elif r.status_code != 200:
+                        raise HTTPException(status_code=502, detail={"upstream": (await r.aread()).decode(errors="replace")})
+                    else:
+                        async for line in r.aiter_lines():
+                            if line.startswith("data:"):
+                                try:
+                                    text = _chunk_text(json.loads(line[5:]))
+                                except (ValueError, AttributeError, IndexError, TypeError):
+                                    raise HTTPException(status_code=502, detail={"upstream": f"malformed stream event: {line[:200]}"})
+                                if text:
+                                    yielded = True
+                                    yield text
+                        return
+            except httpx.TimeoutException:
+                if last or yielded:
+                    raise HTTPException(status_code=504, detail={"upstream": "timeout"})
+                delay = backoff_delay(attempt)
+            except httpx.TransportError as e:
+                if last or yielded:
+                    raise HTTPException(status_code=502, detail={"upstream": str(e) or type(e).__name__})
+                delay = backoff_delay(attempt)
+            await asyncio.sleep(delay)
+
+
+llm_client = LlmClient()
+stream_metrics = StreamMetrics()
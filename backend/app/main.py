@@ -1,13 +1,32 @@
+import asyncio
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
-from fastapi.staticfiles import StaticFiles
 import os
 from fastapi.middleware.cors import CORSMiddleware
 from app.core.settings import settings
-from app.routers import users, sops, teams, runs, suggestions, auth, admin, ai
+from app.routers import users, sops, teams, runs, suggestions, auth, admin, ai, imports, analytics
+from app.analytics import refresh_forever
+from app.imports import import_queue
+from app.llm import llm_client
+from app.media import MediaFiles, sweep_images_forever
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    import_queue.start()
+    llm_client.start()
+    refresher = asyncio.create_task(refresh_forever())
+    sweeper = asyncio.create_task(sweep_images_forever())
+    yield
+    refresher.cancel()
+    sweeper.cancel()
+    await llm_client.shutdown()
+    await import_queue.shutdown()
 
 
 def create_app() -> FastAPI:
-    app = FastAPI(title="SOP Hub API", version="0.1.0")
+    app = FastAPI(title="SOP Hub API", version="0.1.0", lifespan=lifespan)
 
     # CORS for frontend
     app.add_middleware(
@@ -16,6 +35,7 @@ def create_app() -> FastAPI:
         allow_credentials=True,
         allow_methods=["*"],
         allow_headers=["*"],
+        expose_headers=["X-Next-Cursor", "ETag", "X-Cache"],
     )
 
     @app.get("/", tags=["system"]) 
@@ -39,11 +59,14 @@ def create_app() -> FastAPI:
     app.include_router(auth.router)
     app.include_router(admin.router)
     app.include_router(ai.router)
+    app.include_router(imports.router)
+    app.include_router(analytics.router)
 
-    # Ensure media directories exist, then serve uploaded media (DOCX images)
+    # Ensure media directories exist, then serve uploaded media (DOCX images);
+    # content-addressed images are served with immutable cache headers
     os.makedirs("media/images", exist_ok=True)
     os.makedirs("media/uploads", exist_ok=True)
-    app.mount("/media", StaticFiles(directory="media"), name="media")
+    app.mount("/media", MediaFiles(directory="media"), name="media")
 
     return app
 
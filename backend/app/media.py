@@ -0,0 +1,219 @@
+"""Content-addressed storage for images extracted from imported SOPs.
+
+Blobs live at ``media/images/ab/cd/<sha256>.<ext>`` so identical images are written
+once no matter how many SOPs embed them. ``sop_images`` records which SOPs
+reference which blobs; it is derived from the stored HTML so edits that drop an
+image release the reference too.
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import re
+import time
+
+from sqlalchemy import delete, select
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+from starlette.staticfiles import StaticFiles
+
+from app.core.settings import settings
+from app.models.sop_image import SopImage
+
+
+log = logging.getLogger("app.media")
+
+
+IMAGES_DIR = "media/images"
+IMMUTABLE = "public, max-age=31536000, immutable"
+# Matches the run player's content column
+IMAGE_SIZES = "(max-width: 840px) 100vw, 840px"
+PICTURE_RE = re.compile(r'<img ([^>]*?)data-avif-srcset="([^"]*)"([^>]*)>')
+# Matches originals only; variants look like <sha>.w480.webp
+HASHED_SRC_RE = re.compile(r"/media/images/[0-9a-f]{2}/[0-9a-f]{2}/([0-9a-f]{64})\.([A-Za-z0-9-]+)(?![\w.-])")
+HASHED_FILE_RE = re.compile(r"images[\\/][0-9a-f]{2}[\\/][0-9a-f]{2}[\\/][0-9a-f]{64}\.")
+# Blobs touched this recently are never collected, which covers an import that
+# reuses a blob before its reference row is committed; ``sweep_images`` picks up
+# blobs skipped for being too recent
+GC_GRACE_SECONDS = 15 * 60
+BLOB_NAME_RE = re.compile(r"^([0-9a-f]{64})\.")
+SWEEP_BATCH = 1000
+
+
+def blob_relpath(sha: str, ext: str) -> str:
+    return f"{sha[:2]}/{sha[2:4]}/{sha}.{ext}"
+
+
+def _write_blob(path: str, data: bytes) -> None:
+    if os.path.exists(path):
+        os.utime(path)
+        return
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def store_image(data: bytes, ext: str, images_dir: str = IMAGES_DIR) -> str:
+    """Write ``data`` under its SHA-256 unless already present; return its URL."""
+    sha = hashlib.sha256(data).hexdigest()
+    rel = blob_relpath(sha, ext)
+    _write_blob(os.path.join(images_dir, rel), data)
+    return f"/media/images/{rel}"
+
+
+def image_attributes(data: bytes, src: str, images_dir: str = IMAGES_DIR) -> dict:
+    """Build <img> attributes for an imported image, writing resized variants.
+
+    With Pillow installed, bounded-width WebP (and AVIF where Pillow supports it)
+    variants are written next to the original and offered via ``srcset``; the
+    original stays as ``src`` for clients that ignore ``srcset``.
+    """
+    attrs = {"src": src, "loading": "lazy", "decoding": "async"}
+    try:
+        from PIL import Image, features
+    except ImportError:
+        return attrs
+    import io
+    try:
+        img = Image.open(io.BytesIO(data))
+        img.load()
+    except Exception:
+        # Formats Pillow cannot decode (EMF/WMF drawings) are served as-is
+        return attrs
+    attrs["width"] = str(img.width)
+    attrs["height"] = str(img.height)
+    if img.mode not in ("RGB", "RGBA"):
+        img = img.convert("RGBA" if "A" in img.getbands() or "transparency" in img.info else "RGB")
+    widths = sorted({w for w in settings.image_variant_widths if w < img.width} | {min(img.width, max(settings.image_variant_widths))})
+    formats = [("webp", "WEBP")] + ([("avif", "AVIF")] if features.check("avif") else [])
+    base = src.rsplit(".", 1)[0]
+    srcsets: dict[str, list[str]] = {}
+    for ext, fmt in formats:
+        for w in widths:
+            url = f"{base}.w{w}.{ext}"
+            path = os.path.join(images_dir, url.removeprefix("/media/images/"))
+            if os.path.exists(path):
+                os.utime(path)
+            else:
+                variant = img if w == img.width else img.resize((w, round(img.height * w / img.width)), Image.LANCZOS)
+                buf = io.BytesIO()
+                variant.save(buf, fmt, quality=settings.image_quality)
+                _write_blob(path, buf.getvalue())
+            srcsets.setdefault(ext, []).append(f"{url} {w}w")
+    attrs["srcset"] = ", ".join(srcsets["webp"])
+    attrs["sizes"] = IMAGE_SIZES
+    if "avif" in srcsets:
+        attrs["data-avif-srcset"] = ", ".join(srcsets["avif"])
+    return attrs
+
+
+def wrap_pictures(html: str) -> str:
+    """Turn <img data-avif-srcset=...> into <picture> with an AVIF <source>."""
+    def repl(m: re.Match) -> str:
+        img_attrs = (m.group(1) + m.group(3)).strip()
+        return (
+            f'<picture><source type="image/avif" srcset="{m.group(2)}" sizes="{IMAGE_SIZES}" />'
+            f"<img {img_attrs}></picture>"
+        )
+    return PICTURE_RE.sub(repl, html)
+
+
+def image_refs(html: str | None) -> set[tuple[str, str]]:
+    return set(HASHED_SRC_RE.findall(html or ""))
+
+
+def sync_sop_images(db: Session, sop_id: int, html: str | None) -> set[tuple[str, str]]:
+    """Point ``sop_id``'s references at the blobs its HTML uses. Caller commits.
+
+    Returns the (sha, ext) pairs the SOP no longer references, for ``collect_garbage``.
+    """
+    wanted = image_refs(html)
+    current = {(r.sha256, r.ext) for r in db.execute(select(SopImage).where(SopImage.sop_id == sop_id)).scalars()}
+    dropped = current - wanted
+    if dropped:
+        db.execute(delete(SopImage).where(SopImage.sop_id == sop_id, SopImage.sha256.in_([s for s, _ in dropped])))
+    for sha, ext in wanted - current:
+        db.add(SopImage(sop_id=sop_id, sha256=sha, ext=ext))
+    return dropped
+
+
+def sop_image_refs(db: Session, sop_id: int) -> set[tuple[str, str]]:
+    rows = db.execute(select(SopImage.sha256, SopImage.ext).where(SopImage.sop_id == sop_id)).all()
+    return {(r[0], r[1]) for r in rows}
+
+
+def collect_garbage(db: Session, candidates: set[tuple[str, str]], images_dir: str = IMAGES_DIR) -> int:
+    """Delete candidate blobs that no SOP references any more."""
+    if not candidates:
+        return 0
+    still_used = set(db.execute(
+        select(SopImage.sha256).where(SopImage.sha256.in_([s for s, _ in candidates]))
+    ).scalars())
+    cutoff = time.time() - GC_GRACE_SECONDS
+    removed = 0
+    for sha, ext in candidates:
+        if sha in still_used:
+            continue
+        folder = os.path.dirname(os.path.join(images_dir, blob_relpath(sha, ext)))
+        try:
+            entries = [e for e in os.scandir(folder) if e.name.startswith(f"{sha}.")]
+        except FileNotFoundError:
+            continue
+        # The original and all of its resized variants share the hash prefix
+        for entry in entries:
+            try:
+                if entry.stat().st_mtime < cutoff:
+                    os.remove(entry.path)
+                    removed += 1
+            except FileNotFoundError:
+                pass
+    return removed
+
+
+def sweep_images(db: Session, images_dir: str = IMAGES_DIR) -> int:
+    """Collect every unreferenced blob on disk, not just the candidates of one save."""
+    blobs: dict[str, str] = {}
+    for root, _, files in os.walk(images_dir):
+        for name in files:
+            m = BLOB_NAME_RE.match(name)
+            if m:
+                # Only the folder matters to collect_garbage, so any extension will do
+                blobs.setdefault(m.group(1), name.rsplit(".", 1)[-1])
+    shas = list(blobs)
+    removed = 0
+    for i in range(0, len(shas), SWEEP_BATCH):
+        batch = shas[i:i + SWEEP_BATCH]
+        used = set(db.execute(select(SopImage.sha256).where(SopImage.sha256.in_(batch))).scalars())
+        removed += collect_garbage(db, {(sha, blobs[sha]) for sha in batch if sha not in used}, images_dir)
+    return removed
+
+
+def _sweep_once() -> int:
+    from app.db import SessionLocal
+
+    with SessionLocal() as db:
+        return sweep_images(db)
+
+
+async def sweep_images_forever() -> None:
+    """Lifespan task: sweep every ``media_sweep_interval_seconds``."""
+    while True:
+        await asyncio.sleep(settings.media_sweep_interval_seconds)
+        try:
+            removed = await run_in_threadpool(_sweep_once)
+            if removed:
+                log.info("media sweep removed %d files", removed)
+        except Exception:
+            log.exception("media sweep failed")
+
+
+class MediaFiles(StaticFiles):
+    """StaticFiles that marks content-addressed images as immutable."""
+
+    def file_response(self, full_path, stat_result, scope, status_code=200):
+        response = super().file_response(full_path, stat_result, scope, status_code)
+        if HASHED_FILE_RE.search(str(full_path)):
+            response.headers["Cache-Control"] = IMMUTABLE
+        return response
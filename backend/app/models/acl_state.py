@@ -0,0 +1,17 @@
+from sqlalchemy import BigInteger, Integer
+from sqlalchemy.orm import Mapped, mapped_column
+
+from .base import Base
+
+
+class AclState(Base):
+    """Single row holding the ACL epoch embedded in access tokens.
+
+    Bumped by every change to a user's role or team memberships; tokens minted
+    under an older epoch fall back to database lookups until refreshed.
+    """
+
+    __tablename__ = "acl_state"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    epoch: Mapped[int] = mapped_column(BigInteger, default=1)
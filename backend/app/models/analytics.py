@@ -0,0 +1,58 @@
+from datetime import date, datetime
+
+from sqlalchemy import Date, DateTime, Float, ForeignKey, Integer, String
+from sqlalchemy.orm import Mapped, mapped_column
+
+from .base import Base
+
+
+# Daily rollups keyed by (sop_id, day of run start); maintained by app.analytics
+
+
+class RunDailyRollup(Base):
+    __tablename__ = "analytics_run_daily"
+
+    sop_id: Mapped[int] = mapped_column(Integer, ForeignKey("sops.id", ondelete="CASCADE"), primary_key=True)
+    day: Mapped[date] = mapped_column(Date, primary_key=True, index=True)
+    started: Mapped[int] = mapped_column(Integer, default=0)
+    completed: Mapped[int] = mapped_column(Integer, default=0)
+    passed: Mapped[int] = mapped_column(Integer, default=0)
+    failed: Mapped[int] = mapped_column(Integer, default=0)
+    duration_sum_s: Mapped[float] = mapped_column(Float, default=0.0)
+
+
+class RunDurationRollup(Base):
+    """Histogram of completed-run durations; ``bucket`` indexes DURATION_BOUNDS."""
+
+    __tablename__ = "analytics_run_durations"
+
+    sop_id: Mapped[int] = mapped_column(Integer, ForeignKey("sops.id", ondelete="CASCADE"), primary_key=True)
+    day: Mapped[date] = mapped_column(Date, primary_key=True, index=True)
+    bucket: Mapped[int] = mapped_column(Integer, primary_key=True)
+    runs: Mapped[int] = mapped_column(Integer, default=0)
+
+
+class StepDailyRollup(Base):
+    """Runs started that day that checked ``step_no``."""
+
+    __tablename__ = "analytics_step_daily"
+
+    sop_id: Mapped[int] = mapped_column(Integer, ForeignKey("sops.id", ondelete="CASCADE"), primary_key=True)
+    day: Mapped[date] = mapped_column(Date, primary_key=True, index=True)
+    step_no: Mapped[int] = mapped_column(Integer, primary_key=True)
+    runs: Mapped[int] = mapped_column(Integer, default=0)
+
+
+class SuggestionDailyRollup(Base):
+    __tablename__ = "analytics_suggestion_daily"
+
+    sop_id: Mapped[int] = mapped_column(Integer, ForeignKey("sops.id", ondelete="CASCADE"), primary_key=True)
+    day: Mapped[date] = mapped_column(Date, primary_key=True, index=True)
+    created: Mapped[int] = mapped_column(Integer, default=0)
+
+
+class RollupWatermark(Base):
+    __tablename__ = "analytics_watermarks"
+
+    name: Mapped[str] = mapped_column(String(64), primary_key=True)
+    value: Mapped[datetime] = mapped_column(DateTime)
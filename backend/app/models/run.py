@@ -1,4 +1,4 @@
-from sqlalchemy import ForeignKey, Integer, String, Boolean, DateTime
+from sqlalchemy import ForeignKey, Integer, String, Boolean, DateTime, Index, UniqueConstraint
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from datetime import datetime
 
@@ -7,20 +7,37 @@ from .base import Base
 
 class Run(Base):
     __tablename__ = "runs"
+    __table_args__ = (
+        # Keyset pagination filters (newest-first on id)
+        Index("ix_runs_sop_id_id", "sop_id", "id"),
+        Index("ix_runs_user_id_id", "user_id", "id"),
+        Index("ix_runs_started_at", "started_at"),
+        # Analytics refresh finds runs changed since its watermark
+        Index("ix_runs_updated_at", "updated_at"),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True, index=True)
     sop_id: Mapped[int] = mapped_column(ForeignKey("sops.id", ondelete="CASCADE"))
+    # SOP version being executed and its step count, fixed when the run starts;
+    # None for runs started before versions were pinned
+    sop_version: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    total_steps: Mapped[int | None] = mapped_column(Integer, nullable=True)
     user_id: Mapped[int] = mapped_column(Integer)
     started_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
     completed_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
     passed: Mapped[bool | None] = mapped_column(Boolean, nullable=True)
     exception_note: Mapped[str | None] = mapped_column(String(500), nullable=True)
+    updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
     steps = relationship("RunStep", back_populates="run", cascade="all, delete-orphan")
 
 
 class RunStep(Base):
     __tablename__ = "run_steps"
+    __table_args__ = (
+        # Upsert target for step check-ins
+        UniqueConstraint("run_id", "step_no", name="uq_run_step"),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True)
     run_id: Mapped[int] = mapped_column(ForeignKey("runs.id", ondelete="CASCADE"), index=True)
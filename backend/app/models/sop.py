@@ -1,12 +1,24 @@
-from sqlalchemy import String, Integer, Text
-from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy import String, Integer, Text, Index, Computed
+from sqlalchemy.dialects.postgresql import JSONB, TSVECTOR
 from sqlalchemy.orm import Mapped, mapped_column
 
 from .base import Base
 
 
+SEARCH_TSV_SQL = (
+    "setweight(to_tsvector('english', coalesce(title, '')), 'A') || "
+    "setweight(to_tsvector('english', coalesce(department, '')), 'B') || "
+    "setweight(to_tsvector('english', coalesce(content_md, '')), 'C')"
+)
+
+
 class Sop(Base):
     __tablename__ = "sops"
+    __table_args__ = (
+        Index("ix_sops_department_id", "department", "id"),
+        Index("ix_sops_status_id", "status", "id"),
+        Index("ix_sops_search_tsv", "search_tsv", postgresql_using="gin"),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True, index=True)
     sop_id: Mapped[str] = mapped_column(String(64), index=True, unique=True)
@@ -14,7 +26,8 @@ class Sop(Base):
     department: Mapped[str] = mapped_column(String(64), index=True)
     status: Mapped[str] = mapped_column(String(24), default="draft")
     version: Mapped[int] = mapped_column(Integer, default=1)
-    content_md: Mapped[str | None] = mapped_column(Text, nullable=True)
-    content_json: Mapped[dict | None] = mapped_column(JSONB, nullable=True)
-
-
+    # Bodies can run to hundreds of KB; only detail endpoints undefer the "body" group
+    content_md: Mapped[str | None] = mapped_column(Text, nullable=True, deferred=True, deferred_group="body")
+    content_json: Mapped[dict | None] = mapped_column(JSONB, nullable=True, deferred=True, deferred_group="body")
+    # Maintained by Postgres; backs GET /sops/search
+    search_tsv: Mapped[str | None] = mapped_column(TSVECTOR, Computed(SEARCH_TSV_SQL, persisted=True), deferred=True)
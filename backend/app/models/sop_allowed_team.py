@@ -1,4 +1,4 @@
-from sqlalchemy import Integer, ForeignKey, UniqueConstraint
+from sqlalchemy import Integer, ForeignKey, UniqueConstraint, Index
 from sqlalchemy.orm import Mapped, mapped_column
 
 from .base import Base
@@ -8,6 +8,8 @@ class SopAllowedTeam(Base):
     __tablename__ = "sop_allowed_teams"
     __table_args__ = (
         UniqueConstraint("sop_id", "team_id", name="uq_sop_allowed_team"),
+        # Lets visibility EXISTS subqueries walk from a user's teams to SOPs index-only
+        Index("ix_sop_allowed_teams_team_sop", "team_id", "sop_id"),
     )
 
     id: Mapped[int] = mapped_column(primary_key=True)
@@ -0,0 +1,16 @@
+from sqlalchemy import Integer, ForeignKey, String, UniqueConstraint
+from sqlalchemy.orm import Mapped, mapped_column
+
+from .base import Base
+
+
+class SopImage(Base):
+    __tablename__ = "sop_images"
+    __table_args__ = (
+        UniqueConstraint("sop_id", "sha256", name="uq_sop_image"),
+    )
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    sop_id: Mapped[int] = mapped_column(Integer, ForeignKey("sops.id", ondelete="CASCADE"))
+    sha256: Mapped[str] = mapped_column(String(64), index=True)
+    ext: Mapped[str] = mapped_column(String(16))
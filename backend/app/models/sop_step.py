@@ -0,0 +1,18 @@
+from sqlalchemy import Integer, ForeignKey, String, Text, UniqueConstraint
+from sqlalchemy.orm import Mapped, mapped_column
+
+from .base import Base
+
+
+class SopStep(Base):
+    __tablename__ = "sop_steps"
+    __table_args__ = (
+        UniqueConstraint("sop_id", "step_no", name="uq_sop_step"),
+    )
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    sop_id: Mapped[int] = mapped_column(Integer, ForeignKey("sops.id", ondelete="CASCADE"))
+    step_no: Mapped[int] = mapped_column(Integer)
+    title: Mapped[str] = mapped_column(String(255))
+    text: Mapped[str] = mapped_column(Text)
+    html: Mapped[str | None] = mapped_column(Text, nullable=True)
@@ -0,0 +1,28 @@
+from datetime import datetime
+
+from sqlalchemy import DateTime, ForeignKey, Integer, LargeBinary, String, UniqueConstraint
+from sqlalchemy.orm import Mapped, mapped_column
+
+from .base import Base
+
+
+class SopVersion(Base):
+    """One immutable version of an SOP, stored by ``app.versions``.
+
+    ``kind`` is "snapshot" (zlib-compressed document) or "delta" (zlib-compressed
+    edit script against the previous version).
+    """
+
+    __tablename__ = "sop_versions"
+    __table_args__ = (
+        UniqueConstraint("sop_id", "version", name="uq_sop_version"),
+    )
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    sop_id: Mapped[int] = mapped_column(Integer, ForeignKey("sops.id", ondelete="CASCADE"))
+    version: Mapped[int] = mapped_column(Integer)
+    kind: Mapped[str] = mapped_column(String(16))
+    data: Mapped[bytes] = mapped_column(LargeBinary)
+    # Uncompressed size of the full document at this version
+    size: Mapped[int] = mapped_column(Integer)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
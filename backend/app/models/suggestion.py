@@ -1,4 +1,6 @@
-from sqlalchemy import ForeignKey, String
+from datetime import datetime
+
+from sqlalchemy import DateTime, ForeignKey, Integer, String, Index
 from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import Mapped, mapped_column
 
@@ -7,6 +9,11 @@ from .base import Base
 
 class Suggestion(Base):
     __tablename__ = "suggestions"
+    __table_args__ = (
+        Index("ix_suggestions_status_id", "status", "id"),
+        Index("ix_suggestions_sop_id_id", "sop_id", "id"),
+        Index("ix_suggestions_created_at", "created_at"),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True)
     sop_id: Mapped[int] = mapped_column(ForeignKey("sops.id", ondelete="CASCADE"), index=True)
@@ -14,6 +21,12 @@ class Suggestion(Base):
     raw_text: Mapped[str] = mapped_column(String(2000))
     ai_summary: Mapped[str | None] = mapped_column(String(1000), nullable=True)
     ai_changeset_json: Mapped[dict | None] = mapped_column(JSONB, nullable=True)
+    # queued -> triaging -> review (then merged/rejected by a reviewer); dead after repeated failures
     status: Mapped[str] = mapped_column(String(16), default="queued")
-
-
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    attempts: Mapped[int] = mapped_column(Integer, default=0, server_default="0")
+    last_error: Mapped[str | None] = mapped_column(String(1000), nullable=True)
+    # Lease start while triaging; a claim older than the lease may be taken over
+    claimed_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
+    # Earliest time a retried suggestion may be claimed again
+    available_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
@@ -0,0 +1,26 @@
+from fastapi import Response
+
+from app.core.settings import settings
+
+
+def keyset_page(stmt, id_col, limit: int, cursor: int | None):
+    """Apply newest-first keyset pagination on ``id_col``.
+
+    Fetches one extra row so ``finish_page`` can tell whether another page exists
+    without a COUNT query.
+    """
+    if cursor is not None:
+        stmt = stmt.where(id_col < cursor)
+    return stmt.order_by(id_col.desc()).limit(limit + 1)
+
+
+def finish_page(rows: list, limit: int, response: Response) -> list:
+    """Trim the look-ahead row and advertise the next cursor via ``X-Next-Cursor``."""
+    if len(rows) > limit:
+        rows = rows[:limit]
+        response.headers["X-Next-Cursor"] = str(rows[-1].id)
+    return rows
+
+
+DEFAULT_LIMIT = settings.page_default_limit
+MAX_LIMIT = settings.page_max_limit
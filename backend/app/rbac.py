@@ -1,14 +1,139 @@
-from sqlalchemy import select
+from dataclasses import dataclass
+
+from fastapi import HTTPException
+from sqlalchemy import select, update
 from sqlalchemy.orm import Session
 
+from app.core.cache import TTLCache
+from app.core.settings import settings
 from app.models.user_team import UserTeam
 from app.models.sop_allowed_team import SopAllowedTeam
 from app.models.user import User
+from app.models.acl_state import AclState
+
+
+# Cross-request caches; admin mutations call invalidate_user / invalidate_sop
+_user_cache = TTLCache(maxsize=settings.rbac_cache_max_entries, ttl=settings.rbac_cache_ttl_seconds)
+_sop_cache = TTLCache(maxsize=settings.rbac_cache_max_entries, ttl=settings.rbac_cache_ttl_seconds)
+_epoch_cache = TTLCache(maxsize=1, ttl=settings.acl_epoch_check_seconds)
+
+
+@dataclass(frozen=True)
+class AuthContext:
+    """Role and team memberships of the calling user, resolved once per request."""
+
+    user_id: int
+    role: str | None
+    team_ids: frozenset[int]
+
+    @property
+    def is_admin(self) -> bool:
+        return self.role == "admin"
+
+    def can_view_sop(self, db: Session, sop_id: int) -> bool:
+        if self.is_admin:
+            return True
+        allowed = sop_team_ids(db, sop_id)
+        if not allowed or not self.team_ids:
+            return False
+        return bool(self.team_ids & allowed)
+
+    def assert_can_view_sop(self, db: Session, sop_id: int) -> None:
+        if not self.can_view_sop(db, sop_id):
+            raise HTTPException(status_code=403, detail="Forbidden: SOP not assigned to your teams")
+
+
+def load_auth_context(db: Session, user_id: int) -> AuthContext:
+    ctx = _user_cache.get(user_id)
+    if ctx is None:
+        role = db.execute(select(User.role).where(User.id == user_id)).scalar_one_or_none()
+        rows = db.execute(select(UserTeam.team_id).where(UserTeam.user_id == user_id)).all()
+        ctx = AuthContext(user_id=user_id, role=role, team_ids=frozenset(r[0] for r in rows))
+        _user_cache.set(user_id, ctx)
+    return ctx
+
+
+def acl_epoch(db: Session) -> int:
+    """Current ACL epoch; read at most once per ``acl_epoch_check_seconds`` per worker."""
+    epoch = _epoch_cache.get("epoch")
+    if epoch is None:
+        epoch = db.execute(select(AclState.epoch).where(AclState.id == 1)).scalar_one_or_none() or 0
+        _epoch_cache.set("epoch", epoch)
+    return epoch
+
+
+def bump_acl_epoch(db: Session) -> None:
+    """Retire the team/role claims of every issued token; call before commit."""
+    db.execute(update(AclState).where(AclState.id == 1).values(epoch=AclState.epoch + 1))
+
+
+def auth_context_for(db: Session, claims: dict) -> AuthContext:
+    """Trust the token's role and teams while its ACL epoch is current, else load them."""
+    user_id = int(claims["sub"])
+    if "teams" in claims and claims.get("acl_epoch") == acl_epoch(db):
+        return AuthContext(user_id=user_id, role=claims.get("role"), team_ids=frozenset(claims["teams"]))
+    return load_auth_context(db, user_id)
+
+
+def sop_team_ids(db: Session, sop_id: int) -> frozenset[int]:
+    allowed = _sop_cache.get(sop_id)
+    if allowed is None:
+        rows = db.execute(select(SopAllowedTeam.team_id).where(SopAllowedTeam.sop_id == sop_id)).all()
+        allowed = frozenset(r[0] for r in rows)
+        _sop_cache.set(sop_id, allowed)
+    return allowed
+
+
+def invalidate_user(user_id: int) -> None:
+    _user_cache.pop(user_id)
+    # After the commit, so this worker cannot re-read the pre-bump epoch
+    _epoch_cache.pop("epoch")
+
+
+def invalidate_sop(sop_id: int) -> None:
+    _sop_cache.pop(sop_id)
 
 
 def user_team_ids(db: Session, user_id: int) -> set[int]:
-    rows = db.execute(select(UserTeam.team_id).where(UserTeam.user_id == user_id)).all()
-    return {r[0] for r in rows}
+    return set(load_auth_context(db, user_id).team_ids)
+
+
+def shares_team_clause(user_id: int, sop_id_col):
+    """EXISTS clause: the user is in at least one team the SOP is assigned to.
+
+    Correlates against ``sop_id_col`` (e.g. ``Sop.id`` or ``Run.sop_id``) so the
+    ACL check runs inside the caller's query instead of in Python.
+    """
+    return (
+        select(SopAllowedTeam.id)
+        .join(UserTeam, UserTeam.team_id == SopAllowedTeam.team_id)
+        .where(SopAllowedTeam.sop_id == sop_id_col, UserTeam.user_id == user_id)
+        .exists()
+    )
+
+
+def unrestricted_clause(sop_id_col):
+    """NOT EXISTS clause: the SOP has no team assignments at all."""
+    return ~select(SopAllowedTeam.id).where(SopAllowedTeam.sop_id == sop_id_col).exists()
+
+
+def has_visible_sops_clause(user_id: int):
+    """Uncorrelated EXISTS: the user shares a team with at least one SOP."""
+    return (
+        select(SopAllowedTeam.id)
+        .join(UserTeam, UserTeam.team_id == SopAllowedTeam.team_id)
+        .where(UserTeam.user_id == user_id)
+        .exists()
+    )
+
+
+def suggestion_visible_clause(user_id: int, sop_id_col):
+    """Suggestions a non-admin may see, correlated against ``sop_id_col``.
+
+    Users with visible SOPs see only those; everyone else falls back to SOPs
+    without team assignments.
+    """
+    return shares_team_clause(user_id, sop_id_col) | (unrestricted_clause(sop_id_col) & ~has_visible_sops_clause(user_id))
 
 
 def can_view_sop(db: Session, user_id: int, sop_id: int) -> bool:
@@ -17,22 +142,8 @@ def can_view_sop(db: Session, user_id: int, sop_id: int) -> bool:
     - Admins can view everything
     - Otherwise, user must share a team with SOP (SOPs without explicit teams are hidden by default)
     """
-    role = db.execute(select(User.role).where(User.id == user_id)).scalar_one_or_none()
-    if role == "admin":
-        return True
-    rows = db.execute(select(SopAllowedTeam.team_id).where(SopAllowedTeam.sop_id == sop_id)).all()
-    allowed = {r[0] for r in rows}
-    if not allowed:
-        return False
-    u_teams = user_team_ids(db, user_id)
-    if not u_teams:
-        return False
-    return bool(u_teams & allowed)
+    return load_auth_context(db, user_id).can_view_sop(db, sop_id)
 
 
 def assert_can_view_sop(db: Session, user_id: int, sop_id: int) -> None:
-    if not can_view_sop(db, user_id, sop_id):
-        from fastapi import HTTPException
-        raise HTTPException(status_code=403, detail="Forbidden: SOP not assigned to your teams")
-
-
+    load_auth_context(db, user_id).assert_can_view_sop(db, sop_id)
@@ -1,86 +1,120 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 
-from app.db import get_db
+from app.db import get_async_db, get_db, pool_status
 from app.models.user import User
 from app.models.team import Team
 from app.models.user_team import UserTeam
 from app.models.sop_allowed_team import SopAllowedTeam
 from app.deps import require_roles
+from app.rbac import bump_acl_epoch, invalidate_user, invalidate_sop
+from app.semantic import SemanticUnavailable, rebuild_index
+from app.media import sweep_images
 
 
 router = APIRouter(prefix="/admin", tags=["admin"], dependencies=[Depends(require_roles("admin"))])
 
 
 @router.post("/users/{user_id}/role")
-def set_user_role(user_id: int, role: str, db: Session = Depends(get_db)):
-    user = db.get(User, user_id)
+async def set_user_role(user_id: int, role: str, db: AsyncSession = Depends(get_async_db)):
+    user = await db.get(User, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     user.role = role
-    db.commit()
+    await db.run_sync(bump_acl_epoch)
+    await db.commit()
+    invalidate_user(user_id)
     return {"ok": True, "user_id": user_id, "role": role}
 
 
 @router.post("/users/{user_id}/teams")
-def assign_user_team(user_id: int, team_id: int, db: Session = Depends(get_db)):
-    if not db.get(User, user_id):
+async def assign_user_team(user_id: int, team_id: int, db: AsyncSession = Depends(get_async_db)):
+    if not await db.get(User, user_id):
         raise HTTPException(status_code=404, detail="User not found")
-    if not db.get(Team, team_id):
+    if not await db.get(Team, team_id):
         raise HTTPException(status_code=404, detail="Team not found")
-    exists = db.execute(select(UserTeam).where(UserTeam.user_id == user_id, UserTeam.team_id == team_id)).scalar_one_or_none()
+    exists = (await db.execute(select(UserTeam).where(UserTeam.user_id == user_id, UserTeam.team_id == team_id))).scalar_one_or_none()
     if exists:
         return {"ok": True, "user_id": user_id, "team_id": team_id}
     link = UserTeam(user_id=user_id, team_id=team_id)
     db.add(link)
-    db.commit()
+    await db.run_sync(bump_acl_epoch)
+    await db.commit()
+    invalidate_user(user_id)
     return {"ok": True, "user_id": user_id, "team_id": team_id}
 
 
 @router.get("/users/{user_id}/teams")
-def list_user_teams(user_id: int, db: Session = Depends(get_db)):
-    rows = db.execute(select(Team).join(UserTeam, UserTeam.team_id == Team.id).where(UserTeam.user_id == user_id)).scalars().all()
+async def list_user_teams(user_id: int, db: AsyncSession = Depends(get_async_db)):
+    rows = (await db.execute(select(Team).join(UserTeam, UserTeam.team_id == Team.id).where(UserTeam.user_id == user_id))).scalars().all()
     return rows
 
 
 @router.delete("/users/{user_id}/teams")
-def remove_user_team(user_id: int, team_id: int, db: Session = Depends(get_db)):
-    link = db.execute(select(UserTeam).where(UserTeam.user_id == user_id, UserTeam.team_id == team_id)).scalar_one_or_none()
+async def remove_user_team(user_id: int, team_id: int, db: AsyncSession = Depends(get_async_db)):
+    link = (await db.execute(select(UserTeam).where(UserTeam.user_id == user_id, UserTeam.team_id == team_id))).scalar_one_or_none()
     if not link:
         return {"ok": True}
-    db.delete(link)
-    db.commit()
+    await db.delete(link)
+    await db.run_sync(bump_acl_epoch)
+    await db.commit()
+    invalidate_user(user_id)
     return {"ok": True}
 
 @router.post("/sops/{sop_id}/teams")
-def assign_sop_team(sop_id: int, team_id: int, db: Session = Depends(get_db)):
+async def assign_sop_team(sop_id: int, team_id: int, db: AsyncSession = Depends(get_async_db)):
     # ensure sop exists via get
     from app.models.sop import Sop
-    if not db.get(Sop, sop_id):
+    if not await db.get(Sop, sop_id):
         raise HTTPException(status_code=404, detail="SOP not found")
-    if not db.get(Team, team_id):
+    if not await db.get(Team, team_id):
         raise HTTPException(status_code=404, detail="Team not found")
-    exists = db.execute(select(SopAllowedTeam).where(SopAllowedTeam.sop_id == sop_id, SopAllowedTeam.team_id == team_id)).scalar_one_or_none()
+    exists = (await db.execute(select(SopAllowedTeam).where(SopAllowedTeam.sop_id == sop_id, SopAllowedTeam.team_id == team_id))).scalar_one_or_none()
     if exists:
         return {"ok": True, "sop_id": sop_id, "team_id": team_id}
     link = SopAllowedTeam(sop_id=sop_id, team_id=team_id)
     db.add(link)
-    db.commit()
+    await db.commit()
+    invalidate_sop(sop_id)
     return {"ok": True, "sop_id": sop_id, "team_id": team_id}
 
 
 @router.get("/sops/{sop_id}/teams")
-def list_sop_teams(sop_id: int, db: Session = Depends(get_db)):
-    rows = db.execute(select(Team).join(SopAllowedTeam, SopAllowedTeam.team_id == Team.id).where(SopAllowedTeam.sop_id == sop_id)).scalars().all()
+async def list_sop_teams(sop_id: int, db: AsyncSession = Depends(get_async_db)):
+    rows = (await db.execute(select(Team).join(SopAllowedTeam, SopAllowedTeam.team_id == Team.id).where(SopAllowedTeam.sop_id == sop_id))).scalars().all()
     return rows
 
 
 @router.delete("/sops/{sop_id}/teams")
-def remove_sop_team(sop_id: int, team_id: int, db: Session = Depends(get_db)):
-    link = db.execute(select(SopAllowedTeam).where(SopAllowedTeam.sop_id == sop_id, SopAllowedTeam.team_id == team_id)).scalar_one_or_none()
+async def remove_sop_team(sop_id: int, team_id: int, db: AsyncSession = Depends(get_async_db)):
+    link = (await db.execute(select(SopAllowedTeam).where(SopAllowedTeam.sop_id == sop_id, SopAllowedTeam.team_id == team_id))).scalar_one_or_none()
     if not link:
         return {"ok": True}
-    db.delete(link)
-    db.commit()
+    await db.delete(link)
+    await db.commit()
+    invalidate_sop(sop_id)
     return {"ok": True}
+
+
+# Re-embedding every SOP is CPU-bound, so this one stays sync and runs in the threadpool
+@router.post("/semantic-index/rebuild")
+def rebuild_semantic_index(db: Session = Depends(get_db)):
+    try:
+        sections = rebuild_index(db)
+    except SemanticUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    return {"ok": True, "sections": sections}
+
+
+# Walks the whole image directory, so this one stays sync and runs in the threadpool
+@router.post("/media/gc")
+def collect_media_garbage(db: Session = Depends(get_db)):
+    return {"ok": True, "removed": sweep_images(db)}
+
+
+@router.get("/db/pool")
+async def db_pool_status():
+    """Connection pool saturation for the worker that serves the request."""
+    return pool_status()
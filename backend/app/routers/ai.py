@@ -1,11 +1,29 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+import asyncio
+import json
+import logging
+import time
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
+from starlette.concurrency import run_in_threadpool
+
+from app.ai_cache import cache_key, response_cache
 from app.core.settings import settings
-import httpx
+from app.deps import require_roles
+from app.llm import llm_client, stream_metrics
+from app.segmentation import split_for_llm
 
 
+log = logging.getLogger("app.routers.ai")
+
 router = APIRouter(prefix="/ai", tags=["ai"])
 
+# Bump when a prompt template changes so cached responses are not reused
+DRAFT_PROMPT_VERSION = 1
+CLEAN_PROMPT_VERSION = 1
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
 
 class DraftBody(BaseModel):
     title: str
@@ -13,11 +31,8 @@ class DraftBody(BaseModel):
     outline: str | None = None
 
 
-@router.post("/draft")
-async def ai_draft(body: DraftBody):
-    if not settings.gemini_api_key:
-        raise HTTPException(status_code=400, detail="GEMINI_API_KEY not configured")
-    prompt = f"""
+def draft_prompt(body: DraftBody) -> str:
+    return f"""
 You are an expert SOP writer. Create a clean SOP draft in the Standard SOP Format.
 Input:
 - Title: {body.title}
@@ -27,23 +42,115 @@ Output:
 - Use headings (Purpose, Scope, Roles & RACI, Prerequisites, Tools & Access, Procedure with numbered steps, Quality Standard / Acceptance Criteria, Common Errors & Fixes, Templates & Links, Change Log, Next Review).
 - Use imperative voice. Keep steps concise and unambiguous.
 """
-    # Minimal Gemini call (text‑only); replace with official SDK if desired
-    url = "https://generativelanguage.googleapis.com/v1beta/models/gemini-1.5-flash:generateContent"
-    headers = {"Content-Type": "application/json"}
-    payload = {
-        "contents": [{"parts": [{"text": prompt}]}]
-    }
-    params = {"key": settings.gemini_api_key}
-    async with httpx.AsyncClient(timeout=60) as client:
-        r = await client.post(url, headers=headers, params=params, json=payload)
-    if r.status_code != 200:
-        raise HTTPException(status_code=502, detail={"upstream": r.text})
-    data = r.json()
-    try:
-        text = data["candidates"][0]["content"]["parts"][0]["text"]
-    except Exception:
-        raise HTTPException(status_code=502, detail={"upstream": data})
-    return {"title": body.title, "department": body.department, "draft_md": text}
+
+
+async def _cached(kind: str, version: int, inputs: dict, bypass: bool, response: Response, produce) -> dict:
+    """Serve ``kind`` from the response cache, calling ``produce()`` on a miss.
+
+    ``bypass`` skips the lookup but still stores the fresh result. The outcome is
+    reported in the ``X-Cache`` header (HIT, MISS or BYPASS).
+    """
+    key = cache_key(kind, version, settings.llm_model, inputs)
+    if bypass:
+        response_cache.record_bypass()
+    else:
+        hit = await run_in_threadpool(response_cache.get, key)
+        if hit is not None:
+            response.headers["X-Cache"] = "HIT"
+            return hit
+    result = await produce()
+    await run_in_threadpool(response_cache.set, key, kind, result)
+    response.headers["X-Cache"] = "BYPASS" if bypass else "MISS"
+    return result
+
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+async def _streamed(kind: str, version: int, inputs: dict, bypass: bool, chunks, field: str, wrap) -> StreamingResponse:
+    """Stream a completion as Server-Sent Events, sharing the response cache.
+
+    ``chunks()`` returns the async iterator of text deltas used on a miss.
+    Emits ``delta`` events ({"text"}), then ``done`` ({"ttft_ms", "total_ms",
+    "cache"}) or ``error`` ({"status", "detail"}). A cache hit is replayed as a
+    single delta. When the client disconnects Starlette cancels the generator,
+    which closes the upstream stream; the partial text is not cached.
+    """
+    key = cache_key(kind, version, settings.llm_model, inputs)
+    hit = None
+    if bypass:
+        response_cache.record_bypass()
+    else:
+        hit = await run_in_threadpool(response_cache.get, key)
+    if hit is None:
+        # Fail with a plain status before the event stream starts
+        llm_client.check_configured()
+
+    async def events():
+        started = time.perf_counter()
+        if hit is not None:
+            yield _sse("delta", {"text": hit[field]})
+            yield _sse("done", {"ttft_ms": 0, "total_ms": 0, "cache": "HIT"})
+            return
+        stream_metrics.record("started")
+        ttft_ms = None
+        parts: list[str] = []
+        try:
+            async for text in chunks():
+                if ttft_ms is None:
+                    ttft_ms = (time.perf_counter() - started) * 1000
+                parts.append(text)
+                yield _sse("delta", {"text": text})
+        except HTTPException as e:
+            stream_metrics.record("failed", ttft_ms)
+            yield _sse("error", {"status": e.status_code, "detail": e.detail})
+            return
+        except (asyncio.CancelledError, GeneratorExit):
+            stream_metrics.record("cancelled", ttft_ms)
+            raise
+        except Exception:
+            # The 200 status is already sent, so report it in-band like an upstream failure
+            log.exception("%s stream failed", kind)
+            stream_metrics.record("failed", ttft_ms)
+            yield _sse("error", {"status": 500, "detail": "Internal Server Error"})
+            return
+        stream_metrics.record("completed", ttft_ms)
+        await run_in_threadpool(response_cache.set, key, kind, wrap("".join(parts)))
+        yield _sse("done", {
+            "ttft_ms": round(ttft_ms or 0, 1),
+            "total_ms": round((time.perf_counter() - started) * 1000, 1),
+            "cache": "BYPASS" if bypass else "MISS",
+        })
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+
+@router.post("/draft")
+async def ai_draft(
+    body: DraftBody,
+    response: Response,
+    cache: str | None = Query(None, pattern="^bypass$", description="Set to 'bypass' to force regeneration"),
+):
+    async def produce():
+        text = await llm_client.generate(draft_prompt(body), timeout=60)
+        return {"title": body.title, "department": body.department, "draft_md": text}
+
+    return await _cached("draft", DRAFT_PROMPT_VERSION, body.model_dump(), cache == "bypass", response, produce)
+
+
+@router.post("/draft/stream")
+async def ai_draft_stream(
+    body: DraftBody,
+    cache: str | None = Query(None, pattern="^bypass$", description="Set to 'bypass' to force regeneration"),
+):
+    def wrap(text: str) -> dict:
+        return {"title": body.title, "department": body.department, "draft_md": text}
+
+    return await _streamed(
+        "draft", DRAFT_PROMPT_VERSION, body.model_dump(), cache == "bypass",
+        lambda: llm_client.stream(draft_prompt(body)), "draft_md", wrap,
+    )
 
 
 class CleanBody(BaseModel):
@@ -53,35 +160,119 @@ class CleanBody(BaseModel):
     notes: str | None = None
 
 
-@router.post("/clean")
-async def ai_clean(body: CleanBody):
-    if not settings.gemini_api_key:
-        raise HTTPException(status_code=400, detail="GEMINI_API_KEY not configured")
-    source = body.text_md or body.text_html or ""
-    if not source:
-        raise HTTPException(status_code=422, detail="Provide text_md or text_html")
-    prompt = f"""
+def clean_prompt(source: str, department: str | None, notes: str | None) -> str:
+    return f"""
 You are an SOP standardizer. Rewrite the provided content into the Standard SOP Format sections.
-Department: {body.department or '(unspecified)'}
+Department: {department or '(unspecified)'}
 Guidelines: Use imperative voice, concise numbered steps, QA criteria, and keep tables/bullets where helpful.
-Additional notes: {body.notes or '(none)'}
+Additional notes: {notes or '(none)'}
 
 CONTENT START\n{source}\nCONTENT END
 Return clean markdown/plain text with clear section headings.
 """
-    url = "https://generativelanguage.googleapis.com/v1beta/models/gemini-1.5-flash:generateContent"
-    headers = {"Content-Type": "application/json"}
-    payload = {"contents": [{"parts": [{"text": prompt}]}]}
-    params = {"key": settings.gemini_api_key}
-    async with httpx.AsyncClient(timeout=90) as client:
-        r = await client.post(url, headers=headers, params=params, json=payload)
-    if r.status_code != 200:
-        raise HTTPException(status_code=502, detail={"upstream": r.text})
-    data = r.json()
+
+
+def clean_section_prompt(section: str, department: str | None, notes: str | None) -> str:
+    return f"""
+You are an SOP standardizer. The content below is one section of a longer SOP that is being cleaned section by section.
+Rewrite only this section in the Standard SOP Format style, keeping its heading.
+Department: {department or '(unspecified)'}
+Guidelines: Use imperative voice, concise numbered steps, and keep tables/bullets where helpful. Do not add an introduction, summary or sections that are not in the content.
+Additional notes: {notes or '(none)'}
+
+CONTENT START\n{section}\nCONTENT END
+Return clean markdown/plain text.
+"""
+
+
+def _clean_source(body: CleanBody) -> tuple[str, list[str]]:
+    """Return the source text and the sections to clean (one when it fits a single call)."""
+    source = body.text_md or body.text_html or ""
+    if not source:
+        raise HTTPException(status_code=422, detail="Provide text_md or text_html")
+    if len(source) <= settings.ai_clean_section_chars:
+        return source, [source]
+    return source, split_for_llm(source, not body.text_md, settings.ai_clean_section_chars)
+
+
+async def _clean_section(section: str, body: CleanBody, bypass: bool, semaphore: asyncio.Semaphore) -> str:
+    # Keyed on the section alone, so unchanged sections hit even when others were edited
+    key = cache_key("clean-section", CLEAN_PROMPT_VERSION, settings.llm_model,
+                    {"source": section, "department": body.department, "notes": body.notes})
+    if not bypass:
+        hit = await run_in_threadpool(response_cache.get, key)
+        if hit is not None:
+            return hit["clean_md"]
+    async with semaphore:
+        text = await llm_client.generate(clean_section_prompt(section, body.department, body.notes))
+    await run_in_threadpool(response_cache.set, key, "clean-section", {"clean_md": text})
+    return text
+
+
+async def _clean_sections(sections: list[str], body: CleanBody, bypass: bool):
+    """Clean sections concurrently (bounded by ``ai_clean_concurrency``), yielding in order."""
+    semaphore = asyncio.Semaphore(settings.ai_clean_concurrency)
+    tasks = [asyncio.ensure_future(_clean_section(s, body, bypass, semaphore)) for s in sections]
+    for task in tasks:
+        # Retrieve exceptions of tasks abandoned after an earlier failure
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
     try:
-        text = data["candidates"][0]["content"]["parts"][0]["text"]
-    except Exception:
-        raise HTTPException(status_code=502, detail={"upstream": data})
-    return {"clean_md": text}
+        for i, task in enumerate(tasks):
+            text = (await task).strip()
+            yield f"\n\n{text}" if i else text
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+def _clean_chunks(source: str, sections: list[str], body: CleanBody, bypass: bool):
+    if len(sections) == 1:
+        return llm_client.stream(clean_prompt(source, body.department, body.notes))
+    return _clean_sections(sections, body, bypass)
+
+
+@router.post("/clean")
+async def ai_clean(
+    body: CleanBody,
+    response: Response,
+    cache: str | None = Query(None, pattern="^bypass$", description="Set to 'bypass' to force regeneration"),
+):
+    """Clean a document; long ones are split on headings and cleaned section by section."""
+    source, sections = _clean_source(body)
+    bypass = cache == "bypass"
+
+    async def produce():
+        if len(sections) == 1:
+            text = await llm_client.generate(clean_prompt(source, body.department, body.notes))
+        else:
+            text = "".join([part async for part in _clean_sections(sections, body, bypass)])
+        return {"clean_md": text}
+
+    inputs = {"source": source, "department": body.department, "notes": body.notes}
+    return await _cached("clean", CLEAN_PROMPT_VERSION, inputs, bypass, response, produce)
+
+
+@router.post("/clean/stream")
+async def ai_clean_stream(
+    body: CleanBody,
+    cache: str | None = Query(None, pattern="^bypass$", description="Set to 'bypass' to force regeneration"),
+):
+    source, sections = _clean_source(body)
+    bypass = cache == "bypass"
+    inputs = {"source": source, "department": body.department, "notes": body.notes}
+    return await _streamed(
+        "clean", CLEAN_PROMPT_VERSION, inputs, bypass,
+        lambda: _clean_chunks(source, sections, body, bypass), "clean_md", lambda text: {"clean_md": text},
+    )
+
+
+@router.get("/cache/stats", dependencies=[Depends(require_roles("admin"))])
+def ai_cache_stats():
+    """Counters are per worker process; entries and bytes cover the shared store."""
+    return response_cache.stats()
 
 
+@router.get("/stream/stats", dependencies=[Depends(require_roles("admin"))])
+def ai_stream_stats():
+    """Per-process stream outcomes and time-to-first-token percentiles."""
+    return stream_metrics.snapshot()
@@ -0,0 +1,225 @@
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy import Date, cast, func, select
+from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.analytics import median_from_histogram, refresh_rollups
+from app.db import get_async_db, get_db
+from app.deps import get_current_user, get_auth_context, require_roles
+from app.models.analytics import RunDailyRollup, RunDurationRollup, StepDailyRollup, SuggestionDailyRollup
+from app.models.sop import Sop
+from app.models.sop_allowed_team import SopAllowedTeam
+from app.models.sop_step import SopStep
+from app.models.suggestion import Suggestion
+from app.models.team import Team
+from app.rbac import AuthContext, shares_team_clause, suggestion_visible_clause
+from app.schemas.analytics import AnalyticsOverview, RunMetrics, RunMetricsRow, StepDropOff, StepFunnel
+
+
+router = APIRouter(prefix="/analytics", tags=["analytics"])
+
+DEFAULT_DAYS = 90
+GROUP_BY = "^(none|sop|department|team)$"
+BUCKET = "^(none|day|week|month)$"
+CLOSED_SUGGESTION_STATUSES = ("merged", "rejected")
+
+
+def _window(date_from: date | None, date_to: date | None) -> tuple[date, date]:
+    date_to = date_to or datetime.utcnow().date()
+    return date_from or date_to - timedelta(days=DEFAULT_DAYS - 1), date_to
+
+
+def _ratio(num: float, den: float) -> float | None:
+    return round(num / den, 4) if den else None
+
+
+def _grouped(model, ctx: AuthContext, group_by: str, bucket: str, window: tuple[date, date],
+             sop_id: int | None, department: str | None, team_id: int | None, *measures):
+    """Aggregate ``measures`` of a rollup table by group key and time bucket.
+
+    Rows are (key, label, period, *measures). Grouping by team counts a SOP
+    once for every team it is assigned to.
+    """
+    dims = []
+    if group_by == "sop":
+        dims += [model.sop_id, Sop.title]
+    elif group_by == "department":
+        dims += [Sop.department, Sop.department]
+    elif group_by == "team":
+        dims += [SopAllowedTeam.team_id, Team.name]
+    if bucket != "none":
+        dims.append(cast(func.date_trunc(bucket, model.day), Date))
+    stmt = (
+        select(*dims, *measures)
+        .join(Sop, Sop.id == model.sop_id)
+        .where(model.day.between(*window))
+    )
+    if group_by == "team" or team_id is not None:
+        stmt = stmt.join(SopAllowedTeam, SopAllowedTeam.sop_id == model.sop_id)
+    if group_by == "team":
+        stmt = stmt.join(Team, Team.id == SopAllowedTeam.team_id)
+    if team_id is not None:
+        stmt = stmt.where(SopAllowedTeam.team_id == team_id)
+    if sop_id is not None:
+        stmt = stmt.where(model.sop_id == sop_id)
+    if department:
+        stmt = stmt.where(Sop.department == department)
+    if not ctx.is_admin:
+        stmt = stmt.where(shares_team_clause(ctx.user_id, model.sop_id))
+    if dims:
+        stmt = stmt.group_by(*dims)
+    return stmt, len(dims)
+
+
+def run_metrics(db: Session, ctx: AuthContext, group_by: str = "none", bucket: str = "none",
+                window: tuple[date, date] | None = None, sop_id: int | None = None,
+                department: str | None = None, team_id: int | None = None) -> list[RunMetricsRow]:
+    """Run and suggestion metrics from the rollups, in three queries.
+
+    Sync so it can be shared; async handlers call it via ``db.run_sync``.
+    """
+    window = window or _window(None, None)
+    args = (ctx, group_by, bucket, window, sop_id, department, team_id)
+    stmt, n = _grouped(
+        RunDailyRollup, *args,
+        func.sum(RunDailyRollup.started), func.sum(RunDailyRollup.completed),
+        func.sum(RunDailyRollup.passed), func.sum(RunDailyRollup.failed),
+        func.sum(RunDailyRollup.duration_sum_s),
+    )
+    hist_stmt, _ = _grouped(RunDurationRollup, *args, RunDurationRollup.bucket, func.sum(RunDurationRollup.runs))
+    hist_stmt = hist_stmt.group_by(RunDurationRollup.bucket)
+    sug_stmt, _ = _grouped(SuggestionDailyRollup, *args, func.sum(SuggestionDailyRollup.created))
+
+    def split(row) -> tuple[tuple, tuple]:
+        dims = tuple(row[:n])
+        if group_by == "none":
+            dims = (None, None) + dims
+        if bucket == "none":
+            dims = dims + (None,)
+        return dims, tuple(row[n:])
+
+    groups: dict[tuple, dict] = {}
+    for row in db.execute(stmt):
+        dims, (started, completed, passed, failed, duration) = split(row)
+        groups[dims] = {
+            "started": started or 0, "completed": completed or 0,
+            "passed": passed or 0, "failed": failed or 0, "duration": duration or 0.0,
+        }
+    hist: dict[tuple, dict[int, int]] = defaultdict(dict)
+    for row in db.execute(hist_stmt):
+        dims, (b, runs) = split(row)
+        hist[dims][b] = runs
+    suggestions: dict[tuple, int] = {}
+    for row in db.execute(sug_stmt):
+        dims, (created,) = split(row)
+        suggestions[dims] = created or 0
+
+    out = []
+    for dims in sorted(groups.keys() | suggestions.keys(), key=lambda d: (d[2] or date.min, str(d[1] or ""))):
+        g = groups.get(dims, {"started": 0, "completed": 0, "passed": 0, "failed": 0, "duration": 0.0})
+        key, label, period = dims
+        out.append(RunMetricsRow(
+            key=key, label=label, period=period,
+            started=g["started"], completed=g["completed"],
+            completion_rate=_ratio(g["completed"], g["started"]),
+            passed=g["passed"], failed=g["failed"],
+            pass_rate=_ratio(g["passed"], g["passed"] + g["failed"]),
+            avg_duration_s=round(g["duration"] / g["completed"], 1) if g["completed"] else None,
+            median_duration_s=median_from_histogram(hist.get(dims, {})),
+            suggestions=suggestions.get(dims, 0),
+        ))
+    return out
+
+
+@router.get("/runs", response_model=list[RunMetricsRow], dependencies=[Depends(get_current_user)])
+async def analytics_runs(
+    group_by: str = Query("none", pattern=GROUP_BY),
+    bucket: str = Query("none", pattern=BUCKET),
+    date_from: date | None = None,
+    date_to: date | None = None,
+    sop_id: int | None = None,
+    department: str | None = None,
+    team_id: int | None = None,
+    db: AsyncSession = Depends(get_async_db),
+    ctx: AuthContext = Depends(get_auth_context),
+):
+    """Completion, pass rate, durations and suggestion volume by group and time bucket.
+
+    Days are UTC days of run start (suggestion creation); the window defaults to
+    the last 90 days. Figures lag writes by up to ``analytics_refresh_seconds``.
+    """
+    return await db.run_sync(run_metrics, ctx, group_by, bucket, _window(date_from, date_to), sop_id, department, team_id)
+
+
+@router.get("/steps", response_model=StepFunnel, dependencies=[Depends(get_current_user)])
+async def analytics_steps(
+    sop_id: int,
+    date_from: date | None = None,
+    date_to: date | None = None,
+    db: AsyncSession = Depends(get_async_db),
+    ctx: AuthContext = Depends(get_auth_context),
+):
+    """Per-step reach and drop-off for runs of one SOP started in the window."""
+    await db.run_sync(ctx.assert_can_view_sop, sop_id)
+    window = _window(date_from, date_to)
+    runs = (await db.execute(
+        select(func.coalesce(func.sum(RunDailyRollup.started), 0))
+        .where(RunDailyRollup.sop_id == sop_id, RunDailyRollup.day.between(*window))
+    )).scalar_one()
+    reached = dict((await db.execute(
+        select(StepDailyRollup.step_no, func.sum(StepDailyRollup.runs))
+        .where(StepDailyRollup.sop_id == sop_id, StepDailyRollup.day.between(*window))
+        .group_by(StepDailyRollup.step_no)
+    )).all())
+    titles = dict((await db.execute(select(SopStep.step_no, SopStep.title).where(SopStep.sop_id == sop_id))).all())
+    steps = []
+    previous = runs
+    for step_no in sorted(titles.keys() | reached.keys()):
+        count = reached.get(step_no, 0)
+        steps.append(StepDropOff(
+            step_no=step_no, title=titles.get(step_no), runs=count,
+            reach_rate=_ratio(count, runs),
+            drop_off=_ratio(max(previous - count, 0), previous),
+        ))
+        previous = count
+    return StepFunnel(sop_id=sop_id, runs=runs, steps=steps)
+
+
+@router.get("/overview", response_model=AnalyticsOverview, dependencies=[Depends(get_current_user)])
+async def analytics_overview(
+    date_from: date | None = None,
+    date_to: date | None = None,
+    db: AsyncSession = Depends(get_async_db),
+    ctx: AuthContext = Depends(get_auth_context),
+):
+    """Everything the dashboard shows, in one request."""
+    window = _window(date_from, date_to)
+    totals = await db.run_sync(run_metrics, ctx, "none", "none", window)
+    sops = select(func.count()).select_from(Sop).where(Sop.status == "published")
+    open_suggestions = (
+        select(func.count()).select_from(Suggestion)
+        .where(Suggestion.status.not_in(CLOSED_SUGGESTION_STATUSES))
+    )
+    if not ctx.is_admin:
+        sops = sops.where(shares_team_clause(ctx.user_id, Sop.id))
+        # Same rule as list_suggestions, so the count matches the list
+        open_suggestions = open_suggestions.where(suggestion_visible_clause(ctx.user_id, Suggestion.sop_id))
+    return AnalyticsOverview(
+        date_from=window[0],
+        date_to=window[1],
+        totals=totals[0] if totals else RunMetrics(),
+        published_sops=(await db.execute(sops)).scalar_one(),
+        open_suggestions=(await db.execute(open_suggestions)).scalar_one(),
+        by_department=await db.run_sync(run_metrics, ctx, "department", "none", window),
+        trend=await db.run_sync(run_metrics, ctx, "none", "week", window),
+    )
+
+
+# Rebuilding rollups can run for a while; it stays sync and runs in the threadpool
+@router.post("/refresh", dependencies=[Depends(require_roles("admin"))])
+def analytics_refresh(full: bool = False, db: Session = Depends(get_db)):
+    """Refresh the rollups now; ``full`` rebuilds them from scratch."""
+    return refresh_rollups(db, full=full)
@@ -1,11 +1,14 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from pydantic import BaseModel, EmailStr
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 
-from app.db import get_db
+from app.db import get_async_db
 from app.models.user import User
-from app.core.security import create_jwt
+from app.models.user_team import UserTeam
+from app.models.acl_state import AclState
+from app.core.security import create_jwt, verify_jwt
+from app.core.settings import settings
 from app.deps import get_current_user
 
 
@@ -17,34 +20,67 @@ class LoginRequest(BaseModel):
     name: str | None = None
 
 
+class RefreshRequest(BaseModel):
+    refresh_token: str
+
+
 class TokenResponse(BaseModel):
     access_token: str
+    refresh_token: str
     token_type: str = "bearer"
+    expires_in: int
     user: dict
 
 
+async def _issue_tokens(db: AsyncSession, user: User) -> TokenResponse:
+    claims = {"sub": str(user.id), "email": user.email, "role": user.role}
+    if settings.jwt_acl_claims:
+        # Epoch first: a membership change committed in between leaves the token
+        # with an older epoch, so it is never trusted with stale teams
+        epoch = (await db.execute(select(AclState.epoch).where(AclState.id == 1))).scalar_one_or_none() or 0
+        teams = (await db.execute(select(UserTeam.team_id).where(UserTeam.user_id == user.id))).scalars().all()
+        claims.update(teams=sorted(teams), acl_epoch=epoch)
+    return TokenResponse(
+        access_token=create_jwt(claims, settings.access_token_minutes),
+        refresh_token=create_jwt({"sub": str(user.id), "typ": "refresh"}, settings.refresh_token_minutes),
+        expires_in=settings.access_token_minutes * 60,
+        user={
+            "id": user.id,
+            "email": user.email,
+            "name": user.name,
+            "role": user.role,
+        },
+    )
+
+
 @router.post("/login", response_model=TokenResponse)
-def login(payload: LoginRequest, db: Session = Depends(get_db)):
-    user = db.execute(select(User).where(User.email == payload.email)).scalar_one_or_none()
+async def login(payload: LoginRequest, db: AsyncSession = Depends(get_async_db)):
+    user = (await db.execute(select(User).where(User.email == payload.email))).scalar_one_or_none()
     if not user:
         # Dev-friendly behavior: create user on first login
         display_name = payload.name or payload.email.split("@")[0]
         user = User(name=display_name, email=payload.email)
         db.add(user)
-        db.commit()
-        db.refresh(user)
+        await db.commit()
+        await db.refresh(user)
+
+    return await _issue_tokens(db, user)
+
 
-    token = create_jwt({"sub": str(user.id), "email": user.email, "role": user.role})
-    return TokenResponse(access_token=token, user={
-        "id": user.id,
-        "email": user.email,
-        "name": user.name,
-        "role": user.role,
-    })
+@router.post("/refresh", response_model=TokenResponse)
+async def refresh(payload: RefreshRequest, db: AsyncSession = Depends(get_async_db)):
+    """Exchange a refresh token for a new pair; role and teams are re-read."""
+    data = verify_jwt(payload.refresh_token)
+    if not data or data.get("typ") != "refresh":
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid refresh token")
+    user = await db.get(User, int(data["sub"]))
+    if not user or not user.is_active:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid refresh token")
+    return await _issue_tokens(db, user)
 
 
 @router.get("/me")
-def me(current = Depends(get_current_user)):
+async def me(current = Depends(get_current_user)):
     return current
 
 
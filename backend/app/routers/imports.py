@@ -0,0 +1,16 @@
+from fastapi import APIRouter, Depends, HTTPException
+
+from app.deps import require_roles
+from app.imports import import_queue
+from app.schemas.import_job import ImportJobOut
+
+
+router = APIRouter(prefix="/imports", tags=["imports"])
+
+
+@router.get("/{job_id}", response_model=ImportJobOut, dependencies=[Depends(require_roles("admin","dept_lead","editor"))])
+async def get_import_job(job_id: str):
+    job = import_queue.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Import job not found")
+    return job
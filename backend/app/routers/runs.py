@@ -1,85 +1,222 @@
-from datetime import datetime
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from sqlalchemy import select
+from datetime import datetime, timezone
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+from sqlalchemy.orm import Session, selectinload
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, func, update
+from sqlalchemy.dialects.postgresql import insert
 
-from app.db import get_db
+from app.db import get_async_db
 from app.models.run import Run, RunStep
-from app.schemas.run import RunStart, RunOut
-from app.deps import get_current_user
-from app.rbac import assert_can_view_sop
+from app.models.sop import Sop
+from app.models.sop_step import SopStep
+from app.schemas.run import RunStart, RunOut, StepCheckInBatch, RunStepsState
+from app.deps import get_current_user, get_auth_context
+from app.rbac import AuthContext
+from app.pagination import keyset_page, finish_page, DEFAULT_LIMIT, MAX_LIMIT
 
 
 router = APIRouter(prefix="/runs", tags=["runs"])
 
 
-@router.get("/", response_model=list[RunOut], dependencies=[Depends(get_current_user)])
-def list_runs(db: Session = Depends(get_db), user = Depends(get_current_user)):
-    # Non-admins: only runs for SOPs they can view (or their own runs)
-    from app.models.user import User
-    from app.models.sop_allowed_team import SopAllowedTeam
-    from app.rbac import user_team_ids
-    role = db.execute(select(User.role).where(User.id == int(user["sub"]))).scalar_one_or_none()
-    stmt = select(Run).order_by(Run.id.desc())
-    if role != "admin":
-      uteams = user_team_ids(db, int(user["sub"]))
-      rows = db.execute(select(SopAllowedTeam.sop_id, SopAllowedTeam.team_id)).all()
-      restricted = {row[0] for row in rows}
-      visible = {row[0] for row in rows if row[1] in uteams}
-      if visible:
-          stmt = stmt.where((Run.sop_id.in_(visible)) | (Run.user_id == int(user["sub"])) | (~Run.sop_id.in_(restricted)))
-      else:
-          stmt = stmt.where((Run.user_id == int(user["sub"])) | (~Run.sop_id.in_(restricted)))
-    return db.execute(stmt).scalars().all()
+def run_outs(db: Session, runs: list[Run], compact: bool = False) -> list[RunOut]:
+    """Serialize runs with their progress in a fixed number of queries.
 
+    Full mode expects ``Run.steps`` to be eager-loaded (``selectinload``); compact
+    mode aggregates counts in SQL and leaves ``steps`` unset. Async handlers call
+    it through ``await db.run_sync(run_outs, ...)``.
+    """
+    if not runs:
+        return []
+    # Pinned runs carry their own step count; older ones use the current SOP's
+    unpinned = {r.sop_id for r in runs if r.total_steps is None}
+    totals = dict(db.execute(
+        select(SopStep.sop_id, func.count())
+        .where(SopStep.sop_id.in_(unpinned))
+        .group_by(SopStep.sop_id)
+    ).all()) if unpinned else {}
+    if compact:
+        counts = {
+            run_id: (n, last)
+            for run_id, n, last in db.execute(
+                select(RunStep.run_id, func.count(), func.max(RunStep.step_no))
+                .where(RunStep.run_id.in_([r.id for r in runs]))
+                .group_by(RunStep.run_id)
+            ).all()
+        }
+    out = []
+    for run in runs:
+        if compact:
+            steps = None
+            checked, last = counts.get(run.id, (0, None))
+        else:
+            steps = sorted(run.steps, key=lambda st: st.step_no)
+            checked, last = len(steps), (steps[-1].step_no if steps else None)
+        total = run.total_steps if run.total_steps is not None else totals.get(run.sop_id)
+        out.append(RunOut(
+            id=run.id,
+            sop_id=run.sop_id,
+            sop_version=run.sop_version,
+            user_id=run.user_id,
+            started_at=run.started_at,
+            completed_at=run.completed_at,
+            passed=run.passed,
+            exception_note=run.exception_note,
+            steps=steps,
+            checked_count=checked,
+            last_step=last,
+            total_steps=total,
+            progress=min(1.0, checked / total) if total else None,
+        ))
+    return out
 
-@router.get("/{run_id}", response_model=RunOut, dependencies=[Depends(get_current_user)])
-def get_run(run_id: int, db: Session = Depends(get_db)):
-    run = db.get(Run, run_id)
+
+async def _load_run(db: AsyncSession, run_id: int) -> Run:
+    # populate_existing: the session keeps objects across commits, so refresh them
+    run = (await db.execute(
+        select(Run).where(Run.id == run_id).options(selectinload(Run.steps)).execution_options(populate_existing=True)
+    )).scalar_one_or_none()
     if not run:
         raise HTTPException(status_code=404, detail="Run not found")
     return run
 
 
+@router.get("/", response_model=list[RunOut], dependencies=[Depends(get_current_user)])
+async def list_runs(
+    response: Response,
+    limit: int = Query(DEFAULT_LIMIT, ge=1, le=MAX_LIMIT),
+    cursor: int | None = None,
+    sop_id: int | None = None,
+    user_id: int | None = None,
+    status_: str | None = Query(None, alias="status", pattern="^(open|completed|passed|failed)$"),
+    department: str | None = None,
+    started_from: datetime | None = None,
+    started_to: datetime | None = None,
+    view: str = Query("full", pattern="^(full|compact)$"),
+    db: AsyncSession = Depends(get_async_db),
+    ctx: AuthContext = Depends(get_auth_context),
+):
+    # Non-admins: only runs for SOPs they can view (or their own runs)
+    from app.rbac import shares_team_clause, unrestricted_clause
+    uid = ctx.user_id
+    stmt = select(Run)
+    if not ctx.is_admin:
+        stmt = stmt.where(
+            shares_team_clause(uid, Run.sop_id) | (Run.user_id == uid) | unrestricted_clause(Run.sop_id)
+        )
+    if sop_id is not None:
+        stmt = stmt.where(Run.sop_id == sop_id)
+    if user_id is not None:
+        stmt = stmt.where(Run.user_id == user_id)
+    if status_ == "open":
+        stmt = stmt.where(Run.completed_at.is_(None))
+    elif status_ == "completed":
+        stmt = stmt.where(Run.completed_at.is_not(None))
+    elif status_ == "passed":
+        stmt = stmt.where(Run.passed.is_(True))
+    elif status_ == "failed":
+        stmt = stmt.where(Run.passed.is_(False))
+    if department:
+        stmt = stmt.where(Run.sop_id.in_(select(Sop.id).where(Sop.department == department)))
+    if started_from is not None:
+        stmt = stmt.where(Run.started_at >= started_from)
+    if started_to is not None:
+        stmt = stmt.where(Run.started_at < started_to)
+    if view == "full":
+        stmt = stmt.options(selectinload(Run.steps))
+    rows = (await db.execute(keyset_page(stmt, Run.id, limit, cursor))).scalars().all()
+    return await db.run_sync(run_outs, finish_page(rows, limit, response), view == "compact")
+
+
+@router.get("/{run_id}", response_model=RunOut, dependencies=[Depends(get_current_user)])
+async def get_run(run_id: int, db: AsyncSession = Depends(get_async_db)):
+    return (await db.run_sync(run_outs, [await _load_run(db, run_id)]))[0]
+
+
 @router.post("/", response_model=RunOut, status_code=status.HTTP_201_CREATED, dependencies=[Depends(get_current_user)])
-def start_run(payload: RunStart, db: Session = Depends(get_db), user = Depends(get_current_user)):
+async def start_run(payload: RunStart, db: AsyncSession = Depends(get_async_db), ctx: AuthContext = Depends(get_auth_context)):
     # Ensure the caller can access the SOP being run
-    assert_can_view_sop(db, int(user["sub"]), payload.sop_id)
-    run = Run(sop_id=payload.sop_id, user_id=payload.user_id)
+    await db.run_sync(ctx.assert_can_view_sop, payload.sop_id)
+    # Pin the version being executed; the share lock keeps an edit from bumping
+    # it before the step count is read
+    version = (await db.execute(
+        select(Sop.version).where(Sop.id == payload.sop_id).with_for_update(read=True)
+    )).scalar_one_or_none()
+    if version is None:
+        raise HTTPException(status_code=404, detail="SOP not found")
+    total = (await db.execute(select(func.count()).where(SopStep.sop_id == payload.sop_id))).scalar_one()
+    run = Run(sop_id=payload.sop_id, user_id=payload.user_id, sop_version=version, total_steps=total or None)
     db.add(run)
-    db.commit()
-    db.refresh(run)
-    return run
+    await db.commit()
+    return (await db.run_sync(run_outs, [await _load_run(db, run.id)]))[0]
+
+
+def _utc_naive(ts: datetime) -> datetime:
+    return ts.astimezone(timezone.utc).replace(tzinfo=None) if ts.tzinfo else ts
+
+
+async def upsert_run_steps(db: AsyncSession, run: Run, checkins: dict[int, datetime]) -> None:
+    """Record check-ins in one statement; re-sending a check-in never moves it backwards.
+
+    Caller commits. The newest time wins on conflict, so replayed or reordered
+    batches from offline clients converge to the same state. Touches
+    ``Run.updated_at`` so the analytics refresh picks the run up.
+    """
+    stmt = insert(RunStep).values([
+        {"run_id": run.id, "step_no": no, "checked_at": ts} for no, ts in sorted(checkins.items())
+    ])
+    stmt = stmt.on_conflict_do_update(
+        constraint="uq_run_step",
+        set_={"checked_at": func.greatest(RunStep.checked_at, stmt.excluded.checked_at)},
+    )
+    await db.execute(stmt)
+    await db.execute(update(Run).where(Run.id == run.id).values(updated_at=datetime.utcnow()))
 
 
 @router.patch("/{run_id}/check", response_model=RunOut, dependencies=[Depends(get_current_user)])
-def check_step(run_id: int, step_no: int, db: Session = Depends(get_db), user = Depends(get_current_user)):
-    run = db.get(Run, run_id)
+async def check_step(run_id: int, step_no: int, db: AsyncSession = Depends(get_async_db), ctx: AuthContext = Depends(get_auth_context)):
+    run = await db.get(Run, run_id)
     if not run:
         raise HTTPException(status_code=404, detail="Run not found")
-    assert_can_view_sop(db, int(user["sub"]), run.sop_id)
-    step = db.execute(select(RunStep).where(RunStep.run_id == run_id, RunStep.step_no == step_no)).scalar_one_or_none()
-    if not step:
-        step = RunStep(run_id=run_id, step_no=step_no, checked_at=datetime.utcnow())
-        db.add(step)
-    else:
-        step.checked_at = datetime.utcnow()
-    db.commit()
-    db.refresh(run)
-    return run
+    await db.run_sync(ctx.assert_can_view_sop, run.sop_id)
+    await upsert_run_steps(db, run, {step_no: datetime.utcnow()})
+    await db.commit()
+    return (await db.run_sync(run_outs, [await _load_run(db, run_id)]))[0]
+
+
+@router.post("/{run_id}/steps:batch", response_model=RunStepsState, dependencies=[Depends(get_current_user)])
+async def check_steps_batch(run_id: int, payload: StepCheckInBatch, db: AsyncSession = Depends(get_async_db), ctx: AuthContext = Depends(get_auth_context)):
+    """Apply many step check-ins at once and return every checked step of the run.
+
+    Client timestamps are clamped to [run start, now] to absorb clock skew;
+    duplicates within the batch keep their latest time.
+    """
+    run = await db.get(Run, run_id)
+    if not run:
+        raise HTTPException(status_code=404, detail="Run not found")
+    await db.run_sync(ctx.assert_can_view_sop, run.sop_id)
+    now = datetime.utcnow()
+    checkins: dict[int, datetime] = {}
+    for item in payload.steps:
+        ts = min(max(_utc_naive(item.checked_at), run.started_at), now) if item.checked_at else now
+        checkins[item.step_no] = max(ts, checkins.get(item.step_no, ts))
+    await upsert_run_steps(db, run, checkins)
+    steps = (await db.execute(
+        select(RunStep.step_no, RunStep.checked_at).where(RunStep.run_id == run_id).order_by(RunStep.step_no)
+    )).all()
+    await db.commit()
+    return RunStepsState(run_id=run_id, steps=[{"step_no": no, "checked_at": ts} for no, ts in steps])
 
 
 @router.post("/{run_id}/complete", response_model=RunOut, dependencies=[Depends(get_current_user)])
-def complete_run(run_id: int, passed: bool = True, exception_note: str | None = None, db: Session = Depends(get_db), user = Depends(get_current_user)):
-    run = db.get(Run, run_id)
+async def complete_run(run_id: int, passed: bool = True, exception_note: str | None = None, db: AsyncSession = Depends(get_async_db), ctx: AuthContext = Depends(get_auth_context)):
+    run = await db.get(Run, run_id)
     if not run:
         raise HTTPException(status_code=404, detail="Run not found")
-    assert_can_view_sop(db, int(user["sub"]), run.sop_id)
+    await db.run_sync(ctx.assert_can_view_sop, run.sop_id)
     run.completed_at = datetime.utcnow()
     run.passed = passed
     run.exception_note = exception_note
-    db.commit()
-    db.refresh(run)
-    return run
+    await db.commit()
+    return (await db.run_sync(run_outs, [await _load_run(db, run_id)]))[0]
 
 
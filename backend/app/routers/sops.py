@@ -1,56 +1,287 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from sqlalchemy import select
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query, Request, Response, status
+from sqlalchemy.orm import Session, undefer_group
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, func
 from fastapi import UploadFile, File, Form
 
-from app.db import get_db
+from app.core.settings import settings
+from app.db import get_async_db, get_db
 from app.models.sop import Sop
-from app.schemas.sop import SopCreate, SopOut, SopUpdate
+from app.models.sop_step import SopStep
+from app.segmentation import numbered_steps, replace_sop_steps
+from app.media import sync_sop_images, sop_image_refs, collect_garbage
+from app.imports import UploadLimitRoute, import_queue, save_upload
+from app.semantic import SemanticUnavailable, semantic_index, index_sop, unindex_sop
+from app.versions import diff_versions, load_version, record_version, version_steps
+from app.models.sop_version import SopVersion
+from app.schemas.import_job import ImportJobOut
+from app.schemas.sop import SopCreate, SopOut, SopSummary, SopSearchHit, SopSemanticHit, SopUpdate, SopStepOut, SopStepsOut
+from app.schemas.sop import SopVersionDiff, SopVersionOut, SopVersionSummary
 from app.deps import require_roles
-from app.deps import get_current_user
-from app.rbac import assert_can_view_sop
+from app.deps import get_current_user, get_auth_context
+from app.rbac import AuthContext, invalidate_sop
+from app.pagination import keyset_page, finish_page, DEFAULT_LIMIT, MAX_LIMIT
+from app.http_cache import IMMUTABLE_PRIVATE, sop_etag, list_etag, etag_matches, not_modified, set_etag
 
 
 router = APIRouter(prefix="/sops", tags=["sops"])
 
 
-@router.get("/", response_model=list[SopOut], dependencies=[Depends(get_current_user)])
-def list_sops(db: Session = Depends(get_db), user = Depends(get_current_user)):
-    # Admins see all
-    if user.get("role") == "admin":
-        return db.execute(select(Sop).order_by(Sop.id.desc())).scalars().all()
-    # Non-admins: must share at least one team with SOP (unassigned SOPs are hidden)
-    from app.rbac import user_team_ids
-    from app.models.sop_allowed_team import SopAllowedTeam
-    uteams = user_team_ids(db, int(user["sub"]))
-    if not uteams:
-        return []
-    allowed_rows = db.execute(select(SopAllowedTeam.sop_id, SopAllowedTeam.team_id)).all()
-    visible = {row[0] for row in allowed_rows if row[1] in uteams}
-    return db.execute(select(Sop).where(Sop.id.in_(visible)).order_by(Sop.id.desc())).scalars().all()
+@router.get("/", response_model=list[SopSummary], dependencies=[Depends(get_current_user)])
+async def list_sops(
+    request: Request,
+    response: Response,
+    limit: int = Query(DEFAULT_LIMIT, ge=1, le=MAX_LIMIT),
+    cursor: int | None = None,
+    department: str | None = None,
+    status: str | None = None,
+    db: AsyncSession = Depends(get_async_db),
+    ctx: AuthContext = Depends(get_auth_context),
+):
+    stmt = select(Sop)
+    # Admins see all; non-admins must share at least one team with SOP (unassigned SOPs are hidden)
+    if not ctx.is_admin:
+        from app.rbac import shares_team_clause
+        stmt = stmt.where(shares_team_clause(ctx.user_id, Sop.id))
+    if department:
+        stmt = stmt.where(Sop.department == department)
+    if status:
+        stmt = stmt.where(Sop.status == status)
+    rows = (await db.execute(keyset_page(stmt, Sop.id, limit, cursor))).scalars().all()
+    rows = finish_page(rows, limit, response)
+    etag = list_etag("sops", [(r.id, r.version) for r in rows] + [response.headers.get("X-Next-Cursor")])
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    set_etag(response, etag)
+    return rows
+
+
+@router.get("/search", response_model=list[SopSearchHit], dependencies=[Depends(get_current_user)])
+async def search_sops(
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(20, ge=1, le=100),
+    db: AsyncSession = Depends(get_async_db),
+    ctx: AuthContext = Depends(get_auth_context),
+):
+    query = func.websearch_to_tsquery("english", q)
+    rank = func.ts_rank_cd(Sop.search_tsv, query).label("rank")
+    # Rank and limit on the GIN-indexed tsvector first; headline only the survivors
+    stmt = select(Sop.id, rank).where(Sop.search_tsv.op("@@")(query))
+    if not ctx.is_admin:
+        from app.rbac import shares_team_clause
+        stmt = stmt.where(shares_team_clause(ctx.user_id, Sop.id))
+    top = stmt.order_by(rank.desc(), Sop.id.desc()).limit(limit).subquery()
+    snippet = func.ts_headline(
+        "english",
+        func.coalesce(Sop.content_md, ""),
+        query,
+        "MaxFragments=2, MinWords=5, MaxWords=20, StartSel=<mark>, StopSel=</mark>",
+    )
+    rows = (await db.execute(
+        select(Sop, top.c.rank, snippet).join(top, top.c.id == Sop.id).order_by(top.c.rank.desc(), Sop.id.desc())
+    )).all()
+    return [
+        SopSearchHit(**SopSummary.model_validate(sop).model_dump(), rank=r, snippet=snip)
+        for sop, r, snip in rows
+    ]
+
+
+# Embedding the query is CPU-bound, so this one stays sync and runs in the threadpool
+@router.get("/semantic-search", response_model=list[SopSemanticHit], dependencies=[Depends(get_current_user)])
+def semantic_search_sops(
+    q: str = Query(..., min_length=1, max_length=500),
+    k: int = Query(10, ge=1, le=50),
+    db: Session = Depends(get_db),
+    ctx: AuthContext = Depends(get_auth_context),
+):
+    allowed = None
+    if not ctx.is_admin:
+        from app.rbac import shares_team_clause
+        allowed = set(db.execute(select(Sop.id).where(shares_team_clause(ctx.user_id, Sop.id))).scalars())
+        if not allowed:
+            return []
+    try:
+        hits = semantic_index.search(q, k, allowed)
+    except SemanticUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    sops = {s.id: s for s in db.execute(select(Sop).where(Sop.id.in_({m["sop_id"] for m, _ in hits}))).scalars()}
+    return [
+        SopSemanticHit(
+            **SopSummary.model_validate(sops[m["sop_id"]]).model_dump(),
+            section_no=m["section_no"],
+            section_title=m["title"],
+            snippet=m["snippet"],
+            score=score,
+        )
+        for m, score in hits
+        # Skip SOPs deleted since they were indexed
+        if m["sop_id"] in sops
+    ]
 
 
 @router.get("/{sop_id}", response_model=SopOut, dependencies=[Depends(get_current_user)])
-def get_sop(sop_id: str, db: Session = Depends(get_db), user = Depends(get_current_user)):
-    result = db.execute(select(Sop).where(Sop.sop_id == sop_id))
+async def get_sop(sop_id: str, request: Request, response: Response, db: AsyncSession = Depends(get_async_db), ctx: AuthContext = Depends(get_auth_context)):
+    result = await db.execute(select(Sop).where(Sop.sop_id == sop_id))
     sop = result.scalar_one_or_none()
     if not sop:
         raise HTTPException(status_code=404, detail="SOP not found")
-    assert_can_view_sop(db, int(user["sub"]), sop.id)
-    return sop
+    await db.run_sync(ctx.assert_can_view_sop, sop.id)
+    return await _conditional_sop(db, sop, request, response)
 
 
 @router.get("/by-id/{id}", response_model=SopOut, dependencies=[Depends(get_current_user)])
-def get_sop_by_id(id: int, db: Session = Depends(get_db), user = Depends(get_current_user)):
-    sop = db.get(Sop, id)
+async def get_sop_by_id(id: int, request: Request, response: Response, db: AsyncSession = Depends(get_async_db), ctx: AuthContext = Depends(get_auth_context)):
+    sop = await db.get(Sop, id)
     if not sop:
         raise HTTPException(status_code=404, detail="SOP not found")
-    assert_can_view_sop(db, int(user["sub"]), sop.id)
+    await db.run_sync(ctx.assert_can_view_sop, sop.id)
+    return await _conditional_sop(db, sop, request, response)
+
+
+@router.get("/by-id/{id}/steps", response_model=SopStepsOut, dependencies=[Depends(get_current_user)])
+async def list_sop_steps(id: int, request: Request, response: Response, db: AsyncSession = Depends(get_async_db), ctx: AuthContext = Depends(get_auth_context)):
+    sop = await db.get(Sop, id)
+    if not sop:
+        raise HTTPException(status_code=404, detail="SOP not found")
+    await db.run_sync(ctx.assert_can_view_sop, sop.id)
+    etag = sop_etag(sop.id, sop.version, scope="steps")
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    steps = await db.run_sync(_stored_steps, sop)
+    set_etag(response, etag)
+    return SopStepsOut(id=sop.id, title=sop.title, version=sop.version, total=len(steps), steps=steps)
+
+
+@router.get("/by-id/{id}/steps/{step_no}", response_model=SopStepOut, dependencies=[Depends(get_current_user)])
+async def get_sop_step(id: int, step_no: int, request: Request, response: Response, db: AsyncSession = Depends(get_async_db), ctx: AuthContext = Depends(get_auth_context)):
+    sop = await db.get(Sop, id)
+    if not sop:
+        raise HTTPException(status_code=404, detail="SOP not found")
+    await db.run_sync(ctx.assert_can_view_sop, sop.id)
+    etag = sop_etag(sop.id, sop.version, scope=f"step{step_no}")
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    steps = await db.run_sync(_stored_steps, sop)
+    if not 1 <= step_no <= len(steps):
+        raise HTTPException(status_code=404, detail="Step not found")
+    set_etag(response, etag)
+    return steps[step_no - 1]
+
+
+async def _visible_sop(db: AsyncSession, ctx: AuthContext, id: int) -> Sop:
+    # 404 before 403, as the by-id handlers do
+    sop = await db.get(Sop, id)
+    if not sop:
+        raise HTTPException(status_code=404, detail="SOP not found")
+    await db.run_sync(ctx.assert_can_view_sop, sop.id)
     return sop
 
 
+@router.get("/by-id/{id}/versions", response_model=list[SopVersionSummary], dependencies=[Depends(get_current_user)])
+async def list_sop_versions(id: int, db: AsyncSession = Depends(get_async_db), ctx: AuthContext = Depends(get_auth_context)):
+    await _visible_sop(db, ctx, id)
+    rows = (await db.execute(
+        select(SopVersion.version, SopVersion.kind, SopVersion.size,
+               func.octet_length(SopVersion.data).label("stored_bytes"), SopVersion.created_at)
+        .where(SopVersion.sop_id == id)
+        .order_by(SopVersion.version.desc())
+    )).all()
+    return rows
+
+
+@router.get("/by-id/{id}/versions/{version}", response_model=SopVersionOut, dependencies=[Depends(get_current_user)])
+async def get_sop_version(id: int, version: int, request: Request, response: Response, db: AsyncSession = Depends(get_async_db), ctx: AuthContext = Depends(get_auth_context)):
+    """One version, rebuilt from its snapshot and deltas; cacheable forever."""
+    await _visible_sop(db, ctx, id)
+    etag = sop_etag(id, version, scope="version")
+    if etag_matches(request, etag):
+        return not_modified(etag, IMMUTABLE_PRIVATE)
+    doc = await db.run_sync(load_version, id, version)
+    if doc is None:
+        raise HTTPException(status_code=404, detail="Version not found")
+    set_etag(response, etag, IMMUTABLE_PRIVATE)
+    return SopVersionOut(id=id, version=version, **doc)
+
+
+def _pinned_steps(db: Session, id: int, version: int) -> list[dict]:
+    steps = version_steps(db, id, version)
+    if steps is None:
+        raise HTTPException(status_code=404, detail="Version not found")
+    return steps
+
+
+@router.get("/by-id/{id}/versions/{version}/steps", response_model=SopStepsOut, dependencies=[Depends(get_current_user)])
+async def list_sop_version_steps(id: int, version: int, request: Request, response: Response, db: AsyncSession = Depends(get_async_db), ctx: AuthContext = Depends(get_auth_context)):
+    """Step outline of a pinned version, as followed by runs started on it."""
+    await _visible_sop(db, ctx, id)
+    etag = sop_etag(id, version, scope="vsteps")
+    if etag_matches(request, etag):
+        return not_modified(etag, IMMUTABLE_PRIVATE)
+    steps = await db.run_sync(_pinned_steps, id, version)
+    set_etag(response, etag, IMMUTABLE_PRIVATE)
+    title = (await db.run_sync(load_version, id, version))["title"]
+    return SopStepsOut(id=id, title=title, version=version, total=len(steps), steps=steps)
+
+
+@router.get("/by-id/{id}/versions/{version}/steps/{step_no}", response_model=SopStepOut, dependencies=[Depends(get_current_user)])
+async def get_sop_version_step(id: int, version: int, step_no: int, request: Request, response: Response, db: AsyncSession = Depends(get_async_db), ctx: AuthContext = Depends(get_auth_context)):
+    await _visible_sop(db, ctx, id)
+    etag = sop_etag(id, version, scope=f"vstep{step_no}")
+    if etag_matches(request, etag):
+        return not_modified(etag, IMMUTABLE_PRIVATE)
+    steps = await db.run_sync(_pinned_steps, id, version)
+    if not 1 <= step_no <= len(steps):
+        raise HTTPException(status_code=404, detail="Step not found")
+    set_etag(response, etag, IMMUTABLE_PRIVATE)
+    return steps[step_no - 1]
+
+
+@router.get("/by-id/{id}/diff", response_model=SopVersionDiff, dependencies=[Depends(get_current_user)])
+async def diff_sop_versions(
+    id: int,
+    request: Request,
+    response: Response,
+    from_version: int = Query(..., ge=1),
+    to_version: int = Query(..., ge=1),
+    db: AsyncSession = Depends(get_async_db),
+    ctx: AuthContext = Depends(get_auth_context),
+):
+    """Changes between two versions; computed once per process and pair."""
+    await _visible_sop(db, ctx, id)
+    etag = sop_etag(id, from_version, scope=f"diff{to_version}")
+    if etag_matches(request, etag):
+        return not_modified(etag, IMMUTABLE_PRIVATE)
+    diff = await db.run_sync(diff_versions, id, from_version, to_version)
+    if diff is None:
+        raise HTTPException(status_code=404, detail="Version not found")
+    set_etag(response, etag, IMMUTABLE_PRIVATE)
+    return diff
+
+
+def _stored_steps(db: Session, sop: Sop) -> list[SopStep] | list[dict]:
+    steps = db.execute(select(SopStep).where(SopStep.sop_id == sop.id).order_by(SopStep.step_no)).scalars().all()
+    if not steps:
+        # SOPs saved before segmentation existed (until scripts/backfill_sop_steps.py
+        # runs) are split in memory; reads never write
+        return numbered_steps(sop.content_md, sop.content_json)
+    return steps
+
+
+async def _conditional_sop(db: AsyncSession, sop: Sop, request: Request, response: Response):
+    # The body columns are deferred; on a 304 they are never read from the database
+    etag = sop_etag(sop.id, sop.version)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    # AsyncSession cannot lazy-load, so fetch the body group explicitly
+    await db.refresh(sop, ["content_md", "content_json"])
+    set_etag(response, etag)
+    return sop
+
+
+# Writes segment the body, build version deltas and collect media files, all
+# CPU or disk work, so they stay sync and run in the threadpool
 @router.post("/", response_model=SopOut, status_code=status.HTTP_201_CREATED, dependencies=[Depends(require_roles("admin","dept_lead","editor"))])
-def create_sop(payload: SopCreate, db: Session = Depends(get_db)):
+def create_sop(payload: SopCreate, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
     exists = db.execute(select(Sop).where(Sop.sop_id == payload.sop_id)).scalar_one_or_none()
     if exists:
         raise HTTPException(status_code=400, detail="sop_id already exists")
@@ -64,14 +295,19 @@ def create_sop(payload: SopCreate, db: Session = Depends(get_db)):
         version=1,
     )
     db.add(sop)
+    db.flush()
+    replace_sop_steps(db, sop)
+    record_version(db, sop)
     db.commit()
+    background_tasks.add_task(index_sop, sop.id, payload.content_md, payload.content_json)
     db.refresh(sop)
     return sop
 
 
 @router.patch("/{id}", response_model=SopOut, dependencies=[Depends(require_roles("admin","dept_lead","editor"))])
-def update_sop(id: int, payload: SopUpdate, db: Session = Depends(get_db)):
-    sop = db.get(Sop, id)
+def update_sop(id: int, payload: SopUpdate, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
+    # Row lock: concurrent edits must not claim the same version number
+    sop = db.get(Sop, id, options=[undefer_group("body")], with_for_update=True)
     if not sop:
         raise HTTPException(status_code=404, detail="SOP not found")
     if payload.title is not None:
@@ -82,92 +318,75 @@ def update_sop(id: int, payload: SopUpdate, db: Session = Depends(get_db)):
         sop.content_md = payload.content_md
     if payload.content_json is not None:
         sop.content_json = payload.content_json
+    dropped = set()
+    if payload.content_md is not None or payload.content_json is not None:
+        replace_sop_steps(db, sop)
+        dropped = sync_sop_images(db, sop.id, (sop.content_json or {}).get("html"))
     sop.version = (sop.version or 1) + 1
+    record_version(db, sop)
     db.commit()
+    collect_garbage(db, dropped)
+    if payload.content_md is not None or payload.content_json is not None:
+        background_tasks.add_task(index_sop, sop.id, sop.content_md, sop.content_json)
     db.refresh(sop)
     return sop
 
 
 @router.post("/{id}/publish", response_model=SopOut, dependencies=[Depends(require_roles("admin","dept_lead"))])
 def publish_sop(id: int, db: Session = Depends(get_db)):
-    sop = db.get(Sop, id)
+    sop = db.get(Sop, id, options=[undefer_group("body")], with_for_update=True)
     if not sop:
         raise HTTPException(status_code=404, detail="SOP not found")
     sop.status = "published"
     sop.version = (sop.version or 1) + 1
+    replace_sop_steps(db, sop)
+    record_version(db, sop)
     db.commit()
     db.refresh(sop)
     return sop
 
 
-@router.post("/import_docx", response_model=SopOut, status_code=status.HTTP_201_CREATED, dependencies=[Depends(require_roles("admin","dept_lead","editor"))])
 async def import_docx(
     sop_id: str = Form(...),
     title: str = Form(...),
     department: str = Form(...),
     file: UploadFile = File(...),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
-    """Import a DOCX and convert to HTML with images saved to /media.
-    Stores HTML in content_json as { html }, and a plaintext in content_md for fallback.
+    """Queue a DOCX import; poll GET /imports/{job_id} for the result.
+    The worker converts to HTML with images saved to /media, storing HTML in
+    content_json as { html } and a plaintext in content_md for fallback.
     """
-    # Save uploaded docx temporarily
-    import os, uuid, mammoth
-    os.makedirs("media/uploads", exist_ok=True)
-    temp_path = os.path.join("media/uploads", f"{uuid.uuid4()}.docx")
-    with open(temp_path, "wb") as f:
-        f.write(await file.read())
-
-    # Convert to HTML; extract images to /media/images
-    os.makedirs("media/images", exist_ok=True)
-    def image_handler(image):
-        image_name = f"{uuid.uuid4()}.{image.content_type.split('/')[-1]}"
-        image_path = os.path.join("media/images", image_name)
-        # image.open() returns a context manager (closing wrapper). Use it properly.
-        with image.open() as img_fp:
-            data = img_fp.read()
-        with open(image_path, "wb") as img:
-            img.write(data)
-        return {"src": f"/media/images/{image_name}"}
-
-    try:
-        with open(temp_path, "rb") as docx_file:
-            result = mammoth.convert_to_html(docx_file, convert_image=mammoth.images.inline(image_handler))
-            html = result.value  # HTML string
-            messages = result.messages
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=f"Import failed: {e}")
-
-    # Fallback plain text (strip tags)
-    import re
-    text = re.sub("<[^>]+>", "\n", html)
-    text = re.sub("\n+", "\n", text).strip()
-
-    # Create SOP record
-    exists = db.execute(select(Sop).where(Sop.sop_id == sop_id)).scalar_one_or_none()
+    exists = (await db.execute(select(Sop.id).where(Sop.sop_id == sop_id))).scalar_one_or_none()
     if exists:
         raise HTTPException(status_code=400, detail="sop_id already exists")
-    sop = Sop(
-        sop_id=sop_id,
-        title=title,
-        department=department,
-        content_md=text,
-        content_json={"html": html},
-        status="draft",
-        version=1,
-    )
-    db.add(sop)
-    db.commit()
-    db.refresh(sop)
-    return sop
+    # Stream the upload to a temp file; the job removes it after conversion
+    temp_path = await save_upload(file, settings.import_max_bytes)
+    return import_queue.submit(temp_path, sop_id=sop_id, title=title, department=department)
+
+
+# Registered explicitly: only add_api_route accepts a per-route class
+router.add_api_route(
+    "/import_docx",
+    import_docx,
+    methods=["POST"],
+    response_model=ImportJobOut,
+    status_code=status.HTTP_202_ACCEPTED,
+    dependencies=[Depends(require_roles("admin","dept_lead","editor"))],
+    route_class_override=UploadLimitRoute,
+)
 
 
 @router.delete("/{id}", status_code=status.HTTP_204_NO_CONTENT, dependencies=[Depends(require_roles("admin","dept_lead"))])
-def delete_sop(id: int, db: Session = Depends(get_db)):
+def delete_sop(id: int, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
     sop = db.get(Sop, id)
     if not sop:
         raise HTTPException(status_code=404, detail="SOP not found")
+    images = sop_image_refs(db, id)
     db.delete(sop)
     db.commit()
+    invalidate_sop(id)
+    collect_garbage(db, images)
+    background_tasks.add_task(unindex_sop, id)
     return None
 
@@ -1,64 +1,80 @@
-from fastapi import APIRouter, Depends, status, HTTPException
-from sqlalchemy.orm import Session
-from sqlalchemy import select
+from fastapi import APIRouter, Depends, status, HTTPException, Query, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, func
 
-from app.db import get_db
+from app.db import get_async_db
 from app.models.suggestion import Suggestion
 from app.schemas.suggestion import SuggestionCreate, SuggestionOut
-from app.deps import get_current_user
-from app.rbac import assert_can_view_sop
+from app.deps import get_current_user, get_auth_context, require_roles
+from app.rbac import AuthContext, suggestion_visible_clause
+from app.pagination import keyset_page, finish_page, DEFAULT_LIMIT, MAX_LIMIT
 
 
 router = APIRouter(prefix="/suggestions", tags=["suggestions"])
 
 
 @router.get("/", response_model=list[SuggestionOut], dependencies=[Depends(get_current_user)])
-def list_suggestions(status: str | None = None, db: Session = Depends(get_db), user = Depends(get_current_user)):
+async def list_suggestions(
+    response: Response,
+    status: str | None = None,
+    limit: int = Query(DEFAULT_LIMIT, ge=1, le=MAX_LIMIT),
+    cursor: int | None = None,
+    sop_id: int | None = None,
+    user_id: int | None = None,
+    department: str | None = None,
+    db: AsyncSession = Depends(get_async_db),
+    ctx: AuthContext = Depends(get_auth_context),
+):
     # Non-admins: return only suggestions for SOPs they can view
-    from app.models.user import User
-    from app.models.sop_allowed_team import SopAllowedTeam
-    from app.rbac import user_team_ids
-    role = db.execute(select(User.role).where(User.id == int(user["sub"]))).scalar_one_or_none()
     stmt = select(Suggestion)
     if status:
         stmt = stmt.where(Suggestion.status == status)
-    if role != "admin":
-        uteams = user_team_ids(db, int(user["sub"]))
-        if not uteams:
-            # only unrestricted SOPs
-            restricted = {row[0] for row in db.execute(select(SopAllowedTeam.sop_id)).all()}
-            if restricted:
-                stmt = stmt.where(~Suggestion.sop_id.in_(restricted))
-        else:
-            rows = db.execute(select(SopAllowedTeam.sop_id, SopAllowedTeam.team_id)).all()
-            visible = {row[0] for row in rows if row[1] in uteams}
-            if visible:
-                stmt = stmt.where(Suggestion.sop_id.in_(visible))
-            else:
-                restricted = {row[0] for row in rows}
-                if restricted:
-                    stmt = stmt.where(~Suggestion.sop_id.in_(restricted))
-    return db.execute(stmt).scalars().all()
+    if sop_id is not None:
+        stmt = stmt.where(Suggestion.sop_id == sop_id)
+    if user_id is not None:
+        stmt = stmt.where(Suggestion.user_id == user_id)
+    if department:
+        from app.models.sop import Sop
+        stmt = stmt.where(Suggestion.sop_id.in_(select(Sop.id).where(Sop.department == department)))
+    if not ctx.is_admin:
+        stmt = stmt.where(suggestion_visible_clause(ctx.user_id, Suggestion.sop_id))
+    rows = (await db.execute(keyset_page(stmt, Suggestion.id, limit, cursor))).scalars().all()
+    return finish_page(rows, limit, response)
+
+
+@router.get("/triage/stats", dependencies=[Depends(require_roles("admin"))])
+async def triage_stats(db: AsyncSession = Depends(get_async_db)):
+    """Queue depth by status; worker throughput is logged by app.workers.triage."""
+    rows = (await db.execute(select(Suggestion.status, func.count()).group_by(Suggestion.status))).all()
+    retrying = (await db.execute(
+        select(func.count()).where(Suggestion.status == "queued", Suggestion.attempts > 0)
+    )).scalar_one()
+    return {"by_status": {status: n for status, n in rows}, "retrying": retrying}
 
 
 @router.post("/", response_model=SuggestionOut, status_code=status.HTTP_201_CREATED, dependencies=[Depends(get_current_user)])
-def create_suggestion(payload: SuggestionCreate, db: Session = Depends(get_db), user = Depends(get_current_user)):
-    assert_can_view_sop(db, int(user["sub"]), payload.sop_id)
+async def create_suggestion(payload: SuggestionCreate, db: AsyncSession = Depends(get_async_db), ctx: AuthContext = Depends(get_auth_context)):
+    await db.run_sync(ctx.assert_can_view_sop, payload.sop_id)
     s = Suggestion(sop_id=payload.sop_id, user_id=payload.user_id, raw_text=payload.raw_text)
     db.add(s)
-    db.commit()
-    db.refresh(s)
+    await db.commit()
+    await db.refresh(s)
     return s
 
 
 @router.patch("/{id}", response_model=SuggestionOut, dependencies=[Depends(get_current_user)])
-def update_suggestion(id: int, status: str | None = None, db: Session = Depends(get_db)):
-    s = db.get(Suggestion, id)
+async def update_suggestion(id: int, status: str | None = None, db: AsyncSession = Depends(get_async_db)):
+    s = await db.get(Suggestion, id)
     if not s:
         raise HTTPException(status_code=404, detail="Suggestion not found")
     if status is not None:
         s.status = status
-    db.commit()
-    db.refresh(s)
+        if status == "queued":
+            # Requeueing (e.g. a dead suggestion) gives the triage worker a fresh budget
+            s.attempts = 0
+            s.available_at = None
+            s.last_error = None
+    await db.commit()
+    await db.refresh(s)
     return s
 
@@ -1,8 +1,8 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 
-from app.db import get_db
+from app.db import get_async_db
 from app.models.team import Team
 from app.schemas.team import TeamCreate, TeamOut
 from app.deps import require_roles
@@ -12,19 +12,19 @@ router = APIRouter(prefix="/teams", tags=["teams"])
 
 
 @router.get("/", response_model=list[TeamOut])
-def list_teams(db: Session = Depends(get_db)):
-    return db.execute(select(Team)).scalars().all()
+async def list_teams(db: AsyncSession = Depends(get_async_db)):
+    return (await db.execute(select(Team))).scalars().all()
 
 
 @router.post("/", response_model=TeamOut, status_code=status.HTTP_201_CREATED, dependencies=[Depends(require_roles("admin"))])
-def create_team(payload: TeamCreate, db: Session = Depends(get_db)):
-    exists = db.execute(select(Team).where(Team.name == payload.name)).scalar_one_or_none()
+async def create_team(payload: TeamCreate, db: AsyncSession = Depends(get_async_db)):
+    exists = (await db.execute(select(Team).where(Team.name == payload.name))).scalar_one_or_none()
     if exists:
         raise HTTPException(status_code=400, detail="Team name exists")
     team = Team(name=payload.name, department=payload.department)
     db.add(team)
-    db.commit()
-    db.refresh(team)
+    await db.commit()
+    await db.refresh(team)
     return team
 
 
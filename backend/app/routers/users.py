@@ -1,8 +1,8 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 
-from app.db import get_db
+from app.db import get_async_db
 from app.models.user import User
 from app.schemas.user import UserCreate, UserOut
 
@@ -11,20 +11,20 @@ router = APIRouter(prefix="/users", tags=["users"])
 
 
 @router.get("/", response_model=list[UserOut])
-def list_users(db: Session = Depends(get_db)):
-    result = db.execute(select(User))
+async def list_users(db: AsyncSession = Depends(get_async_db)):
+    result = await db.execute(select(User))
     return result.scalars().all()
 
 
 @router.post("/", response_model=UserOut, status_code=status.HTTP_201_CREATED)
-def create_user(payload: UserCreate, db: Session = Depends(get_db)):
-    exists = db.query(User).filter(User.email == payload.email).first()
+async def create_user(payload: UserCreate, db: AsyncSession = Depends(get_async_db)):
+    exists = (await db.execute(select(User.id).where(User.email == payload.email).limit(1))).first()
     if exists:
         raise HTTPException(status_code=400, detail="Email already exists")
     user = User(name=payload.name, email=payload.email, role=payload.role)
     db.add(user)
-    db.commit()
-    db.refresh(user)
+    await db.commit()
+    await db.refresh(user)
     return user
 
 
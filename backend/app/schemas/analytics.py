@@ -0,0 +1,49 @@
+from datetime import date
+
+from pydantic import BaseModel
+
+
+class RunMetrics(BaseModel):
+    started: int = 0
+    completed: int = 0
+    completion_rate: float | None = None
+    passed: int = 0
+    failed: int = 0
+    pass_rate: float | None = None
+    avg_duration_s: float | None = None
+    # Approximated from the duration histogram
+    median_duration_s: float | None = None
+    suggestions: int = 0
+
+
+class RunMetricsRow(RunMetrics):
+    # Group key (SOP id, department or team id) and its display label; None when ungrouped
+    key: int | str | None = None
+    label: str | None = None
+    # First day of the time bucket; None when not bucketed
+    period: date | None = None
+
+
+class StepDropOff(BaseModel):
+    step_no: int
+    title: str | None
+    runs: int
+    reach_rate: float | None
+    # Share of runs that reached the previous step but not this one
+    drop_off: float | None
+
+
+class StepFunnel(BaseModel):
+    sop_id: int
+    runs: int
+    steps: list[StepDropOff]
+
+
+class AnalyticsOverview(BaseModel):
+    date_from: date
+    date_to: date
+    totals: RunMetrics
+    published_sops: int
+    open_suggestions: int
+    by_department: list[RunMetricsRow]
+    trend: list[RunMetricsRow]
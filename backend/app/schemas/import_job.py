@@ -0,0 +1,20 @@
+from datetime import datetime
+
+from pydantic import BaseModel
+
+from app.schemas.sop import SopSummary
+
+
+class ImportJobOut(BaseModel):
+    id: str
+    status: str
+    sop_id: str
+    title: str
+    department: str
+    error: str | None
+    sop: SopSummary | None
+    created_at: datetime
+    finished_at: datetime | None
+
+    class Config:
+        from_attributes = True
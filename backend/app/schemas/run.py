@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from datetime import datetime
 
 
@@ -7,16 +7,44 @@ class RunStart(BaseModel):
     user_id: int
 
 
+class RunStepOut(BaseModel):
+    step_no: int
+    checked_at: datetime | None
+
+    class Config:
+        from_attributes = True
+
+
 class RunOut(BaseModel):
     id: int
     sop_id: int
+    sop_version: int | None = None
     user_id: int
     started_at: datetime
     completed_at: datetime | None
     passed: bool | None
     exception_note: str | None
+    # Checked steps in step order; None in compact listings, which carry counts only
+    steps: list[RunStepOut] | None = None
+    checked_count: int = 0
+    last_step: int | None = None
+    total_steps: int | None = None
+    progress: float | None = None
 
     class Config:
         from_attributes = True
 
 
+class StepCheckIn(BaseModel):
+    step_no: int = Field(ge=1)
+    # When the client checked the step; defaults to receipt time
+    checked_at: datetime | None = None
+
+
+class StepCheckInBatch(BaseModel):
+    steps: list[StepCheckIn] = Field(min_length=1, max_length=500)
+
+
+class RunStepsState(BaseModel):
+    run_id: int
+    steps: list[RunStepOut]
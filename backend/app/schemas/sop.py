@@ -1,3 +1,5 @@
+from datetime import datetime
+
 from pydantic import BaseModel
 
 
@@ -9,6 +11,30 @@ class SopCreate(BaseModel):
     content_json: dict | None = None
 
 
+class SopSummary(BaseModel):
+    id: int
+    sop_id: str
+    title: str
+    department: str
+    status: str
+    version: int
+
+    class Config:
+        from_attributes = True
+
+
+class SopSearchHit(SopSummary):
+    rank: float
+    snippet: str
+
+
+class SopSemanticHit(SopSummary):
+    section_no: int
+    section_title: str
+    snippet: str
+    score: float
+
+
 class SopOut(BaseModel):
     id: int
     sop_id: str
@@ -30,3 +56,57 @@ class SopUpdate(BaseModel):
     content_json: dict | None = None
 
 
+
+
+class SopStepSummary(BaseModel):
+    step_no: int
+    title: str
+
+    class Config:
+        from_attributes = True
+
+
+class SopStepOut(SopStepSummary):
+    text: str
+    html: str | None
+
+
+class SopStepsOut(BaseModel):
+    id: int
+    title: str
+    version: int
+    total: int
+    steps: list[SopStepSummary]
+
+
+class SopVersionSummary(BaseModel):
+    version: int
+    kind: str
+    # Uncompressed document size and bytes actually stored for this version
+    size: int
+    stored_bytes: int
+    created_at: datetime
+
+
+class SopVersionOut(BaseModel):
+    id: int
+    version: int
+    title: str
+    department: str
+    status: str
+    content_md: str | None
+    content_json: dict | None
+
+
+class SopFieldChange(BaseModel):
+    before: str | None
+    after: str | None
+
+
+class SopVersionDiff(BaseModel):
+    sop_id: int
+    from_version: int
+    to_version: int
+    fields: dict[str, SopFieldChange]
+    content_md_diff: str
+    content_json_changed: bool
@@ -15,6 +15,8 @@ class SuggestionOut(BaseModel):
     ai_summary: str | None
     ai_changeset_json: dict | None
     status: str
+    attempts: int = 0
+    last_error: str | None = None
 
     class Config:
         from_attributes = True
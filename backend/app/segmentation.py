@@ -0,0 +1,208 @@
+"""Split SOP content into ordered run steps.
+
+Mirrors the heuristics the run player used to apply in the browser: top-level
+HTML blocks are grouped under headings such as "Phase 2", "1.3 ..." or "Step 4";
+plain-text content falls back to heading lines and then numbered lines.
+"""
+import re
+from html.parser import HTMLParser
+
+from sqlalchemy import delete
+from sqlalchemy.orm import Session
+
+from app.models.sop import Sop
+from app.models.sop_step import SopStep
+
+
+HEADING_RE = re.compile(r"^(Phase\s*\d+|\d+\.\d+\s+|\d+\.\s+|General\s+Rules|Step\s*\d+)", re.I)
+TEXT_HEADING_RE = re.compile(r"^(Phase\s*\d+\b.*|\d+\.\d+\s+.+|\d+\.\s+.+|Step\s*\d+\b.*)$", re.I)
+NUMBERED_RE = re.compile(r"^\s*\d+[\).\-]\s+")
+# Top-level boundaries for splitting documents into LLM-sized sections
+MAJOR_HEADING_RE = re.compile(r"^(#{1,2}\s|(Phase|Section|Part)\s*\d+\b|General\s+Rules\b)", re.I)
+MD_HEADING_RE = re.compile(r"^#{1,6}\s")
+VOID_TAGS = {"area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "source", "track", "wbr"}
+TITLE_MAX = 255
+
+
+def _squash(text: str) -> str:
+    return re.sub(r"\s+", " ", text).strip()
+
+
+class _BlockSplitter(HTMLParser):
+    """Collect (html, text) for each top-level element of an HTML fragment."""
+
+    def __init__(self, source: str):
+        super().__init__(convert_charrefs=True)
+        self.source = source
+        self.line_offsets = [0]
+        for m in re.finditer("\n", source):
+            self.line_offsets.append(m.end())
+        self.blocks: list[tuple[str, str]] = []
+        self.depth = 0
+        self.start = 0
+        self.text: list[str] = []
+
+    def _offset(self) -> int:
+        line, col = self.getpos()
+        return self.line_offsets[line - 1] + col
+
+    def handle_starttag(self, tag, attrs):
+        if self.depth == 0:
+            self.start = self._offset()
+            self.text = []
+        if tag in VOID_TAGS:
+            if self.depth == 0:
+                self._close(self._offset() + len(self.get_starttag_text() or ""))
+            return
+        self.depth += 1
+
+    def handle_startendtag(self, tag, attrs):
+        if self.depth == 0:
+            self.start = self._offset()
+            self.text = []
+            self._close(self._offset() + len(self.get_starttag_text() or ""))
+
+    def handle_endtag(self, tag):
+        if tag in VOID_TAGS or self.depth == 0:
+            return
+        self.depth -= 1
+        if self.depth == 0:
+            end = self.source.find(">", self._offset())
+            self._close(len(self.source) if end < 0 else end + 1)
+
+    def handle_data(self, data):
+        if self.depth > 0:
+            self.text.append(data)
+        elif data.strip():
+            self.blocks.append((data, _squash(data)))
+
+    def _close(self, end: int) -> None:
+        self.blocks.append((self.source[self.start:end], _squash(" ".join(self.text))))
+
+
+def html_blocks(html: str) -> list[tuple[str, str]]:
+    parser = _BlockSplitter(html)
+    parser.feed(html)
+    parser.close()
+    return parser.blocks
+
+
+def segment_html(html: str) -> list[dict]:
+    blocks = html_blocks(html or "")
+    starts = [i for i, (_, text) in enumerate(blocks) if HEADING_RE.match(text)]
+    steps = []
+    for j, start in enumerate(starts):
+        end = starts[j + 1] if j + 1 < len(starts) else len(blocks)
+        chunk = blocks[start:end]
+        steps.append({
+            "title": chunk[0][1],
+            "text": " \n".join(t for _, t in chunk if t),
+            "html": "".join(h for h, _ in chunk),
+        })
+    return steps
+
+
+def segment_text(md: str) -> list[dict]:
+    text = (md or "").replace("\r\n", "\n").replace("\r", "\n")
+    lines = [_squash(l) for l in text.split("\n")]
+    heads = [i for i, l in enumerate(lines) if TEXT_HEADING_RE.match(l)]
+    segments = []
+    for j, start in enumerate(heads):
+        end = heads[j + 1] if j + 1 < len(heads) else len(lines)
+        chunk = "\n".join(lines[start:end]).strip()
+        if chunk:
+            segments.append(chunk)
+    if len(segments) < 2:
+        segments = [NUMBERED_RE.sub("", l).strip() for l in re.split(r"\n+", text) if NUMBERED_RE.match(l)]
+    if len(segments) < 2:
+        segments = [text.strip()] if text.strip() else []
+    return [{"title": s.split("\n", 1)[0], "text": s, "html": None} for s in segments]
+
+
+def segment_sop(content_md: str | None, content_json: dict | None) -> list[dict]:
+    html = (content_json or {}).get("html") or ""
+    if html:
+        steps = segment_html(html)
+        if steps:
+            return steps
+        text = _squash(" ".join(t for _, t in html_blocks(html)))
+        return [{"title": text[:TITLE_MAX], "text": text, "html": html}]
+    return segment_text(content_md or "")
+
+
+def numbered_steps(content_md: str | None, content_json: dict | None) -> list[dict]:
+    """Steps as stored in ``sop_steps``: numbered from 1, titles truncated."""
+    return [
+        {"step_no": no, "title": (s["title"] or "")[:TITLE_MAX], "text": s["text"], "html": s["html"]}
+        for no, s in enumerate(segment_sop(content_md, content_json), start=1)
+    ]
+
+
+def replace_sop_steps(db: Session, sop: Sop) -> int:
+    """Re-segment ``sop`` and replace its stored steps. Caller commits."""
+    steps = numbered_steps(sop.content_md, sop.content_json)
+    db.execute(delete(SopStep).where(SopStep.sop_id == sop.id))
+    db.add_all(SopStep(sop_id=sop.id, **step) for step in steps)
+    return len(steps)
+
+
+def _pack(units: list[tuple[str, bool]], max_chars: int) -> list[str]:
+    """Concatenate units into pieces of at most ``max_chars``, breaking early at headings."""
+    pieces: list[str] = []
+    current = ""
+    for text, is_heading in units:
+        if current and (len(current) + len(text) > max_chars or (is_heading and len(current) >= max_chars // 2)):
+            pieces.append(current)
+            current = ""
+        current += text
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def split_for_llm(source: str, is_html: bool, max_chars: int) -> list[str]:
+    """Split a document into ordered sections of roughly ``max_chars`` or less.
+
+    Sections start at major headings (Phase/Section/Part N, #/## or <h1>/<h2>);
+    only a major section that is too long is subdivided, at minor headings and
+    then block or line boundaries. Boundaries therefore depend on local content
+    only, so editing one section leaves the others byte-identical. Concatenating
+    the result gives back ``source`` (for HTML, its top-level blocks).
+    """
+    if is_html:
+        units = [
+            (html, bool(re.match(r"<h[1-2][\s>]", html, re.I)) or bool(MAJOR_HEADING_RE.match(text)),
+             bool(re.match(r"<h[1-6][\s>]", html, re.I)) or bool(HEADING_RE.match(text)))
+            for html, text in html_blocks(source)
+        ]
+    else:
+        lines = source.replace("\r\n", "\n").replace("\r", "\n").splitlines(keepends=True)
+        units = [
+            (line, bool(MAJOR_HEADING_RE.match(line.strip())),
+             bool(MD_HEADING_RE.match(line) or TEXT_HEADING_RE.match(_squash(line))))
+            for line in lines
+        ]
+    majors: list[list[tuple[str, bool, bool]]] = []
+    for unit in units:
+        if unit[1] or not majors:
+            majors.append([])
+        majors[-1].append(unit)
+    sections: list[str] = []
+    for major in majors:
+        text = "".join(u[0] for u in major)
+        if len(text) <= max_chars:
+            sections.append(text)
+        else:
+            sections.extend(_pack([(u[0], u[1] or u[2]) for u in major], max_chars))
+    # Fold short sections (a title line, a two-line phase) into their successor
+    merged: list[str] = []
+    for section in sections:
+        if merged and len(merged[-1]) < max_chars // 4 and len(merged[-1]) + len(section) <= max_chars:
+            merged[-1] += section
+        else:
+            merged.append(section)
+    if len(merged) > 1 and len(merged[-1]) < max_chars // 4 and len(merged[-2]) + len(merged[-1]) <= max_chars:
+        tail = merged.pop()
+        merged[-1] += tail
+    return [s for s in merged if s.strip()]
+
@@ -0,0 +1,396 @@
+"""Semantic retrieval over SOP sections.
+
+SOP content is chunked into sections (the same steps the run player shows, with
+long steps windowed), embedded by a local backend and stored as a float32 matrix
+that is memory-mapped for search and grows by appending. Nothing here talks to
+the network.
+
+Embedding backends:
+- ``HashingEmbedder`` (default): signed feature hashing of stemmed words, word
+  bigrams and character trigrams. Dependency-free apart from NumPy and robust to
+  inflection ("suppressed" vs "suppression").
+- ``SentenceTransformerEmbedder``: used when ``semantic_model`` points at a local
+  sentence-transformers model directory.
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+from array import array
+from collections import defaultdict
+from contextlib import contextmanager
+from dataclasses import dataclass
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+from app.core.settings import settings
+from app.segmentation import segment_sop
+
+
+log = logging.getLogger("app.semantic")
+
+SECTION_CHARS = 1200
+SECTION_OVERLAP = 200
+SNIPPET_CHARS = 240
+# Dead rows tolerated before a background compaction, as long as they are also
+# outnumbered by live ones
+COMPACT_MIN_ROWS = 1000
+SEGMENT_RE = re.compile(r"segment-(\d+)\.(?:f32|jsonl)")
+WORD_RE = re.compile(r"[a-z0-9]+")
+SUFFIXES = ("ations", "ation", "ings", "ing", "ions", "ion", "ies", "ied", "ers", "er", "es", "ed", "ly", "s")
+
+
+class SemanticUnavailable(RuntimeError):
+    pass
+
+
+def _np():
+    try:
+        import numpy
+    except ImportError as e:
+        raise SemanticUnavailable("Semantic search requires numpy") from e
+    return numpy
+
+
+@dataclass
+class Section:
+    sop_id: int
+    section_no: int
+    title: str
+    text: str
+
+
+def chunk_sop(sop_id: int, content_md: str | None, content_json: dict | None) -> list[Section]:
+    sections = []
+    for step in segment_sop(content_md, content_json):
+        text = step["text"] or ""
+        start = 0
+        while True:
+            piece = text[start:start + SECTION_CHARS]
+            if piece.strip():
+                sections.append(Section(sop_id, len(sections) + 1, step["title"] or "", piece))
+            if start + SECTION_CHARS >= len(text):
+                break
+            start += SECTION_CHARS - SECTION_OVERLAP
+    return sections
+
+
+def _stem(word: str) -> str:
+    for suffix in SUFFIXES:
+        if len(word) > len(suffix) + 2 and word.endswith(suffix):
+            return word[: -len(suffix)]
+    return word
+
+
+class HashingEmbedder:
+    def __init__(self, dim: int):
+        self.dim = dim
+
+    def _features(self, text: str) -> list[str]:
+        words = [_stem(w) for w in WORD_RE.findall(text.lower())]
+        feats = [f"w:{w}" for w in words]
+        feats += [f"b:{a}_{b}" for a, b in zip(words, words[1:])]
+        for w in words:
+            padded = f"#{w}#"
+            feats += [f"c:{padded[i:i + 3]}" for i in range(len(padded) - 2)]
+        return feats
+
+    def embed(self, texts: list[str]):
+        np = _np()
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feat in self._features(text):
+                h = int.from_bytes(hashlib.blake2b(feat.encode(), digest_size=8).digest(), "little")
+                out[row, h % self.dim] += 1.0 if (h >> 63) & 1 else -1.0
+        norms = np.linalg.norm(out, axis=1, keepdims=True)
+        return out / np.maximum(norms, 1e-12)
+
+
+class SentenceTransformerEmbedder:
+    def __init__(self, model_path: str):
+        os.environ.setdefault("HF_HUB_OFFLINE", "1")
+        from sentence_transformers import SentenceTransformer
+
+        self.model = SentenceTransformer(model_path, device="cpu")
+        self.dim = self.model.get_sentence_embedding_dimension()
+
+    def embed(self, texts: list[str]):
+        np = _np()
+        vecs = self.model.encode(texts, normalize_embeddings=True, convert_to_numpy=True)
+        return np.asarray(vecs, dtype=np.float32)
+
+
+def make_embedder():
+    if settings.semantic_model:
+        return SentenceTransformerEmbedder(settings.semantic_model)
+    return HashingEmbedder(settings.semantic_dim)
+
+
+class VectorIndex:
+    """Log-structured float32 index of SOP sections on disk.
+
+    A generation is ``segment-<gen>.f32`` (row-aligned vectors) plus
+    ``segment-<gen>.jsonl`` with one line per change, ``{"drop": [sop ids],
+    "add": [section meta]}``. Updating a SOP appends its new rows and a line that
+    tombstones its old ones, so a write costs the size of that SOP rather than of
+    the index. Readers memory-map the vectors, replay only the lines added since
+    they last looked and mask tombstoned rows at search time.
+
+    Compaction copies the live rows into a new generation and points
+    ``manifest.json`` at it. It runs in the background once dead rows outnumber
+    live ones, and a rebuild writes a new generation outright; the previous one is
+    kept for readers that have not switched yet. Writers in every process (API
+    workers, the import thread, admin rebuilds) serialize on a lock file.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._lock = threading.RLock()
+        self._embedder = None
+        self._compacting = False
+        self._reset(0, None)
+
+    @property
+    def embedder(self):
+        if self._embedder is None:
+            self._embedder = make_embedder()
+        return self._embedder
+
+    def _path(self, generation: int, ext: str) -> str:
+        return os.path.join(self.directory, f"segment-{generation:08d}.{ext}")
+
+    def _reset(self, generation: int, stamp) -> None:
+        self._generation, self._stamp, self._offset = generation, stamp, 0
+        self._meta: list[dict] = []
+        self._live = bytearray()
+        self._sop_ids = array("q")
+        self._rows: dict[int, list[int]] = defaultdict(list)
+        self._dead = 0
+        self._view_cache = None
+
+    def _sync(self, retry: bool = True) -> None:
+        """Catch up with the current generation, replaying only log lines not seen yet."""
+        manifest = os.path.join(self.directory, "manifest.json")
+        try:
+            stamp = os.stat(manifest).st_mtime_ns
+        except FileNotFoundError:
+            if self._generation:
+                self._reset(0, None)
+            return
+        if stamp != self._stamp:
+            with open(manifest, encoding="utf-8") as f:
+                doc = json.load(f)
+            if doc["dim"] != self.embedder.dim:
+                raise SemanticUnavailable("Semantic index was built with a different embedder; rebuild it")
+            if doc["generation"] != self._generation:
+                self._reset(doc["generation"], stamp)
+            self._stamp = stamp
+        try:
+            with open(self._path(self._generation, "jsonl"), "rb") as f:
+                f.seek(self._offset)
+                tail = f.read()
+        except FileNotFoundError:
+            # Compacted twice since the manifest was read; the newest one names a live generation
+            if retry:
+                self._stamp = None
+                return self._sync(retry=False)
+            raise SemanticUnavailable("Semantic index files are missing; rebuild it")
+        # A line without its newline is still being written
+        end = tail.rfind(b"\n") + 1
+        if not end:
+            return
+        for line in tail[:end].splitlines():
+            change = json.loads(line)
+            for sop_id in change.get("drop", ()):
+                for row in self._rows.pop(sop_id, ()):
+                    self._live[row] = 0
+                    self._dead += 1
+            for m in change.get("add", ()):
+                self._rows[m["sop_id"]].append(len(self._meta))
+                self._meta.append(m)
+                self._live.append(1)
+                self._sop_ids.append(m["sop_id"])
+        self._offset += end
+        self._view_cache = None
+
+    def _view(self):
+        """(vectors, live mask, sop ids) for the rows synced so far."""
+        np = _np()
+        if self._view_cache is None:
+            n, dim = len(self._meta), self.embedder.dim
+            if n:
+                vectors = np.memmap(self._path(self._generation, "f32"), dtype=np.float32, mode="r", shape=(n, dim))
+            else:
+                vectors = np.zeros((0, dim), dtype=np.float32)
+            live = np.frombuffer(bytes(self._live), dtype=bool)
+            self._view_cache = (vectors, live, np.frombuffer(self._sop_ids.tobytes(), dtype=np.int64))
+        return self._view_cache
+
+    @contextmanager
+    def _write_lock(self):
+        """Exclusive across threads and processes sharing ``directory``."""
+        os.makedirs(self.directory, exist_ok=True)
+        with self._lock, open(os.path.join(self.directory, ".lock"), "a+b") as f:
+            if fcntl:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                if fcntl:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+                else:
+                    f.seek(0)
+                    msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+    def _append(self, vectors, meta: list[dict], drop: list[int]) -> None:
+        """Add rows to the current generation; call under ``_write_lock`` right after ``_sync()``."""
+        np = _np()
+        size = len(self._meta) * 4 * self.embedder.dim
+        # Vectors first: readers only see rows once the log line naming them is complete
+        with open(self._path(self._generation, "f32"), "r+b") as f:
+            if f.seek(0, os.SEEK_END) != size:
+                # Rows or half a line left by a writer that died before finishing
+                f.truncate(size)
+                f.seek(size)
+            f.write(np.ascontiguousarray(vectors, dtype=np.float32).tobytes())
+        with open(self._path(self._generation, "jsonl"), "r+b") as f:
+            if f.seek(0, os.SEEK_END) != self._offset:
+                f.truncate(self._offset)
+                f.seek(self._offset)
+            f.write((json.dumps({"drop": drop, "add": meta}) + "\n").encode())
+        self._sync()
+
+    def _publish(self, vectors, meta: list[dict]) -> None:
+        """Start a new generation holding exactly ``meta``; call under ``_write_lock``."""
+        np = _np()
+        generation = self._generation + 1
+        np.ascontiguousarray(vectors, dtype=np.float32).tofile(self._path(generation, "f32"))
+        with open(self._path(generation, "jsonl"), "wb") as f:
+            if meta:
+                f.write((json.dumps({"add": meta}) + "\n").encode())
+        manifest = os.path.join(self.directory, "manifest.json")
+        with open(manifest + ".tmp", "w", encoding="utf-8") as f:
+            json.dump({"dim": int(self.embedder.dim), "generation": generation}, f)
+        os.replace(manifest + ".tmp", manifest)
+        keep = {generation, self._generation}
+        for entry in os.scandir(self.directory):
+            match = SEGMENT_RE.fullmatch(entry.name)
+            if match and int(match.group(1)) not in keep:
+                try:
+                    os.remove(entry.path)
+                except OSError:
+                    # Still mapped by a reader (Windows); a later compaction retries
+                    pass
+        self._sync()
+
+    def replace_sops(self, sop_ids: set[int] | None, sections: list[Section]) -> None:
+        """Replace every section of ``sop_ids`` with ``sections``; None rebuilds the whole index."""
+        np = _np()
+        # Embed before taking the lock; only the file writes are serialized
+        if sections:
+            vectors = self.embedder.embed([f"{s.title}\n{s.text}" for s in sections])
+        else:
+            vectors = np.zeros((0, self.embedder.dim), dtype=np.float32)
+        meta = [
+            {"sop_id": s.sop_id, "section_no": s.section_no, "title": s.title[:255], "snippet": s.text[:SNIPPET_CHARS]}
+            for s in sections
+        ]
+        with self._write_lock():
+            # Another process may have written since this one last synced
+            self._sync()
+            if sop_ids is None or not self._generation:
+                self._publish(vectors, meta)
+            elif meta or any(sop_id in self._rows for sop_id in sop_ids):
+                self._append(vectors, meta, sorted(sop_ids))
+            compact = self._dead > max(COMPACT_MIN_ROWS, len(self._meta) - self._dead)
+        if compact:
+            self._compact_in_background()
+
+    def compact(self) -> None:
+        """Rewrite the live rows into a new generation, dropping tombstoned ones."""
+        np = _np()
+        with self._write_lock():
+            self._sync()
+            if not self._dead:
+                return
+            vectors, live, _ = self._view()
+            rows = np.flatnonzero(live)
+            self._publish(np.asarray(vectors[rows]), [self._meta[i] for i in rows])
+
+    def _compact_in_background(self) -> None:
+        with self._lock:
+            if self._compacting:
+                return
+            self._compacting = True
+
+        def run():
+            try:
+                self.compact()
+            except Exception:
+                log.exception("semantic index compaction failed")
+            finally:
+                self._compacting = False
+
+        threading.Thread(target=run, name="semantic-compact", daemon=True).start()
+
+    def upsert_sop(self, sop_id: int, content_md: str | None, content_json: dict | None) -> None:
+        self.replace_sops({sop_id}, chunk_sop(sop_id, content_md, content_json))
+
+    def remove_sop(self, sop_id: int) -> None:
+        self.replace_sops({sop_id}, [])
+
+    def search(self, query: str, k: int, allowed_sop_ids: set[int] | None = None) -> list[tuple[dict, float]]:
+        np = _np()
+        with self._lock:
+            self._sync()
+            (vectors, live, sop_ids), meta = self._view(), self._meta
+        if not live.any():
+            return []
+        q = self.embedder.embed([query])[0]
+        scores = vectors @ q
+        if allowed_sop_ids is not None:
+            live = live & np.isin(sop_ids, list(allowed_sop_ids))
+        scores = np.where(live, scores, -np.inf)
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(meta[i], float(scores[i])) for i in top if np.isfinite(scores[i])]
+
+
+semantic_index = VectorIndex(settings.semantic_index_dir)
+
+
+def index_sop(sop_id: int, content_md: str | None, content_json: dict | None) -> None:
+    """Refresh one SOP's sections; a no-op when semantic search is unavailable."""
+    try:
+        semantic_index.upsert_sop(sop_id, content_md, content_json)
+    except SemanticUnavailable:
+        pass
+
+
+def unindex_sop(sop_id: int) -> None:
+    try:
+        semantic_index.remove_sop(sop_id)
+    except SemanticUnavailable:
+        pass
+
+
+def rebuild_index(db) -> int:
+    """Re-embed every SOP from the database; returns the number of sections."""
+    from sqlalchemy import select
+    from sqlalchemy.orm import undefer_group
+    from app.models.sop import Sop
+
+    sops = db.execute(select(Sop).options(undefer_group("body"))).scalars().all()
+    sections = [s for sop in sops for s in chunk_sop(sop.id, sop.content_md, sop.content_json)]
+    semantic_index.replace_sops(None, sections)
+    return len(sections)
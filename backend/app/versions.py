@@ -0,0 +1,201 @@
+"""Immutable SOP version history with delta-compressed storage.
+
+Every change that bumps ``Sop.version`` records that version in ``sop_versions``.
+Most rows are deltas: an edit script against the previous version at paragraph
+granularity, JSON-encoded and zlib-compressed, so storage grows with the size of
+edits. A full snapshot is written for the first version, every
+``sop_version_snapshot_every`` versions, and whenever a delta would not be much
+smaller than a snapshot.
+Rebuilding any version therefore reads one snapshot plus a bounded chain of
+deltas in a single query. Versions never change, so rebuilt documents and diffs
+are memoized per process, as are the steps of pinned versions served to runs.
+"""
+import difflib
+import json
+import re
+import zlib
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from app.core.cache import TTLCache
+from app.core.settings import settings
+from app.models.sop import Sop
+from app.models.sop_version import SopVersion
+from app.segmentation import numbered_steps
+
+
+FIELDS = ("title", "department", "status", "content_md", "content_json")
+# Segments end at a newline or a closing block tag, so HTML without line breaks
+# still diffs paragraph by paragraph
+SEGMENT_END_RE = re.compile(r"(\n|</(?:p|li|h[1-6]|tr|div|table|ul|ol|pre|blockquote)>)")
+# Immutable entries; the TTL only bounds how long an unused document stays resident
+IMMUTABLE_TTL = 24 * 3600.0
+
+_documents = TTLCache(maxsize=settings.sop_version_cache_entries, ttl=IMMUTABLE_TTL)
+_diffs = TTLCache(maxsize=settings.sop_version_cache_entries, ttl=IMMUTABLE_TTL)
+_steps = TTLCache(maxsize=settings.sop_version_cache_entries, ttl=IMMUTABLE_TTL)
+
+
+def document(sop: Sop) -> dict:
+    """The versioned fields of ``sop``; the body group must be loaded."""
+    return {f: getattr(sop, f) for f in FIELDS}
+
+
+def _text(field: str, value) -> str | None:
+    if value is None or field != "content_json":
+        return value
+    return json.dumps(value, sort_keys=True, ensure_ascii=False)
+
+
+def _value(field: str, text: str | None):
+    if text is None or field != "content_json":
+        return text
+    return json.loads(text)
+
+
+def _pack(obj) -> bytes:
+    return zlib.compress(json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode())
+
+
+def _unpack(data: bytes):
+    return json.loads(zlib.decompress(data))
+
+
+def segments(text: str) -> list[str]:
+    """Lossless split: ``"".join(segments(text)) == text``."""
+    parts = SEGMENT_END_RE.split(text)
+    return [a + b for a, b in zip(parts[::2], parts[1::2] + [""]) if a or b]
+
+
+def make_delta(base: dict, doc: dict) -> dict:
+    """Edit script turning ``base`` into ``doc``, covering changed fields only.
+
+    Text fields become a list of ops: ``[i, j]`` copies base segments ``i:j`` and
+    a string is inserted literally.
+    """
+    delta = {}
+    for field in FIELDS:
+        old, new = _text(field, base.get(field)), _text(field, doc.get(field))
+        if old == new:
+            continue
+        if old is None or new is None:
+            delta[field] = {"set": new}
+            continue
+        a, b = segments(old), segments(new)
+        ops: list = []
+        for tag, i1, i2, j1, j2 in difflib.SequenceMatcher(None, a, b, autojunk=False).get_opcodes():
+            if tag == "equal":
+                ops.append([i1, i2])
+            elif j2 > j1:
+                ops.append("".join(b[j1:j2]))
+        delta[field] = {"ops": ops}
+    return delta
+
+
+def apply_delta(base: dict, delta: dict) -> dict:
+    doc = dict(base)
+    for field, edit in delta.items():
+        if "set" in edit:
+            doc[field] = _value(field, edit["set"])
+            continue
+        parts = segments(_text(field, base.get(field)) or "")
+        doc[field] = _value(field, "".join(
+            "".join(parts[op[0]:op[1]]) if isinstance(op, list) else op for op in edit["ops"]
+        ))
+    return doc
+
+
+def _size(doc: dict) -> int:
+    return sum(len((_text(f, doc.get(f)) or "").encode()) for f in FIELDS)
+
+
+def load_version(db: Session, sop_id: int, version: int) -> dict | None:
+    """Rebuild ``version`` of an SOP from its nearest snapshot; None if not stored."""
+    key = (sop_id, version)
+    doc = _documents.get(key)
+    if doc is not None:
+        return doc
+    snapshot = (
+        select(func.max(SopVersion.version))
+        .where(SopVersion.sop_id == sop_id, SopVersion.version <= version, SopVersion.kind == "snapshot")
+        .scalar_subquery()
+    )
+    rows = db.execute(
+        select(SopVersion.version, SopVersion.kind, SopVersion.data)
+        .where(SopVersion.sop_id == sop_id, SopVersion.version <= version, SopVersion.version >= snapshot)
+        .order_by(SopVersion.version)
+    ).all()
+    if not rows or rows[-1].version != version:
+        return None
+    doc = _unpack(rows[0].data)
+    for row in rows[1:]:
+        doc = apply_delta(doc, _unpack(row.data))
+    _documents.set(key, doc)
+    return doc
+
+
+def version_steps(db: Session, sop_id: int, version: int) -> list[dict] | None:
+    """Steps of a stored version, segmented exactly like ``replace_sop_steps``."""
+    key = (sop_id, version)
+    steps = _steps.get(key)
+    if steps is not None:
+        return steps
+    doc = load_version(db, sop_id, version)
+    if doc is None:
+        return None
+    steps = numbered_steps(doc["content_md"], doc["content_json"])
+    _steps.set(key, steps)
+    return steps
+
+
+def record_version(db: Session, sop: Sop) -> SopVersion:
+    """Store ``sop`` at its current version; call after bumping the version, before commit.
+
+    Deltas are taken against the stored previous version. An SOP without one
+    (history starts here) gets a snapshot.
+    """
+    doc = document(sop)
+    snapshot = _pack(doc)
+    chain = db.execute(
+        select(SopVersion.kind)
+        .where(SopVersion.sop_id == sop.id, SopVersion.version < sop.version)
+        .order_by(SopVersion.version.desc())
+        .limit(settings.sop_version_snapshot_every)
+    ).scalars().all()
+    since_snapshot = chain.index("snapshot") + 1 if "snapshot" in chain else None
+    base = load_version(db, sop.id, sop.version - 1) if since_snapshot else None
+    kind, data = "snapshot", snapshot
+    if base is not None and since_snapshot < settings.sop_version_snapshot_every:
+        delta = _pack(make_delta(base, doc))
+        # A delta that saves little only lengthens the chain
+        if len(delta) * 2 < len(snapshot):
+            kind, data = "delta", delta
+    row = SopVersion(sop_id=sop.id, version=sop.version, kind=kind, data=data, size=_size(doc))
+    db.add(row)
+    return row
+
+
+def diff_versions(db: Session, sop_id: int, a: int, b: int) -> dict | None:
+    """Field changes and a unified diff of ``content_md`` between two versions."""
+    key = (sop_id, a, b)
+    cached = _diffs.get(key)
+    if cached is not None:
+        return cached
+    old, new = load_version(db, sop_id, a), load_version(db, sop_id, b)
+    if old is None or new is None:
+        return None
+    result = {
+        "sop_id": sop_id,
+        "from_version": a,
+        "to_version": b,
+        "fields": {f: {"before": old[f], "after": new[f]} for f in ("title", "department", "status") if old[f] != new[f]},
+        "content_md_diff": "".join(difflib.unified_diff(
+            (old["content_md"] or "").splitlines(keepends=True),
+            (new["content_md"] or "").splitlines(keepends=True),
+            fromfile=f"v{a}", tofile=f"v{b}",
+        )),
+        "content_json_changed": old["content_json"] != new["content_json"],
+    }
+    _diffs.set(key, result)
+    return result
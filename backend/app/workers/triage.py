@@ -0,0 +1,325 @@
+"""AI triage worker for queued suggestions.
+
+Run with ``python -m app.workers.triage``; any number of copies may run side by
+side. Each loop claims up to ``triage_batch_size`` suggestions with
+``SELECT ... FOR UPDATE SKIP LOCKED``, groups them by SOP and asks the model to
+summarize every suggestion in a group in one call, writing back ``ai_summary``
+and a structured ``ai_changeset_json``.
+
+Lifecycle: ``queued`` -> ``triaging`` (claimed, leased) -> ``review``. A failed
+group goes back to ``queued`` with an exponential ``available_at`` delay, or to
+``dead`` after ``triage_max_attempts``. The lease on a group is renewed when
+its model call starts and every third of ``triage_lease_seconds`` while it runs,
+so groups waiting their turn or a slow call are not re-claimed by another
+worker. A worker that dies mid-batch leaves its claims to expire, when they are
+claimed again.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import signal
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, or_, select, tuple_, update
+from sqlalchemy.orm import Session
+
+from app.core.settings import settings
+from app.db import SessionLocal
+from app.llm import llm_client
+from app.models.sop import Sop
+from app.models.sop_step import SopStep
+from app.models.suggestion import Suggestion
+
+
+log = logging.getLogger("app.workers.triage")
+
+PROMPT_VERSION = 1
+CONTEXT_CHARS = 6000
+ACTIONS = {"replace", "insert", "delete", "comment"}
+
+
+@dataclass
+class Claimed:
+    id: int
+    sop_id: int
+    raw_text: str
+    attempts: int
+    claimed_at: datetime
+
+
+@dataclass
+class Metrics:
+    started: float = field(default_factory=time.monotonic)
+    batches: int = 0
+    claimed: int = 0
+    triaged: int = 0
+    retried: int = 0
+    dead: int = 0
+    llm_calls: int = 0
+    llm_seconds: float = 0.0
+
+    def snapshot(self) -> dict:
+        uptime = time.monotonic() - self.started
+        return {
+            "uptime_s": round(uptime, 1),
+            "batches": self.batches,
+            "claimed": self.claimed,
+            "triaged": self.triaged,
+            "retried": self.retried,
+            "dead": self.dead,
+            "llm_calls": self.llm_calls,
+            "avg_llm_s": round(self.llm_seconds / self.llm_calls, 2) if self.llm_calls else None,
+            "triaged_per_min": round(self.triaged * 60 / uptime, 2) if uptime else 0.0,
+        }
+
+
+def claim_batch(db: Session, limit: int) -> list[Claimed]:
+    """Lease up to ``limit`` suggestions; concurrent workers skip each other's rows."""
+    now = datetime.utcnow()
+    stale = now - timedelta(seconds=settings.triage_lease_seconds)
+    rows = db.execute(
+        select(Suggestion.id, Suggestion.sop_id, Suggestion.raw_text, Suggestion.attempts)
+        .where(or_(
+            and_(Suggestion.status == "queued", or_(Suggestion.available_at.is_(None), Suggestion.available_at <= now)),
+            and_(Suggestion.status == "triaging", Suggestion.claimed_at < stale),
+        ))
+        .order_by(Suggestion.id)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    ).all()
+    if not rows:
+        db.rollback()
+        return []
+    db.execute(
+        update(Suggestion)
+        .where(Suggestion.id.in_([r.id for r in rows]))
+        .values(status="triaging", claimed_at=now, attempts=Suggestion.attempts + 1)
+    )
+    db.commit()
+    return [Claimed(r.id, r.sop_id, r.raw_text, r.attempts + 1, now) for r in rows]
+
+
+def renew_lease(db: Session, items: list[Claimed]) -> list[Claimed]:
+    """Move the lease of ``items`` to now; return the ones this worker still holds."""
+    now = datetime.utcnow()
+    held = set(db.execute(
+        update(Suggestion)
+        .where(Suggestion.status == "triaging", tuple_(Suggestion.id, Suggestion.claimed_at).in_([(i.id, i.claimed_at) for i in items]))
+        .values(claimed_at=now)
+        .returning(Suggestion.id)
+    ).scalars())
+    db.commit()
+    for item in items:
+        if item.id in held:
+            item.claimed_at = now
+    return [i for i in items if i.id in held]
+
+
+def group_by_sop(items: list[Claimed], max_group: int) -> list[list[Claimed]]:
+    by_sop: dict[int, list[Claimed]] = defaultdict(list)
+    for item in items:
+        by_sop[item.sop_id].append(item)
+    return [group[i:i + max_group] for group in by_sop.values() for i in range(0, len(group), max_group)]
+
+
+def sop_context(db: Session, sop_id: int) -> str:
+    sop = db.get(Sop, sop_id)
+    if sop is None:
+        return "(SOP no longer exists)"
+    steps = db.execute(
+        select(SopStep.step_no, SopStep.title).where(SopStep.sop_id == sop_id).order_by(SopStep.step_no)
+    ).all()
+    outline = "\n".join(f"{no}. {title}" for no, title in steps) or "(no steps)"
+    return f"Title: {sop.title}\nDepartment: {sop.department}\nSteps:\n{outline}\n\nContent:\n{(sop.content_md or '')[:CONTEXT_CHARS]}"
+
+
+def triage_prompt(context: str, group: list[Claimed]) -> str:
+    items = "\n".join(json.dumps({"id": s.id, "suggestion": s.raw_text}) for s in group)
+    return f"""
+You triage improvement suggestions submitted by people who run this SOP.
+SOP:
+{context}
+
+Suggestions (one JSON object per line):
+{items}
+
+For every suggestion return an object with:
+- "id": the suggestion id
+- "summary": one or two sentences on what should change and why
+- "changeset": {{"action": one of "replace", "insert", "delete", "comment", "step_no": affected step number or null, "before": text to change or null, "after": proposed text or null}}
+Respond with JSON only: {{"items": [...]}}.
+"""
+
+
+def parse_triage(text: str, group: list[Claimed]) -> dict[int, tuple[str, dict]]:
+    data = json.loads(text)
+    results = {}
+    for item in data.get("items", []):
+        try:
+            sid = int(item["id"])
+            summary = str(item["summary"]).strip()
+        except (KeyError, TypeError, ValueError):
+            continue
+        changeset = item.get("changeset") if isinstance(item.get("changeset"), dict) else {}
+        if changeset.get("action") not in ACTIONS:
+            changeset["action"] = "comment"
+        changeset["prompt_version"] = PROMPT_VERSION
+        results[sid] = (summary[:1000], changeset)
+    return {s.id: results[s.id] for s in group if s.id in results}
+
+
+def record_success(db: Session, item: Claimed, summary: str, changeset: dict) -> bool:
+    # Fenced on our lease so a worker whose claim expired cannot overwrite a newer one
+    result = db.execute(
+        update(Suggestion)
+        .where(Suggestion.id == item.id, Suggestion.status == "triaging", Suggestion.claimed_at == item.claimed_at)
+        .values(status="review", ai_summary=summary, ai_changeset_json=changeset, last_error=None, claimed_at=None)
+    )
+    return result.rowcount == 1
+
+
+def record_failure(db: Session, item: Claimed, error: str) -> str:
+    dead = item.attempts >= settings.triage_max_attempts
+    delay = min(settings.triage_retry_max_seconds, settings.triage_retry_base_seconds * 2 ** (item.attempts - 1))
+    result = db.execute(
+        update(Suggestion)
+        .where(Suggestion.id == item.id, Suggestion.status == "triaging", Suggestion.claimed_at == item.claimed_at)
+        .values(
+            status="dead" if dead else "queued",
+            last_error=error[:1000],
+            claimed_at=None,
+            available_at=None if dead else datetime.utcnow() + timedelta(seconds=delay),
+        )
+    )
+    if result.rowcount != 1:
+        return "lost"
+    return "dead" if dead else "retried"
+
+
+class TriageWorker:
+    def __init__(self, llm=llm_client, session_factory=SessionLocal):
+        # ``llm`` only needs ``async generate(prompt, generation_config=...)``; tests pass a stub
+        self.llm = llm
+        self.session_factory = session_factory
+        self.metrics = Metrics()
+        self._stop = asyncio.Event()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _renew(self, group: list[Claimed]) -> list[Claimed]:
+        with self.session_factory() as db:
+            return renew_lease(db, group)
+
+    async def _keep_lease(self, group: list[Claimed], done: asyncio.Event) -> None:
+        interval = settings.triage_lease_seconds / 3
+        while not done.is_set():
+            try:
+                await asyncio.wait_for(done.wait(), timeout=interval)
+            except asyncio.TimeoutError:
+                await asyncio.to_thread(self._renew, group)
+
+    async def _process_group(self, group: list[Claimed], semaphore: asyncio.Semaphore) -> None:
+        def context():
+            with self.session_factory() as db:
+                return sop_context(db, group[0].sop_id)
+
+        try:
+            prompt = triage_prompt(await asyncio.to_thread(context), group)
+            async with semaphore:
+                # The batch lease started at claim time; restart it now that this group's turn has come
+                group = await asyncio.to_thread(self._renew, group)
+                if not group:
+                    return
+                done = asyncio.Event()
+                heartbeat = asyncio.create_task(self._keep_lease(group, done))
+                t0 = time.monotonic()
+                try:
+                    text = await self.llm.generate(prompt, generation_config={"responseMimeType": "application/json"})
+                finally:
+                    self.metrics.llm_calls += 1
+                    self.metrics.llm_seconds += time.monotonic() - t0
+                    # Waits for an in-flight renewal so the fence values below are final
+                    done.set()
+                    await heartbeat
+            results = parse_triage(text, group)
+            error = None
+        except Exception as e:
+            results, error = {}, getattr(e, "detail", None) or str(e) or type(e).__name__
+
+        def write():
+            outcomes = []
+            with self.session_factory() as db:
+                for item in group:
+                    if item.id in results:
+                        outcomes.append("triaged" if record_success(db, item, *results[item.id]) else "lost")
+                    else:
+                        outcomes.append(record_failure(db, item, str(error or "No result returned for suggestion")))
+                db.commit()
+            return outcomes
+
+        for outcome in await asyncio.to_thread(write):
+            if outcome != "lost":
+                setattr(self.metrics, outcome, getattr(self.metrics, outcome) + 1)
+
+    async def run_once(self) -> int:
+        """Claim and process one batch; return the number of suggestions claimed."""
+        def claim():
+            with self.session_factory() as db:
+                return claim_batch(db, settings.triage_batch_size)
+
+        items = await asyncio.to_thread(claim)
+        if not items:
+            return 0
+        self.metrics.batches += 1
+        self.metrics.claimed += len(items)
+        semaphore = asyncio.Semaphore(settings.triage_concurrency)
+        groups = group_by_sop(items, settings.triage_group_size)
+        await asyncio.gather(*(self._process_group(g, semaphore) for g in groups))
+        log.info("batch claimed=%d groups=%d metrics=%s", len(items), len(groups), self.metrics.snapshot())
+        return len(items)
+
+    async def run_forever(self) -> None:
+        while not self._stop.is_set():
+            try:
+                claimed = await self.run_once()
+            except Exception:
+                log.exception("triage batch failed")
+                claimed = 0
+            if not claimed:
+                try:
+                    await asyncio.wait_for(self._stop.wait(), timeout=settings.triage_poll_seconds)
+                except asyncio.TimeoutError:
+                    pass
+
+
+async def _main(once: bool) -> None:
+    worker = TriageWorker()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, worker.stop)
+        except NotImplementedError:
+            # Windows event loops have no signal handlers; Ctrl+C still interrupts
+            pass
+    llm_client.start()
+    try:
+        if once:
+            await worker.run_once()
+        else:
+            await worker.run_forever()
+    finally:
+        await llm_client.shutdown()
+        log.info("stopped metrics=%s", worker.metrics.snapshot())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Triage queued suggestions with the LLM")
+    parser.add_argument("--once", action="store_true", help="process a single batch and exit")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s %(message)s")
+    asyncio.run(_main(args.once))
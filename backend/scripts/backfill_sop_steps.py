@@ -0,0 +1,44 @@
+"""Segment and store steps for SOPs saved before ``sop_steps`` existed.
+
+Safe to re-run and to run against a live database: SOPs that already have steps
+are skipped, and one that gains steps concurrently is left alone.
+
+    python scripts/backfill_sop_steps.py
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import select  # noqa: E402
+from sqlalchemy.exc import IntegrityError  # noqa: E402
+from sqlalchemy.orm import undefer_group  # noqa: E402
+
+from app.db import SessionLocal  # noqa: E402
+from app.models.sop import Sop  # noqa: E402
+from app.models.sop_step import SopStep  # noqa: E402
+from app.segmentation import replace_sop_steps  # noqa: E402
+
+
+def main() -> None:
+    with SessionLocal() as db:
+        ids = db.execute(
+            select(Sop.id).where(~select(SopStep.id).where(SopStep.sop_id == Sop.id).exists()).order_by(Sop.id)
+        ).scalars().all()
+        done = 0
+        for sop_id in ids:
+            sop = db.get(Sop, sop_id, options=[undefer_group("body")], with_for_update=True)
+            if sop is None or db.execute(select(SopStep.id).where(SopStep.sop_id == sop_id).limit(1)).first():
+                db.rollback()
+                continue
+            replace_sop_steps(db, sop)
+            try:
+                db.commit()
+                done += 1
+            except IntegrityError:
+                db.rollback()
+    print(f"backfilled {done} of {len(ids)} SOPs without steps")
+
+
+if __name__ == "__main__":
+    main()
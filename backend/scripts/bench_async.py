@@ -0,0 +1,70 @@
+"""Closed-loop load benchmark for a running API worker.
+
+Each concurrency level runs for a fixed duration with N clients issuing
+requests back to back; throughput and p50/p99 latency are reported per level.
+
+    python scripts/bench_async.py --token <jwt> --paths /sops/by-id/1,/runs/?view=compact
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+
+
+async def _client(c: httpx.AsyncClient, paths: list[str], offset: int, stop: float, latencies: list[float], errors: list[int]):
+    n = offset
+    while time.perf_counter() < stop:
+        path = paths[n % len(paths)]
+        n += 1
+        t = time.perf_counter()
+        try:
+            r = await c.get(path)
+            ok = r.status_code < 400
+        except httpx.HTTPError:
+            ok = False
+        latencies.append(time.perf_counter() - t)
+        if not ok:
+            errors.append(1)
+
+
+async def run(base_url: str, token: str, paths: list[str], levels: list[int], duration: float):
+    limits = httpx.Limits(max_connections=max(levels), max_keepalive_connections=max(levels))
+    headers = {"Authorization": f"Bearer {token}"}
+    async with httpx.AsyncClient(base_url=base_url, headers=headers, limits=limits, timeout=60) as c:
+        for path in paths:
+            (await c.get(path)).raise_for_status()
+        for conc in levels:
+            latencies: list[float] = []
+            errors: list[int] = []
+            start = time.perf_counter()
+            await asyncio.gather(*(_client(c, paths, i, start + duration, latencies, errors) for i in range(conc)))
+            elapsed = time.perf_counter() - start
+            q = statistics.quantiles(latencies, n=100)
+            print(
+                f"concurrency={conc:<5d} rps={len(latencies) / elapsed:8.1f} "
+                f"p50={q[49] * 1000:8.1f}ms p99={q[98] * 1000:8.1f}ms errors={len(errors)}",
+                flush=True,
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--token", required=True, help="Bearer token sent with every request")
+    parser.add_argument("--paths", default="/sops/?limit=20,/runs/?view=compact", help="Comma-separated GET paths, round-robin")
+    parser.add_argument("--levels", default="10,50,100,200", help="Comma-separated concurrency levels")
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds per level")
+    args = parser.parse_args()
+    asyncio.run(run(
+        args.base_url,
+        args.token,
+        args.paths.split(","),
+        [int(x) for x in args.levels.split(",")],
+        args.duration,
+    ))
+
+
+if __name__ == "__main__":
+    main()
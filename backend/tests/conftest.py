@@ -0,0 +1,44 @@
+"""Shared fixtures.
+
+Database tests run against a real Postgres named by ``TEST_DATABASE_URL``; its
+tables are dropped and recreated once per session and truncated after each
+test, so never point it at a database you care about. Without it those tests
+are skipped.
+"""
+import os
+
+import pytest
+
+TEST_DATABASE_URL = os.environ.get("TEST_DATABASE_URL")
+if TEST_DATABASE_URL:
+    os.environ["DATABASE_URL"] = TEST_DATABASE_URL
+# Settings require a URL at import time; engines connect lazily
+os.environ.setdefault("DATABASE_URL", "postgresql+psycopg://localhost/sophub_test")
+
+
+@pytest.fixture(scope="session")
+def engine():
+    if not TEST_DATABASE_URL:
+        pytest.skip("TEST_DATABASE_URL is not set")
+    from app.db import engine
+    from app.models import (  # noqa: F401
+        acl_state, analytics, run, sop, sop_allowed_team, sop_image, sop_step, sop_version, suggestion, team, user, user_team,
+    )
+    from app.models.base import Base
+
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    return engine
+
+
+@pytest.fixture
+def session_factory(engine):
+    from sqlalchemy import text
+
+    from app.db import SessionLocal
+    from app.models.base import Base
+
+    yield SessionLocal
+    tables = ", ".join(t.name for t in Base.metadata.sorted_tables)
+    with engine.begin() as conn:
+        conn.execute(text(f"TRUNCATE {tables} RESTART IDENTITY CASCADE"))
@@ -0,0 +1,54 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+from fastapi import HTTPException
+
+from app.core.settings import settings
+from app.llm import LlmClient, stream_metrics
+from app.routers.ai import _streamed
+
+
+def _chunk(text: str) -> str:
+    return "data: " + json.dumps({"candidates": [{"content": {"parts": [{"text": text}]}}]})
+
+
+def test_stream_reports_a_malformed_event_as_502(monkeypatch):
+    monkeypatch.setattr(settings, "gemini_api_key", "test-key")
+    body = f'{_chunk("Hello")}\n\ndata: {{"candidates": [{{"content"\n\n'
+    client = LlmClient()
+    client._client = httpx.AsyncClient(
+        base_url="https://llm.test",
+        transport=httpx.MockTransport(lambda request: httpx.Response(200, text=body)),
+    )
+
+    async def collect():
+        texts = []
+        with pytest.raises(HTTPException) as exc:
+            async for text in client.stream("prompt"):
+                texts.append(text)
+        await client.shutdown()
+        return texts, exc.value
+
+    texts, error = asyncio.run(collect())
+    assert texts == ["Hello"]
+    assert error.status_code == 502
+
+
+def test_unexpected_errors_end_the_stream_with_an_error_event(monkeypatch):
+    monkeypatch.setattr(settings, "gemini_api_key", "test-key")
+
+    async def chunks():
+        yield "partial"
+        raise RuntimeError("boom")
+
+    async def events():
+        response = await _streamed("draft", 1, {"title": "t"}, True, chunks, "draft_md", lambda text: {"draft_md": text})
+        return [e async for e in response.body_iterator]
+
+    failed = stream_metrics.failed
+    events = asyncio.run(events())
+    assert events[0].startswith("event: delta")
+    assert events[-1] == 'event: error\ndata: {"status": 500, "detail": "Internal Server Error"}\n\n'
+    assert stream_metrics.failed == failed + 1
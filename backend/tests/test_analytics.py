@@ -0,0 +1,80 @@
+from bisect import bisect_right
+from collections import Counter
+from datetime import datetime, timedelta
+
+from sqlalchemy import select
+
+from app.analytics import DURATION_BOUNDS, median_from_histogram, refresh_rollups
+from app.core.security import create_jwt
+
+
+def _sop(db, code: str):
+    from app.models.sop import Sop
+
+    sop = Sop(sop_id=code, title=f"SOP {code}", department="Ops", status="published", version=1)
+    db.add(sop)
+    db.flush()
+    return sop
+
+
+def test_median_from_histogram_interpolates_in_the_median_bucket():
+    assert median_from_histogram({}) is None
+    # Two runs in (15, 30] and two in (30, 60]: the median sits on the 30 s bound
+    assert median_from_histogram({1: 2, 2: 2}) == 30.0
+    # Everything above the last bound reports that bound
+    assert median_from_histogram({len(DURATION_BOUNDS): 3}) == DURATION_BOUNDS[-1]
+
+
+def test_refresh_buckets_durations_in_postgres(session_factory):
+    from app.models.analytics import RunDurationRollup
+    from app.models.run import Run
+    from app.routers.analytics import run_metrics
+    from app.rbac import AuthContext
+
+    durations = [10, 100, 200, 400, 1000, 5000, 200000]
+    started = datetime.utcnow() - timedelta(days=1)
+    with session_factory() as db:
+        sop = _sop(db, "AN-1")
+        db.add_all(
+            Run(sop_id=sop.id, user_id=1, started_at=started, completed_at=started + timedelta(seconds=d), passed=True, updated_at=started)
+            for d in durations
+        )
+        db.add(Run(sop_id=sop.id, user_id=1, started_at=started, updated_at=started))
+        db.commit()
+
+        assert refresh_rollups(db, full=True)["run_keys"] == 1
+        buckets = {r.bucket: r.runs for r in db.execute(select(RunDurationRollup)).scalars()}
+        expected = Counter(bisect_right(DURATION_BOUNDS, d) for d in durations)
+        assert buckets == expected
+
+        (totals,) = run_metrics(db, AuthContext(user_id=1, role="admin", team_ids=frozenset()))
+        assert (totals.started, totals.completed, totals.passed) == (8, 7, 7)
+        assert totals.median_duration_s == median_from_histogram(expected)
+        assert 300 <= totals.median_duration_s <= 450
+
+
+def test_overview_counts_the_suggestions_the_list_shows(session_factory):
+    from fastapi.testclient import TestClient
+
+    from app.main import create_app
+    from app.models.sop_allowed_team import SopAllowedTeam
+    from app.models.suggestion import Suggestion
+    from app.models.team import Team
+
+    with session_factory() as db:
+        unassigned, restricted = _sop(db, "AN-2"), _sop(db, "AN-3")
+        team = Team(name="Other", department="Ops")
+        db.add(team)
+        db.flush()
+        db.add(SopAllowedTeam(sop_id=restricted.id, team_id=team.id))
+        db.add_all(Suggestion(sop_id=s.id, user_id=1, raw_text="fix", status="review") for s in (unassigned, restricted))
+        visible = unassigned.id
+        db.commit()
+
+    # A user in no team sees suggestions for unassigned SOPs only
+    headers = {"Authorization": "Bearer " + create_jwt({"sub": "42", "role": "contributor"})}
+    with TestClient(create_app()) as client:
+        listed = client.get("/suggestions/", headers=headers).json()
+        overview = client.get("/analytics/overview", headers=headers).json()
+    assert [s["sop_id"] for s in listed] == [visible]
+    assert overview["open_suggestions"] == len(listed)
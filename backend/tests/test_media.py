@@ -0,0 +1,39 @@
+import os
+import time
+
+from app.media import GC_GRACE_SECONDS, blob_relpath, sweep_images
+
+
+def _blob(images_dir, sha: str, names: list[str], age: float) -> list[str]:
+    paths = []
+    for name in names:
+        path = os.path.join(images_dir, os.path.dirname(blob_relpath(sha, "png")), name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(b"x")
+        mtime = time.time() - age
+        os.utime(path, (mtime, mtime))
+        paths.append(path)
+    return paths
+
+
+def test_sweep_removes_old_unreferenced_blobs_only(session_factory, tmp_path):
+    from app.models.sop import Sop
+    from app.models.sop_image import SopImage
+
+    used, orphan, recent = "a" * 64, "b" * 64, "c" * 64
+    old = GC_GRACE_SECONDS + 60
+    keep = _blob(tmp_path, used, [f"{used}.png"], old)
+    gone = _blob(tmp_path, orphan, [f"{orphan}.png", f"{orphan}.w480.webp"], old)
+    fresh = _blob(tmp_path, recent, [f"{recent}.png"], 0)
+    with session_factory() as db:
+        sop = Sop(sop_id="IMG-1", title="Images", department="Ops", status="draft", version=1)
+        db.add(sop)
+        db.flush()
+        db.add(SopImage(sop_id=sop.id, sha256=used, ext="png"))
+        db.commit()
+
+        assert sweep_images(db, str(tmp_path)) == 2
+
+    assert all(os.path.exists(p) for p in keep + fresh)
+    assert not any(os.path.exists(p) for p in gone)
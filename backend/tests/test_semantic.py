@@ -0,0 +1,65 @@
+import os
+
+from app.semantic import VectorIndex
+
+
+def _files(directory) -> list[str]:
+    return sorted(f for f in os.listdir(directory) if f.startswith("segment-"))
+
+
+def _sop_ids(hits) -> list[int]:
+    return [m["sop_id"] for m, _ in hits]
+
+
+def test_updates_append_and_tombstone_without_rewriting(tmp_path):
+    index = VectorIndex(str(tmp_path))
+    index.upsert_sop(1, "1. Reinstate a suppressed listing\n2. Check the image", None)
+    index.upsert_sop(2, "1. Refund the customer order", None)
+    vectors = os.path.getsize(tmp_path / "segment-00000001.f32")
+
+    index.upsert_sop(1, "1. Reinstate a suppressed listing after fixing the title", None)
+    index.remove_sop(2)
+
+    # Same generation, one new row appended, old rows masked
+    assert _files(tmp_path) == ["segment-00000001.f32", "segment-00000001.jsonl"]
+    assert os.path.getsize(tmp_path / "segment-00000001.f32") == vectors + 4 * index.embedder.dim
+    assert _sop_ids(index.search("suppression of listings", 5)) == [1]
+    assert index.search("refund", 5, allowed_sop_ids={2}) == []
+
+    # Another process replays the log from scratch
+    reader = VectorIndex(str(tmp_path))
+    hits = reader.search("suppressed listing title", 5)
+    assert [(m["sop_id"], m["section_no"]) for m, _ in hits] == [(1, 1)]
+
+
+def test_writer_recovers_from_a_half_written_change(tmp_path):
+    index = VectorIndex(str(tmp_path))
+    index.upsert_sop(1, "1. Pack the order", None)
+    # A writer died after its vectors and half of its log line
+    with open(tmp_path / "segment-00000001.f32", "ab") as f:
+        f.write(b"\0" * 4 * index.embedder.dim)
+    with open(tmp_path / "segment-00000001.jsonl", "ab") as f:
+        f.write(b'{"drop": [1], "add": [')
+
+    reader = VectorIndex(str(tmp_path))
+    assert _sop_ids(reader.search("pack order", 5)) == [1]
+    index.upsert_sop(2, "1. Ship the parcel", None)
+    assert sorted(_sop_ids(VectorIndex(str(tmp_path)).search("order parcel", 5))) == [1, 2]
+
+
+def test_compaction_drops_dead_rows_and_readers_follow(tmp_path):
+    index = VectorIndex(str(tmp_path))
+    reader = VectorIndex(str(tmp_path))
+    for n in range(3):
+        index.upsert_sop(n, f"1. Label box {n}\n2. Weigh box {n}", None)
+    index.remove_sop(0)
+    assert len(reader.search("label box", 10)) == 4
+
+    index.compact()
+    assert _files(tmp_path)[-2:] == ["segment-00000002.f32", "segment-00000002.jsonl"]
+    assert os.path.getsize(tmp_path / "segment-00000002.f32") == 4 * 4 * index.embedder.dim
+    assert sorted(set(_sop_ids(reader.search("label box", 10)))) == [1, 2]
+
+    # Appends continue on the compacted generation
+    index.upsert_sop(3, "1. Label box 3", None)
+    assert 3 in _sop_ids(reader.search("label box 3", 1))
@@ -0,0 +1,180 @@
+import asyncio
+import json
+import re
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import select, update
+
+from app.core.settings import settings
+from app.workers.triage import Claimed, TriageWorker, claim_batch, group_by_sop, parse_triage, record_failure, record_success
+
+
+class StubLLM:
+    """Answers every prompt with ``respond(ids)`` and records the ids it was asked about."""
+
+    def __init__(self, respond=None, delay=0.0):
+        self.delay = delay
+        self.respond = respond or (lambda ids: {"items": [{"id": i, "summary": f"summary {i}", "changeset": {"action": "replace"}} for i in ids]})
+        self.calls: list[list[int]] = []
+
+    async def generate(self, prompt, generation_config=None):
+        ids = [int(i) for i in re.findall(r'"id": (\d+)', prompt)]
+        self.calls.append(ids)
+        await asyncio.sleep(self.delay)
+        result = self.respond(ids)
+        if isinstance(result, Exception):
+            raise result
+        return json.dumps(result)
+
+
+def _claimed(id, sop_id=1):
+    return Claimed(id=id, sop_id=sop_id, raw_text=f"text {id}", attempts=1, claimed_at=datetime(2026, 1, 1))
+
+
+def _seed(session_factory, per_sop: dict[str, int]) -> dict[str, list[int]]:
+    from app.models.sop import Sop
+    from app.models.suggestion import Suggestion
+
+    ids = {}
+    with session_factory() as db:
+        for code, count in per_sop.items():
+            sop = Sop(sop_id=code, title=f"SOP {code}", department="Ops", content_md="1. Step", status="published", version=1)
+            db.add(sop)
+            db.flush()
+            rows = [Suggestion(sop_id=sop.id, user_id=1, raw_text=f"fix {code} {n}", status="queued") for n in range(count)]
+            db.add_all(rows)
+            db.flush()
+            ids[code] = [r.id for r in rows]
+        db.commit()
+    return ids
+
+
+def _suggestions(session_factory):
+    from app.models.suggestion import Suggestion
+
+    with session_factory() as db:
+        return {s.id: s for s in db.execute(select(Suggestion)).scalars()}
+
+
+def test_parse_triage_keeps_group_items_and_normalizes_actions():
+    group = [_claimed(1), _claimed(2), _claimed(3)]
+    text = json.dumps({"items": [
+        {"id": 1, "summary": "  Tighten step 2  ", "changeset": {"action": "replace", "step_no": 2}},
+        {"id": "2", "summary": "Odd action", "changeset": {"action": "rewrite"}},
+        {"id": 3},
+        {"id": 99, "summary": "Not in this group"},
+    ]})
+    results = parse_triage(text, group)
+    assert set(results) == {1, 2}
+    assert results[1] == ("Tighten step 2", {"action": "replace", "step_no": 2, "prompt_version": 1})
+    assert results[2][1]["action"] == "comment"
+
+
+def test_parse_triage_rejects_non_json():
+    with pytest.raises(json.JSONDecodeError):
+        parse_triage("not json", [_claimed(1)])
+
+
+def test_group_by_sop_splits_large_groups():
+    items = [_claimed(1, 1), _claimed(2, 2), _claimed(3, 1), _claimed(4, 1)]
+    groups = group_by_sop(items, max_group=2)
+    assert [[c.id for c in g] for g in groups] == [[1, 3], [4], [2]]
+
+
+def test_run_once_sends_one_prompt_per_sop(session_factory):
+    ids = _seed(session_factory, {"A": 2, "B": 1})
+    llm = StubLLM()
+    worker = TriageWorker(llm=llm, session_factory=session_factory)
+
+    assert asyncio.run(worker.run_once()) == 3
+
+    assert sorted(sorted(c) for c in llm.calls) == sorted([sorted(ids["A"]), ids["B"]])
+    rows = _suggestions(session_factory)
+    for sid in ids["A"] + ids["B"]:
+        assert rows[sid].status == "review"
+        assert rows[sid].ai_summary == f"summary {sid}"
+        assert rows[sid].ai_changeset_json["action"] == "replace"
+        assert rows[sid].claimed_at is None
+    assert worker.metrics.triaged == 3
+
+
+def test_failures_back_off_then_go_dead(session_factory, monkeypatch):
+    from app.models.suggestion import Suggestion
+
+    monkeypatch.setattr(settings, "triage_max_attempts", 2)
+    monkeypatch.setattr(settings, "triage_retry_base_seconds", 30.0)
+    (sid,) = _seed(session_factory, {"A": 1})["A"]
+    worker = TriageWorker(llm=StubLLM(lambda ids: RuntimeError("model unavailable")), session_factory=session_factory)
+
+    before = datetime.utcnow()
+    asyncio.run(worker.run_once())
+    row = _suggestions(session_factory)[sid]
+    assert (row.status, row.attempts, row.last_error) == ("queued", 1, "model unavailable")
+    assert before + timedelta(seconds=29) < row.available_at < datetime.utcnow() + timedelta(seconds=31)
+
+    # Not claimable until the backoff has elapsed
+    assert asyncio.run(worker.run_once()) == 0
+    with session_factory() as db:
+        db.execute(update(Suggestion).where(Suggestion.id == sid).values(available_at=datetime.utcnow()))
+        db.commit()
+
+    asyncio.run(worker.run_once())
+    row = _suggestions(session_factory)[sid]
+    assert (row.status, row.attempts, row.available_at) == ("dead", 2, None)
+    assert (worker.metrics.retried, worker.metrics.dead) == (1, 1)
+
+
+def test_stale_claim_cannot_write_back(session_factory, monkeypatch):
+    from app.models.suggestion import Suggestion
+
+    (sid,) = _seed(session_factory, {"A": 1})["A"]
+    with session_factory() as db:
+        (first,) = claim_batch(db, 10)
+    # The first worker stalls past its lease and another worker takes over
+    with session_factory() as db:
+        expired = first.claimed_at - timedelta(seconds=settings.triage_lease_seconds + 1)
+        db.execute(update(Suggestion).where(Suggestion.id == sid).values(claimed_at=expired))
+        db.commit()
+        (second,) = claim_batch(db, 10)
+    assert second.attempts == 2
+
+    stale = Claimed(first.id, first.sop_id, first.raw_text, first.attempts, expired)
+    with session_factory() as db:
+        assert record_success(db, stale, "late summary", {"action": "comment"}) is False
+        record_failure(db, stale, "late failure")
+        db.commit()
+    row = _suggestions(session_factory)[sid]
+    assert (row.status, row.ai_summary, row.last_error, row.claimed_at) == ("triaging", None, None, second.claimed_at)
+
+    with session_factory() as db:
+        assert record_success(db, second, "current summary", {"action": "comment"}) is True
+        db.commit()
+    assert _suggestions(session_factory)[sid].status == "review"
+
+
+def test_lease_is_held_while_groups_wait_and_call(session_factory, monkeypatch):
+    monkeypatch.setattr(settings, "triage_lease_seconds", 1.0)
+    monkeypatch.setattr(settings, "triage_concurrency", 1)
+    ids = _seed(session_factory, {"A": 1, "B": 1})
+    llm = StubLLM(delay=1.5)
+    worker = TriageWorker(llm=llm, session_factory=session_factory)
+
+    def steal():
+        with session_factory() as db:
+            return claim_batch(db, 10)
+
+    async def scenario():
+        run = asyncio.create_task(worker.run_once())
+        # One group's call outlasts the lease taken at claim time, the other waited past it
+        await asyncio.sleep(2.0)
+        stolen = await asyncio.to_thread(steal)
+        return stolen, await run
+
+    stolen, claimed = asyncio.run(scenario())
+    assert (stolen, claimed) == ([], 2)
+    assert len(llm.calls) == 2
+    rows = _suggestions(session_factory)
+    for sid in ids["A"] + ids["B"]:
+        assert (rows[sid].status, rows[sid].attempts) == ("review", 1)
+    assert worker.metrics.triaged == 2
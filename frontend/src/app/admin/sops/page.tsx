@@ -4,11 +4,12 @@ import useSWR from "swr";
 import { fetchWithAuth } from "@/lib/auth";
 import { useState } from "react";
 import { fetchWithAuthForm } from "@/lib/auth";
+import { fetchAllPages } from "@/lib/pages";
 
 function fetcher(key: string) { return fetchWithAuth(key).then(r => r.json()); }
 
 export default function AdminSopsAccess() {
-  const { data: sops, mutate: mutateSops } = useSWR("/sops", fetcher);
+  const { data: sops, mutate: mutateSops } = useSWR("/sops?limit=500", fetchAllPages);
   const { data: teams } = useSWR("/teams", fetcher);
   const [selSop, setSelSop] = useState<number | null>(null);
   const [selTeam, setSelTeam] = useState<number | null>(null);
@@ -135,7 +136,13 @@ function ImportForm({ onImported }: { onImported: () => void }) {
       form.append("title", title);
       form.append("department", dept);
       form.append("file", file);
-      await fetchWithAuthForm(`/sops/import_docx`, form);
+      let job = await fetchWithAuthForm(`/sops/import_docx`, form).then(r => r.json());
+      // Conversion runs in the background; poll until the job settles
+      while (job.status === "queued" || job.status === "running") {
+        await new Promise(res => setTimeout(res, 1000));
+        job = await fetchWithAuth(`/imports/${job.id}`).then(r => r.json());
+      }
+      if (job.status !== "succeeded") throw new Error(job.error || "Import failed");
       setFile(null); setSopId(""); setTitle(""); setDept("");
       onImported();
       alert("Imported.");
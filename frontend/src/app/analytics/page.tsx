@@ -5,33 +5,60 @@ import { fetchWithAuth } from "@/lib/auth";
 
 function fetcher(key: string) { return fetchWithAuth(key).then(r=>r.json()); }
 
-export default function AnalyticsPage() {
-  const { data: runs } = useSWR("/runs", fetcher);
-  const { data: suggestions } = useSWR("/suggestions", fetcher);
-  const { data: sops } = useSWR("/sops", fetcher);
+function pct(v: number | null | undefined) { return v == null ? "–" : `${Math.round(v * 100)}%`; }
+function mins(s: number | null | undefined) { return s == null ? "–" : `${Math.round(s / 60)} min`; }
 
-  const totalRuns = (runs || []).length;
-  const completedRuns = (runs || []).filter((r: any) => r.status === "completed").length;
-  const openSuggestions = (suggestions || []).filter((s: any) => s.status !== "merged" && s.status !== "rejected").length;
-  const publishedSops = (sops || []).filter((s: any) => s.status === "published").length;
+export default function AnalyticsPage() {
+  // Aggregated server-side from rollup tables; one small request for the whole dashboard
+  const { data } = useSWR("/analytics/overview", fetcher);
+  const totals = data?.totals || {};
+  const trend: any[] = data?.trend || [];
+  const maxStarted = Math.max(1, ...trend.map((t) => t.started));
 
   return (
     <AuthGuard>
       <div style={{ maxWidth: 1000, margin: "40px auto", padding: 16 }}>
         <h1>Analytics</h1>
-        <p style={{ color: "#666", marginTop: 4 }}>Key activity metrics at a glance.</p>
+        <p style={{ color: "#666", marginTop: 4 }}>Key activity metrics at a glance{data ? ` (${data.date_from} – ${data.date_to})` : ""}.</p>
         <div style={{ display: "grid", gridTemplateColumns: "repeat(auto-fit, minmax(220px, 1fr))", gap: 12, marginTop: 16 }}>
-          <MetricCard title="Total Runs" value={totalRuns} hint="Last 90 days" />
-          <MetricCard title="Completed Runs" value={completedRuns} hint="Quality & throughput" />
-          <MetricCard title="Open Suggestions" value={openSuggestions} hint="Queue health" />
-          <MetricCard title="Published SOPs" value={publishedSops} hint="Adoption" />
+          <MetricCard title="Total Runs" value={totals.started ?? 0} hint="Last 90 days" />
+          <MetricCard title="Completed Runs" value={totals.completed ?? 0} hint={`Completion ${pct(totals.completion_rate)}`} />
+          <MetricCard title="Pass Rate" value={pct(totals.pass_rate)} hint={`${totals.passed ?? 0} passed / ${totals.failed ?? 0} failed`} />
+          <MetricCard title="Median Duration" value={mins(totals.median_duration_s)} hint="Completed runs" />
+          <MetricCard title="Open Suggestions" value={data?.open_suggestions ?? 0} hint={`${totals.suggestions ?? 0} new in period`} />
+          <MetricCard title="Published SOPs" value={data?.published_sops ?? 0} hint="Adoption" />
+        </div>
+
+        <h2 style={{ marginTop: 32 }}>Weekly runs</h2>
+        <div style={{ display: "flex", alignItems: "flex-end", gap: 4, height: 120, marginTop: 8 }}>
+          {trend.map((t) => (
+            <div key={t.period} title={`${t.period}: ${t.started} started, ${t.completed} completed`}
+              style={{ flex: 1, background: "#4f7cff", height: `${(t.started / maxStarted) * 100}%`, minHeight: 2 }} />
+          ))}
         </div>
+
+        <h2 style={{ marginTop: 32 }}>By department</h2>
+        <table style={{ width: "100%", borderCollapse: "collapse", marginTop: 8 }}>
+          <thead>
+            <tr style={{ textAlign: "left", color: "#666", fontSize: 13 }}>
+              <th>Department</th><th>Runs</th><th>Completion</th><th>Pass rate</th><th>Median duration</th><th>Suggestions</th>
+            </tr>
+          </thead>
+          <tbody>
+            {(data?.by_department || []).map((d: any) => (
+              <tr key={d.key} style={{ borderTop: "1px solid #eee" }}>
+                <td>{d.label}</td><td>{d.started}</td><td>{pct(d.completion_rate)}</td><td>{pct(d.pass_rate)}</td>
+                <td>{mins(d.median_duration_s)}</td><td>{d.suggestions}</td>
+              </tr>
+            ))}
+          </tbody>
+        </table>
       </div>
     </AuthGuard>
   );
 }
 
-function MetricCard({ title, value, hint }: { title: string; value: number; hint?: string }) {
+function MetricCard({ title, value, hint }: { title: string; value: number | string; hint?: string }) {
   return (
     <div className="card" style={{ padding: 16 }}>
       <div style={{ color: "#666", fontSize: 13 }}>{title}</div>
@@ -40,5 +67,3 @@ function MetricCard({ title, value, hint }: { title: string; value: number; hint
     </div>
   );
 }
-
-
@@ -23,7 +23,7 @@ export default function LoginPage() {
         throw new Error(j?.detail || `HTTP ${res.status}`);
       }
       const data = await res.json();
-      setToken(data.access_token);
+      setToken(data.access_token, data.refresh_token);
       router.push("/");
     } catch (err: any) {
       setError(err.message || "Login failed");
@@ -2,6 +2,7 @@
 import { useEffect, useState } from "react";
 import useSWR from "swr";
 import { fetchWithAuth } from "@/lib/auth";
+import { fetchAllPages } from "@/lib/pages";
 
 export default function Home() {
   const [hasToken, setHasToken] = useState(false);
@@ -12,7 +13,7 @@ export default function Home() {
     } catch {}
   }, []);
 
-  const { data: sops } = useSWR(hasToken ? "/sops" : null, (key) => fetchWithAuth(key).then((r) => r.json()));
+  const { data: sops } = useSWR(hasToken ? "/sops?limit=500" : null, fetchAllPages);
   const { data: me } = useSWR(hasToken ? "/auth/me" : null, (key) => fetchWithAuth(key).then(r=>r.json()));
   const role = me?.role as string | undefined;
 
@@ -2,8 +2,9 @@
 import { useParams } from "next/navigation";
 import useSWR from "swr";
 import { fetchWithAuth, getApiBaseUrl } from "@/lib/auth";
+import { queueCheckIn, flushCheckIns } from "@/lib/checkins";
 // remove invalid import; local helpers defined below
-import { useEffect, useMemo, useState } from "react";
+import { useEffect, useState } from "react";
 import SuggestModal from "@/components/SuggestModal";
 import Confetti from "@/components/Confetti";
 
@@ -13,22 +14,28 @@ export default function RunDetailPage() {
   const params = useParams<{ runId: string }>();
   const runId = params.runId;
   const { data: run, error, mutate } = useSWR(`/runs/${runId}`, fetcher);
-  const { data: sop } = useSWR(run ? `/sops/by-id/${run.sop_id}` : null, fetcher);
-  type Step = { text: string; html?: string };
-  const steps: Step[] = useMemo(() => {
-    if (!sop) return [] as Step[];
-    if (sop.content_json?.html) {
-      const html = sop.content_json.html as string;
-      const parsed = parseHtmlSegments(html);
-      if (parsed.length) return parsed;
-      return [{ text: stripHtml(html), html }];
-    }
-    return parseStepsFromText(sop.content_md || "").map(t => ({ text: t }));
-  }, [sop]);
+  // Steps are segmented server-side; fetch the outline, then only the step on screen.
+  // Runs are pinned to the SOP version they started on, whose content never changes.
+  const base = run ? (run.sop_version ? `/sops/by-id/${run.sop_id}/versions/${run.sop_version}` : `/sops/by-id/${run.sop_id}`) : null;
+  const { data: sop } = useSWR(base ? `${base}/steps` : null, fetcher);
+  type StepSummary = { step_no: number; title: string };
+  const steps: StepSummary[] = sop?.steps || [];
   const [index, setIndex] = useState(0);
   const [celebrate, setCelebrate] = useState(false);
+  const { data: step } = useSWR(base && steps.length ? `${base}/steps/${index + 1}` : null, fetcher);
 
-  useEffect(() => { setIndex(0); }, [run?.id]);
+  // Resume after the last checked step once the outline is known
+  useEffect(() => {
+    if (run && steps.length) setIndex(Math.min(run.last_step || 0, steps.length - 1));
+  }, [run?.id, steps.length]);
+  // Deliver check-ins left over from an earlier visit, and again when back online
+  useEffect(() => {
+    if (!run?.id) return;
+    flushCheckIns(run.id);
+    const onOnline = () => flushCheckIns(run.id);
+    window.addEventListener("online", onOnline);
+    return () => window.removeEventListener("online", onOnline);
+  }, [run?.id]);
 
   if (error) return <p style={{ color: "red" }}>{String(error)}</p>;
   if (!run || !sop) return <p>Loading…</p>;
@@ -36,14 +43,18 @@ export default function RunDetailPage() {
   const total = Math.max(steps.length, 1);
   const percent = Math.round(((index) / total) * 100);
 
-  async function next() {
-    const stepNo = index + 1;
-    try { await fetchWithAuth(`/runs/${run.id}/check?step_no=${stepNo}`, { method: "PATCH" }); } catch {}
+  function next() {
+    queueCheckIn(run.id, index + 1);
+    flushCheckIns(run.id);
     if (index < total - 1) setIndex(index + 1);
   }
   function prev() { if (index > 0) setIndex(index - 1); }
   async function complete(passed: boolean) {
-    await fetchWithAuth(`/runs/${run.id}/complete?passed=${passed}`, { method: "POST" });
+    const delivered = await flushCheckIns(run.id);
+    if (!delivered && !confirm("Some step check-ins could not be saved. Complete the run anyway?")) return;
+    try {
+      await fetchWithAuth(`/runs/${run.id}/complete?passed=${passed}`, { method: "POST" });
+    } catch (e) { alert(String(e)); return; }
     setCelebrate(true);
     setTimeout(()=>setCelebrate(false), 1700);
   }
@@ -94,7 +105,7 @@ export default function RunDetailPage() {
                   }}
                 >
                   <span style={{ fontWeight: 600, marginRight: 6 }}>{i + 1}.</span>
-                  <span style={{ opacity: 0.9 }}>{(s.text||"").slice(0, 80)}{(s.text||"").length>80?"…":""}</span>
+                  <span style={{ opacity: 0.9 }}>{(s.title||"").slice(0, 80)}{(s.title||"").length>80?"…":""}</span>
                 </button>
               </li>
             ))}
@@ -105,13 +116,13 @@ export default function RunDetailPage() {
           <div style={{ width: "min(840px, 100%)", textAlign: "center" }}>
             <div style={{ fontSize: 14, color: "#666", marginBottom: 8 }}>Step {index + 1} of {total}</div>
             <div style={{ fontSize: 16, lineHeight: 1.6, textAlign: "left", whiteSpace: "pre-wrap" }}>
-              {steps[index]?.html ? (
+              {step?.html ? (
                 <>
                   <DocxStylesLocal />
-                  <HtmlWithMediaLocal html={steps[index]!.html!} />
+                  <HtmlWithMediaLocal html={step.html} />
                 </>
               ) : (
-                steps[index]?.text || sop.title
+                step?.text || sop.title
               )}
             </div>
           </div>
@@ -142,121 +153,11 @@ export default function RunDetailPage() {
   );
 }
 
-function parseStepsFromText(md: string): string[] {
-  const text = (md || "").replace(/\r\n?/g, "\n");
-  const lines = text.split(/\n/).map(l => l.replace(/\s+/g, ' ').trim());
-  const headingRegex = /^(Phase\s*\d+\b.*|\d+\.\d+\s+.+|\d+\.\s+.+|Step\s*\d+\b.*)$/i;
-  const headings: number[] = [];
-  for (let i = 0; i < lines.length; i++) {
-    if (headingRegex.test(lines[i].trim())) headings.push(i);
-  }
-  if (headings.length >= 1) {
-    const segments: string[] = [];
-    for (let j = 0; j < headings.length; j++) {
-      const start = headings[j];
-      const end = j + 1 < headings.length ? headings[j + 1] : lines.length;
-      const chunk = lines.slice(start, end).join("\n").trim();
-      if (chunk) segments.push(chunk);
-    }
-    if (segments.length >= 2) return segments;
-  }
-  // fallback to simple numeric lines
-  const simple = text.split(/\n+/).filter(l => /^\s*\d+[\).\-]\s+/.test(l)).map(l => l.replace(/^\s*\d+[\).\-]\s+/, "").trim());
-  if (simple.length >= 2) return simple;
-  return [text.trim()].filter(Boolean);
-}
-
-function parseStepsFromHtml(html: string): string[] {
-  if (!html) return [];
-  const container = document.createElement("div");
-  container.innerHTML = html;
-  const result: string[] = [];
-  // Prefer ordered list items as steps
-  const ols = Array.from(container.querySelectorAll("ol"));
-  for (const ol of ols) {
-    const items = Array.from(ol.querySelectorAll(":scope > li"));
-    if (items.length >= 2) {
-      for (const li of items) {
-        const text = (li.textContent || "").replace(/\s+/g, " ").trim();
-        if (text) result.push(text);
-      }
-      if (result.length) return result;
-    }
-  }
-  // Build paragraph lines to detect real headings at line starts
-  const blocks = Array.from(container.querySelectorAll("h1,h2,h3,h4,h5,h6,p,div,li")) as HTMLElement[];
-  const lines = blocks.map(el => (el.textContent || "").replace(/\s+/g, ' ').trim()).filter(Boolean);
-  const dottedIdx: number[] = [];
-  lines.forEach((l, i) => { if (/^\d+\.\d+\s+/.test(l)) dottedIdx.push(i); });
-  if (dottedIdx.length >= 2) {
-    const segments: string[] = [];
-    for (let j = 0; j < dottedIdx.length; j++) {
-      const start = dottedIdx[j];
-      const end = j + 1 < dottedIdx.length ? dottedIdx[j + 1] : lines.length;
-      segments.push(lines.slice(start, end).join(" "));
-    }
-    return segments.map(s => s.replace(/\s+/g, " ").trim());
-  }
-  // Heuristic 2: Phase headings
-  const phaseIdx: number[] = [];
-  lines.forEach((l, i) => { if (/^Phase\s*\d+/i.test(l)) phaseIdx.push(i); });
-  if (phaseIdx.length >= 2) {
-    const segments: string[] = [];
-    for (let j = 0; j < phaseIdx.length; j++) {
-      const start = phaseIdx[j];
-      const end = j + 1 < phaseIdx.length ? phaseIdx[j + 1] : lines.length;
-      segments.push(lines.slice(start, end).join(" "));
-    }
-    return segments.map(s => s.replace(/\s+/g, " ").trim());
-  }
-  // Fallback: any element whose text starts with a number and a dot or paren
-  const numbered = lines.filter(l => /^\s*\d+[\).\-]\s+/.test(l)).map(l => l.replace(/^\s*\d+[\).\-]\s+/, "").trim());
-  if (numbered.length) return numbered;
-  // Final fallback: large paragraphs as single step
-  const para = (container.textContent || "").trim();
-  return para ? [para] : [];
-}
-
-function stripHtml(html: string): string {
-  const el = document.createElement("div");
-  el.innerHTML = html;
-  return (el.textContent || "").replace(/\s+/g, " ").trim();
-}
-
-function parseHtmlSegments(html: string): { text: string; html: string }[] {
-  // Split the HTML by headings (Phase, 1.1 etc.) and keep the inner HTML for rendering
-  const container = document.createElement("div");
-  container.innerHTML = html;
-  const blocks = Array.from(container.querySelectorAll("h1,h2,h3,h4,h5,h6,p,div,table,ul,ol,section"));
-  const isHeading = (t: string) => /^Phase\s*\d+/i.test(t) || /^\d+\.\d+\s+/.test(t) || /^\d+\.\s+/.test(t) || /^General\s+Rules/i.test(t) || /^Step\s*\d+/i.test(t);
-  const indices: number[] = [];
-  const texts = blocks.map(b => (b.textContent || "").replace(/\s+/g, " ").trim());
-  blocks.forEach((b, i) => { if (isHeading(texts[i])) indices.push(i); });
-  if (indices.length < 1) return [];
-  const segments: { text: string; html: string }[] = [];
-  for (let j = 0; j < indices.length; j++) {
-    const start = indices[j];
-    const end = j + 1 < indices.length ? indices[j + 1] : blocks.length;
-    const frag = document.createElement("div");
-    for (let k = start; k < end; k++) {
-      const node = blocks[k].cloneNode(true) as HTMLElement;
-      if (node.tagName && node.tagName.toLowerCase() === 'table') {
-        // ensure the whole table including header/body is copied
-        frag.appendChild(node);
-      } else {
-        frag.appendChild(node);
-      }
-    }
-    const segHtml = frag.innerHTML;
-    const segText = texts.slice(start, end).join(" \n");
-    segments.push({ text: segText, html: segHtml });
-  }
-  return segments;
-}
-
 function HtmlWithMediaLocal({ html }: { html: string }) {
   const base = getApiBaseUrl();
-  const rewritten = html.replace(/src=("|')\s*(\/media\/[^"'>\s]+)("|')/g, (m, q1, path, q3) => `src=${q1}${base}${path}${q3}`);
+  const rewritten = html
+    .replace(/src=("|')\s*(\/media\/[^"'>\s]+)("|')/g, (m, q1, path, q3) => `src=${q1}${base}${path}${q3}`)
+    .replace(/srcset=("|')([^"']*)("|')/g, (m, q1, set, q3) => `srcset=${q1}${set.replace(/(^|,\s*)(\/media\/)/g, `$1${base}$2`)}${q3}`);
   // Heuristic: remove textual reprints immediately following a table
   const container = document.createElement("div");
   container.innerHTML = rewritten;
@@ -2,7 +2,8 @@
 import { useParams, useRouter } from "next/navigation";
 import useSWR from "swr";
 import { fetchWithAuth, getApiBaseUrl } from "@/lib/auth";
-import { useEffect, useState } from "react";
+import { streamAi } from "@/lib/ai";
+import { useEffect, useRef, useState } from "react";
 import SuggestModal from "@/components/SuggestModal";
 import Confetti from "@/components/Confetti";
 
@@ -240,17 +241,21 @@ function AiDraftModal({ onClose, onApply, defaultTitle, defaultDept }: { onClose
   const [outline, setOutline] = useState("");
   const [busy, setBusy] = useState(false);
   const [error, setError] = useState<string | null>(null);
+  const [preview, setPreview] = useState("");
+  const abortRef = useRef<AbortController | null>(null);
+  // Closing the modal mid-generation aborts the stream
+  useEffect(() => () => abortRef.current?.abort(), []);
   async function generate() {
-    setBusy(true); setError(null);
+    setBusy(true); setError(null); setPreview("");
+    const controller = new AbortController();
+    abortRef.current = controller;
     try {
-      const res = await fetch(`${getApiBaseUrl()}/ai/draft`, { method: "POST", headers: { "Content-Type": "application/json" }, body: JSON.stringify({ title, department: dept, outline }) });
-      const data = await res.json();
-      if (!res.ok) throw new Error(JSON.stringify(data));
+      const text = await streamAi("/ai/draft/stream", { title, department: dept, outline }, setPreview, controller.signal);
       // Convert markdown-ish text to simple HTML (minimal)
-      const html = data.draft_md.replace(/\n\n/g, "<br/><br/>").replace(/\n/g, "<br/>");
+      const html = text.replace(/\n\n/g, "<br/><br/>").replace(/\n/g, "<br/>");
       onApply(html);
     } catch (e: any) {
-      setError(String(e));
+      if (e?.name !== "AbortError") setError(String(e));
     } finally { setBusy(false); }
   }
   return (
@@ -265,6 +270,7 @@ function AiDraftModal({ onClose, onApply, defaultTitle, defaultDept }: { onClose
           <input value={dept} onChange={(e)=>setDept(e.target.value)} placeholder="Department" style={{ padding: 10, border: "1px solid #ddd", borderRadius: 10 }} />
           <textarea value={outline} onChange={(e)=>setOutline(e.target.value)} placeholder="Optional outline: bullet points or notes" style={{ width: "100%", minHeight: 140, border: "1px solid #e5e7eb", borderRadius: 12, padding: 10 }} />
         </div>
+        {preview && <pre style={{ whiteSpace: "pre-wrap", maxHeight: 240, overflow: "auto", marginTop: 8, padding: 10, background: "#f9fafb", borderRadius: 12, fontSize: 13 }}>{preview}</pre>}
         {error && <p style={{ color: "#b00020", marginTop: 8 }}>{error}</p>}
         <div style={{ display: "flex", gap: 8, justifyContent: "flex-end", marginTop: 10 }}>
           <button className="btn-primary" disabled={busy} onClick={generate}>{busy?"Generating…":"Generate"}</button>
@@ -276,24 +282,25 @@ function AiDraftModal({ onClose, onApply, defaultTitle, defaultDept }: { onClose
 
 function AiCleanButton({ html, md, onApply }: { html?: string; md?: string; onApply: (html: string) => void }) {
   const [busy, setBusy] = useState(false);
+  const [progress, setProgress] = useState(0);
   async function clean() {
-    setBusy(true);
+    setBusy(true); setProgress(0);
     try {
-      const res = await fetch(`${getApiBaseUrl()}/ai/clean`, { method: "POST", headers: { "Content-Type": "application/json" }, body: JSON.stringify({ text_html: html||null, text_md: md||null }) });
-      const data = await res.json();
-      if (!res.ok) throw new Error(JSON.stringify(data));
-      const converted = data.clean_md.replace(/\n\n/g, "<br/><br/>").replace(/\n/g, "<br/>");
+      const text = await streamAi("/ai/clean/stream", { text_html: html||null, text_md: md||null }, (t) => setProgress(t.length));
+      const converted = text.replace(/\n\n/g, "<br/><br/>").replace(/\n/g, "<br/>");
       onApply(converted);
     } catch (e) { alert(String(e)); } finally { setBusy(false); }
   }
-  return <button className="btn-secondary" onClick={clean} disabled={busy}>{busy?"Cleaning…":"AI Clean"}</button>;
+  return <button className="btn-secondary" onClick={clean} disabled={busy}>{busy?(progress?`Cleaning… ${progress} chars`:"Cleaning…"):"AI Clean"}</button>;
 }
 
 
 function HtmlWithMedia({ html }: { html: string }) {
   // Prefix relative /media URLs with API base, so Next serves from backend host
   const base = getApiBaseUrl();
-  const rewritten = html.replace(/src=("|')\s*(\/media\/[^"'>\s]+)("|')/g, (m, q1, path, q3) => `src=${q1}${base}${path}${q3}`);
+  const rewritten = html
+    .replace(/src=("|')\s*(\/media\/[^"'>\s]+)("|')/g, (m, q1, path, q3) => `src=${q1}${base}${path}${q3}`)
+    .replace(/srcset=("|')([^"']*)("|')/g, (m, q1, set, q3) => `srcset=${q1}${set.replace(/(^|,\s*)(\/media\/)/g, `$1${base}$2`)}${q3}`);
   return (
     <div className="docx-html" dangerouslySetInnerHTML={{ __html: rewritten }}>
     </div>
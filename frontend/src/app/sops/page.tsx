@@ -2,15 +2,11 @@
 import useSWR from "swr";
 import Link from "next/link";
 import { fetchWithAuth } from "@/lib/auth";
+import { fetchAllPages } from "@/lib/pages";
 import { useEffect, useState } from "react";
 
-async function fetcher() {
-  const res = await fetchWithAuth("/sops");
-  return res.json();
-}
-
 export default function SopListPage() {
-  const { data, error, isLoading, mutate } = useSWR("/sops", fetcher);
+  const { data, error, isLoading, mutate } = useSWR("/sops?limit=500", fetchAllPages);
   if (isLoading) return <Section title="My SOPs" subtitle="SOPs you can access based on your teams" body={<p>Loading…</p>} />;
   if (error) return <Section title="My SOPs" subtitle="SOPs you can access based on your teams" body={<p style={{ color: "red" }}>{String(error)}</p>} />;
   return (
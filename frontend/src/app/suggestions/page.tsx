@@ -2,12 +2,11 @@
 import AuthGuard from "@/components/AuthGuard";
 import useSWR from "swr";
 import { fetchWithAuth } from "@/lib/auth";
+import { fetchAllPages } from "@/lib/pages";
 import { useEffect, useState } from "react";
 
-function fetcher(key: string) { return fetchWithAuth(key).then(r => r.json()); }
-
 export default function SuggestionsPage() {
-  const { data, mutate } = useSWR("/suggestions", fetcher);
+  const { data, mutate } = useSWR("/suggestions?limit=500", fetchAllPages);
   const [filter, setFilter] = useState<string>("");
   const filtered = (data || []).filter((s: any) => !filter || s.status === filter);
   async function setStatus(id: number, status: string) {
@@ -23,9 +22,11 @@ export default function SuggestionsPage() {
           <select onChange={(e)=>setFilter(e.target.value)} style={{ padding: 8, borderRadius: 10, border: "1px solid #ddd" }}>
             <option value="">All</option>
             <option value="queued">queued</option>
+            <option value="triaging">triaging</option>
             <option value="review">review</option>
             <option value="merged">merged</option>
             <option value="rejected">rejected</option>
+            <option value="dead">dead</option>
           </select>
         </div>
         <div className="card" style={{ padding: 16, marginTop: 12 }}>
@@ -0,0 +1,40 @@
+import { getApiBaseUrl } from "./auth";
+
+// Reads the SSE stream of /ai/*/stream, calling onDelta with the text so far.
+// Aborting `signal` closes the request, which also stops the upstream generation.
+export async function streamAi(path: string, body: unknown, onDelta: (text: string) => void, signal?: AbortSignal): Promise<string> {
+  const res = await fetch(`${getApiBaseUrl()}${path}`, {
+    method: "POST",
+    headers: { "Content-Type": "application/json" },
+    body: JSON.stringify(body),
+    signal,
+  });
+  if (!res.ok || !res.body) {
+    let detail: unknown = undefined;
+    try { detail = await res.json(); } catch {}
+    throw new Error(`HTTP ${res.status}: ${JSON.stringify(detail)}`);
+  }
+  const reader = res.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = "";
+  let text = "";
+  for (;;) {
+    const { value, done } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+    let sep: number;
+    while ((sep = buffer.indexOf("\n\n")) >= 0) {
+      const frame = buffer.slice(0, sep);
+      buffer = buffer.slice(sep + 2);
+      const event = /^event: (.*)$/m.exec(frame)?.[1];
+      const data = JSON.parse(/^data: (.*)$/m.exec(frame)?.[1] || "null");
+      if (event === "delta") {
+        text += data.text;
+        onDelta(text);
+      } else if (event === "error") {
+        throw new Error(`HTTP ${data.status}: ${JSON.stringify(data.detail)}`);
+      }
+    }
+  }
+  return text;
+}
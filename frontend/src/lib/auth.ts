@@ -4,10 +4,12 @@ export function getApiBaseUrl(): string {
 }
 
 const TOKEN_KEY = "sophub_token";
+const REFRESH_KEY = "sophub_refresh_token";
 
-export function setToken(token: string) {
+export function setToken(token: string, refreshToken?: string) {
   if (typeof window !== "undefined") {
     localStorage.setItem(TOKEN_KEY, token);
+    if (refreshToken) localStorage.setItem(REFRESH_KEY, refreshToken);
   }
 }
 
@@ -19,23 +21,58 @@ export function getToken(): string | null {
 export function clearToken() {
   if (typeof window !== "undefined") {
     localStorage.removeItem(TOKEN_KEY);
+    localStorage.removeItem(REFRESH_KEY);
   }
 }
 
+// Access tokens are short-lived; concurrent 401s share one refresh request
+let refreshing: Promise<string | null> | null = null;
+
+function refreshAccessToken(): Promise<string | null> {
+  if (!refreshing) {
+    refreshing = (async () => {
+      const refreshToken = typeof window === "undefined" ? null : localStorage.getItem(REFRESH_KEY);
+      if (!refreshToken) return null;
+      const res = await fetch(`${getApiBaseUrl()}/auth/refresh`, {
+        method: "POST",
+        headers: { "Content-Type": "application/json" },
+        body: JSON.stringify({ refresh_token: refreshToken }),
+        cache: "no-store",
+      });
+      if (!res.ok) {
+        clearToken();
+        return null;
+      }
+      const data = await res.json();
+      setToken(data.access_token, data.refresh_token);
+      return data.access_token as string;
+    })().finally(() => { refreshing = null; });
+  }
+  return refreshing;
+}
+
+// Sends the request with the current access token, refreshing it once on a 401
+async function sendWithAuth(path: string, init: RequestInit, headers: Record<string, string>) {
+  const send = (token: string | null) => fetch(`${getApiBaseUrl()}${path}`, {
+    ...init,
+    headers: token ? { ...headers, Authorization: `Bearer ${token}` } : headers,
+  });
+  const res = await send(getToken());
+  if (res.status !== 401) return res;
+  const token = await refreshAccessToken();
+  return token ? send(token) : res;
+}
+
 export async function fetchWithAuth(path: string, options: RequestInit = {}) {
-  const token = getToken();
-  const headers: HeadersInit = {
+  const headers: Record<string, string> = {
     "Content-Type": "application/json",
-    ...(options.headers || {}),
+    ...((options.headers as Record<string, string>) || {}),
   };
-  if (token) {
-    (headers as Record<string, string>)["Authorization"] = `Bearer ${token}`;
-  }
-  const res = await fetch(`${getApiBaseUrl()}${path}`, {
+  const res = await sendWithAuth(path, {
     ...options,
-    headers,
-    cache: "no-store",
-  });
+    // Revalidate with If-None-Match so unchanged SOPs come back as 304s
+    cache: "no-cache",
+  }, headers);
   if (!res.ok) {
     let detail: unknown = undefined;
     try {
@@ -48,19 +85,14 @@ export async function fetchWithAuth(path: string, options: RequestInit = {}) {
 
 // For multipart/form-data or other non-JSON payloads (we won't set Content-Type)
 export async function fetchWithAuthForm(path: string, form: FormData, options: RequestInit = {}) {
-  const token = getToken();
-  const headers: HeadersInit = {
-    ...(options.headers || {}),
+  const headers: Record<string, string> = {
+    ...((options.headers as Record<string, string>) || {}),
   };
-  if (token) {
-    (headers as Record<string, string>)["Authorization"] = `Bearer ${token}`;
-  }
-  const res = await fetch(`${getApiBaseUrl()}${path}`, {
+  const res = await sendWithAuth(path, {
     method: options.method || "POST",
     body: form,
-    headers,
     cache: "no-store",
-  });
+  }, headers);
   if (!res.ok) {
     let detail: unknown = undefined;
     try { detail = await res.json(); } catch {}
@@ -0,0 +1,51 @@
+import { fetchWithAuth } from "./auth";
+
+// Step check-ins are queued in localStorage and sent in batches, so "Next" never
+// waits on the network and check-ins made offline are delivered later.
+type CheckIn = { step_no: number; checked_at: string };
+
+function key(runId: number | string) { return `sophub_checkins_${runId}`; }
+
+function load(runId: number | string): CheckIn[] {
+  if (typeof window === "undefined") return [];
+  try { return JSON.parse(localStorage.getItem(key(runId)) || "[]"); } catch { return []; }
+}
+
+function save(runId: number | string, items: CheckIn[]) {
+  if (items.length) localStorage.setItem(key(runId), JSON.stringify(items));
+  else localStorage.removeItem(key(runId));
+}
+
+export function queueCheckIn(runId: number | string, stepNo: number) {
+  save(runId, [...load(runId), { step_no: stepNo, checked_at: new Date().toISOString() }]);
+}
+
+const inflight = new Map<string, Promise<boolean>>();
+
+// 4xx other than auth, timeout and rate limiting means the server will never
+// accept these items (e.g. the run was finished or deleted), so retrying is pointless
+function retryable(err: unknown): boolean {
+  const status = Number(/^HTTP (\d+)/.exec(String((err as Error)?.message))?.[1]);
+  return !(status >= 400 && status < 500) || [401, 408, 429].includes(status);
+}
+
+// Sends everything queued for the run and resolves to whether it was all delivered.
+// Items stay queued if the request may succeed later and are dropped if it never will.
+export function flushCheckIns(runId: number | string): Promise<boolean> {
+  const id = String(runId);
+  const running = inflight.get(id);
+  if (running) return running.then(() => flushCheckIns(runId));
+  const items = load(runId);
+  if (!items.length) return Promise.resolve(true);
+  // Keep anything queued while the request was in flight
+  const drop = () => save(runId, load(runId).slice(items.length));
+  const p = fetchWithAuth(`/runs/${id}/steps:batch`, { method: "POST", body: JSON.stringify({ steps: items }) })
+    .then(() => { drop(); return true; })
+    .catch((err) => {
+      if (!retryable(err)) drop();
+      return false;
+    })
+    .finally(() => { inflight.delete(id); });
+  inflight.set(id, p);
+  return p;
+}
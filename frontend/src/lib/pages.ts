@@ -0,0 +1,14 @@
+import { fetchWithAuth } from "@/lib/auth";
+
+// List endpoints page with keyset cursors; follow X-Next-Cursor until the last page
+export async function fetchAllPages<T = any>(path: string): Promise<T[]> {
+  const items: T[] = [];
+  const sep = path.includes("?") ? "&" : "?";
+  let cursor: string | null = null;
+  do {
+    const res = await fetchWithAuth(cursor ? `${path}${sep}cursor=${encodeURIComponent(cursor)}` : path);
+    items.push(...(await res.json()));
+    cursor = res.headers.get("X-Next-Cursor");
+  } while (cursor);
+  return items;
+}